@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+arduino_sim.py
+Simulated MeArm Arduino on a pseudo-terminal, for testing the arm code without hardware.
+
+The simulator opens a pty and speaks the firmware's line protocol:
+    HOME\\n               -> servos go to the home pose
+    M,b,s1,s2,claw\\n     -> servos go to the given angles (0..180)
+Each command gets an "OK" reply ("ERR" for lines it can't parse). Servos
+slew at a per-servo speed (deg/s) plus a settle time. --reply controls when
+the reply is sent:
+    receive   as soon as the line is parsed; servo.write() doesn't block (default)
+    done      once every servo has reached its target (blocking firmware)
+    silent    never; exercises the scheduler timeouts
+Every command is logged as one JSON line with timestamps, start/target angles
+and the modelled move time. servo_timing.py can be fitted from these logs.
+
+Point the arm code at the printed port (or the --link symlink):
+    python arduino_sim.py --link /tmp/ttyARM --log sim.jsonl
+    ARM_SERIAL_PORT=/tmp/ttyARM python pencil/pencil_detection.py --source synthetic
+
+Benchmark pick throughput and serial latency through ArmScheduler (with the
+servo_timing.py model, or each step's fixed timeout with --no-timing):
+    python arduino_sim.py --bench 20 --reply done
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import tty
+
+from servo_timing import HOME_ANGLES, ServoTimingModel
+
+SPEEDS = (180.0, 120.0, 120.0, 300.0)   # deg/s under load, MG90S-class servos
+SETTLE = 0.08                           # s after the slowest servo arrives
+REPLY_DELAY = 0.002                     # s to parse a line and print the reply
+
+
+class ArduinoSim:
+    def __init__(self, reply="receive", speeds=SPEEDS, settle=SETTLE, reply_delay=REPLY_DELAY,
+                 home=HOME_ANGLES, log=None, link=None):
+        if reply not in ("receive", "done", "silent"):
+            raise ValueError(f"reply must be receive, done or silent, got {reply!r}")
+        self.reply = reply
+        self.speeds = tuple(speeds)
+        self.settle = settle
+        self.reply_delay = reply_delay
+        self.home = tuple(home)
+        self.link = link
+        self._log = log  # file object or None
+        self._log_lock = threading.Lock()
+
+        self.master, self._slave = os.openpty()
+        tty.setraw(self._slave)  # no echo / line editing, like a USB CDC port
+        self.port = os.ttyname(self._slave)
+        if link:
+            if os.path.lexists(link):
+                os.remove(link)
+            os.symlink(self.port, link)
+
+        # per-servo motion: (start angle, target angle, start time)
+        now = time.perf_counter()
+        self._motion = [(a, a, now) for a in self.home]
+        self._running = False
+        self._thread = None
+        self.commands = 0
+
+    # ---- servo model ----
+    def angles(self, t=None):
+        t = time.perf_counter() if t is None else t
+        out = []
+        for (a0, a1, t0), speed in zip(self._motion, self.speeds):
+            travel = min(abs(a1 - a0), speed * max(t - t0, 0.0))
+            out.append(a0 + travel if a1 >= a0 else a0 - travel)
+        return out
+
+    def move_time(self, start, target):
+        """Seconds until every servo has reached target and settled."""
+        slowest = max(abs(b - a) / s for a, b, s in zip(start, target, self.speeds))
+        return slowest + self.settle if slowest > 0 else 0.0
+
+    def _command(self, line):
+        if line == "HOME":
+            return self.home
+        parts = line.split(",")
+        if len(parts) != 5 or parts[0] != "M":
+            return None
+        try:
+            return tuple(max(0, min(180, int(v))) for v in parts[1:])
+        except ValueError:
+            return None
+
+    # ---- serial side ----
+    def _handle(self, raw):
+        t_rx = time.perf_counter()
+        line = raw.decode("utf-8", "replace").strip()
+        if not line:
+            return
+        self.commands += 1
+        target = self._command(line)
+        start = [round(a, 1) for a in self.angles(t_rx)]
+        entry = {"t": round(time.time(), 4), "cmd": line, "start": start}
+        if target is None:
+            reply, t_done = "ERR", t_rx
+        else:
+            self._motion = [(a, b, t_rx) for a, b in zip(start, target)]
+            t_done = t_rx + self.move_time(start, target)
+            reply = "OK"
+            entry.update(target=list(target), move_s=round(t_done - t_rx, 4))
+
+        if self.reply != "silent":
+            t_reply = t_rx + self.reply_delay
+            if self.reply == "done":
+                t_reply = max(t_reply, t_done)
+            delay = t_reply - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)  # blocking, like the firmware loop
+            os.write(self.master, (reply + "\r\n").encode())
+            entry["reply_s"] = round(time.perf_counter() - t_rx, 4)
+        self._write_log(entry)
+
+    def _write_log(self, entry):
+        if self._log is None:
+            return
+        with self._log_lock:
+            self._log.write(json.dumps(entry) + "\n")
+            self._log.flush()
+
+    def _run(self):
+        buf = b""
+        while self._running:
+            try:
+                chunk = os.read(self.master, 1024)
+            except OSError:
+                break  # closed in stop()
+            buf += chunk
+            while b"\n" in buf:
+                line, buf = buf.split(b"\n", 1)
+                self._handle(line)
+
+    def start(self):
+        if not self._running:
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name="arduino-sim", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        for fd in (self.master, self._slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        if self.link and os.path.islink(self.link):
+            os.remove(self.link)
+
+
+def bench(sim, picks, timing=None):
+    """Run pick programs through ArmScheduler against the simulator and report timings."""
+    import serial
+    from arm_scheduler import ArmScheduler, home, move
+
+    program = [
+        move(0, 180, 120, 60), move(0, 180, 120, 20), move(0, 20, 60, 20),
+        move(180, 36, 90, 20), move(180, 36, 90, 60), home(),
+    ]
+    arm = ArmScheduler(serial.Serial(sim.port, 115200), timing=timing).start()
+    t0 = time.perf_counter()
+    futures = [arm.submit(program, name="pick") for _ in range(picks)]
+    futures[-1].result()
+    wall = time.perf_counter() - t0
+    s = arm.stats()
+    arm.stop()
+    rtt = (f"p50={s['rtt_ms_p50']:.1f}ms p95={s['rtt_ms_p95']:.1f}ms"
+           if s["rtt_ms_p50"] is not None else "n/a")
+    print(f"[BENCH] reply={sim.reply} timing={'model' if timing else 'fixed'} picks={picks} wall={wall:.2f}s "
+          f"throughput={picks / wall * 60:.1f} picks/min cycle p50={s['cycle_ms_p50']:.0f}ms "
+          f"serial rtt {rtt} timeouts={s['timeouts']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated MeArm Arduino on a pty")
+    parser.add_argument("--reply", default="receive", choices=["receive", "done", "silent"])
+    parser.add_argument("--speeds", default=",".join(str(s) for s in SPEEDS),
+                        help="base,s1,s2,claw slew rates in deg/s")
+    parser.add_argument("--settle", type=float, default=SETTLE)
+    parser.add_argument("--reply-delay", type=float, default=REPLY_DELAY)
+    parser.add_argument("--link", default="", help="also expose the port under this path")
+    parser.add_argument("--log", default="", help="append JSON command log here (default stderr)")
+    parser.add_argument("--bench", type=int, default=0, help="run N pick programs and exit")
+    parser.add_argument("--no-timing", action="store_true",
+                        help="bench with each step's fixed timeout as its wait instead of servo_timing")
+    args = parser.parse_args()
+
+    if args.log:
+        log = open(args.log, "a")
+    else:
+        log = None if args.bench else sys.stderr  # keep the bench summary readable
+    speeds = [float(v) for v in args.speeds.split(",")]
+    sim = ArduinoSim(args.reply, speeds, args.settle, args.reply_delay, log=log,
+                     link=args.link or None).start()
+
+    if args.bench:
+        bench(sim, args.bench, None if args.no_timing else ServoTimingModel.load())
+        sim.stop()
+        return
+
+    print(f"[INFO] Simulated Arduino on {sim.port}" + (f" -> {args.link}" if args.link else ""))
+    print(f"[INFO] export ARM_SERIAL_PORT={args.link or sim.port}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sim.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+arm_kinematics.py
+Camera-to-arm mapping: image homography, MeArm inverse kinematics and a
+precomputed lookup grid.
+
+Workspace frame (mm): origin on the table under the base rotation axis,
+x to the arm's right, y straight out in front of it, z up from the table.
+
+1. Calibration. Put a marker (pencil tip, coin) on at least 4 known
+   workspace points, note their pixel positions in a /video frame, and write
+   them to a JSON list [{"px": [u, v], "mm": [x, y]}, ...]. Then
+       python arm_kinematics.py calibrate --points points.json --w 640 --h 480
+   fits the image -> table homography and saves arm_calibration.json.
+2. IK. The MeArm v1.0 (Mearm_1_0_150x200_*.dxf, mm) has an 80 mm upper arm
+   and an 80 mm forearm, and its linkage keeps the claw level. A table point
+   reduces to a planar two-link problem (elbow up) plus a base yaw. Joint
+   angles become servo angles through the per-servo offset/sign in
+   SERVO_MAP. Poses outside the servo limits count as unreachable.
+3. Lookup. ArmLookup runs the IK once for a pixel grid (default every 8 px)
+   at a given pick height. Converting a detection to joint angles is then a
+   bilinear interpolation of 4 grid cells, about 10 us per box. Cells that
+   are unreachable are NaN, and any NaN neighbour makes the lookup return None.
+
+Usage:
+    lookup = ArmLookup.load(640, 480, z=PICK_Z)      # None if not calibrated
+    lookup.angles(cx, cy)                           # -> (base, s1, s2) or None
+    python arm_kinematics.py check --w 640 --h 480  # grid accuracy + timing
+"""
+
+import argparse
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+DEFAULT_PATH = "arm_calibration.json"
+
+# MeArm v1.0 geometry (mm)
+L1 = 80.0           # shoulder -> elbow
+L2 = 80.0           # elbow -> wrist
+SHOULDER_Z = 60.0   # shoulder pivot above the table
+SHOULDER_R = 10.0   # shoulder pivot in front of the base axis
+GRIPPER_R = 45.0    # wrist -> claw centre, kept horizontal by the linkage
+
+PICK_Z = 10.0       # claw centre height when grabbing a pencil
+HOVER_Z = 50.0      # approach height above the target
+
+# servo = offset + sign * joint angle (deg); limits in servo degrees
+SERVO_MAP = {
+    "base": {"offset": 0.0, "sign": 1.0, "min": 0, "max": 180},     # joint: yaw from +x
+    "s1": {"offset": 170.0, "sign": -1.0, "min": 20, "max": 160},   # joint: upper arm elevation
+    "s2": {"offset": 110.0, "sign": 1.0, "min": 20, "max": 160},    # joint: forearm pitch
+}
+
+
+def fit_homography(image_pts, world_pts):
+    """3x3 image -> table homography from >= 4 correspondences (RANSAC if more)."""
+    src = np.asarray(image_pts, dtype=np.float64).reshape(-1, 1, 2)
+    dst = np.asarray(world_pts, dtype=np.float64).reshape(-1, 1, 2)
+    if len(src) < 4:
+        raise ValueError("Need at least 4 point pairs for a homography")
+    H, _ = cv2.findHomography(src, dst, cv2.RANSAC if len(src) > 4 else 0, 3.0)
+    if H is None:
+        raise ValueError("Homography fit failed; are the points collinear?")
+    return H
+
+
+def image_to_world(H, pts):
+    """(N, 2) pixels -> (N, 2) table mm"""
+    pts = np.asarray(pts, dtype=np.float64).reshape(-1, 2)
+    uv1 = np.hstack([pts, np.ones((len(pts), 1))]) @ H.T
+    return uv1[:, :2] / uv1[:, 2:3]
+
+
+def solve_ik(x, y, z, servo_map=SERVO_MAP):
+    """
+    Vectorized IK for table points (arrays in mm).
+    returns (N, 3) servo angles (base, s1, s2), NaN rows where unreachable
+    """
+    x, y, z = (np.asarray(v, dtype=np.float64).ravel() for v in np.broadcast_arrays(x, y, z))
+    yaw = np.degrees(np.arctan2(y, x))
+    r = np.hypot(x, y) - SHOULDER_R - GRIPPER_R
+    h = z - SHOULDER_Z
+    cos_b = (r * r + h * h - L1 * L1 - L2 * L2) / (2.0 * L1 * L2)
+    reachable = np.abs(cos_b) <= 1.0
+    bend = np.arccos(np.clip(cos_b, -1.0, 1.0))              # elbow bend, elbow up
+    shoulder = np.arctan2(h, r) + np.arctan2(L2 * np.sin(bend), L1 + L2 * np.cos(bend))
+    forearm = shoulder - bend
+
+    joints = {"base": yaw, "s1": np.degrees(shoulder), "s2": np.degrees(forearm)}
+    out = np.empty((len(x), 3))
+    for i, name in enumerate(("base", "s1", "s2")):
+        m = servo_map[name]
+        angle = m["offset"] + m["sign"] * joints[name]
+        reachable &= (angle >= m["min"]) & (angle <= m["max"])
+        out[:, i] = angle
+    out[~reachable] = np.nan
+    return out
+
+
+class ArmLookup:
+    """Pixel -> servo angles for one pick height, by bilinear interpolation of a precomputed grid."""
+
+    def __init__(self, H, frame_w, frame_h, z=PICK_Z, step=8, servo_map=SERVO_MAP):
+        self.H = np.asarray(H, dtype=np.float64)
+        self.step = step
+        self.z = z
+        self.servo_map = servo_map
+        self.frame_w, self.frame_h = frame_w, frame_h
+        us = np.arange(0, frame_w + step, step, dtype=np.float64)
+        vs = np.arange(0, frame_h + step, step, dtype=np.float64)
+        uu, vv = np.meshgrid(us, vs)
+        world = image_to_world(self.H, np.stack([uu.ravel(), vv.ravel()], axis=1))
+        self.grid = solve_ik(world[:, 0], world[:, 1], z, servo_map).reshape(len(vs), len(us), 3)
+        self.reachable_fraction = float(np.isfinite(self.grid[..., 0]).mean())
+        # plain tuples: scalar lookups on small numpy arrays cost more than the maths
+        self._cells = [[tuple(c) if np.isfinite(c).all() else None for c in row.tolist()]
+                       for row in self.grid]
+
+    def angles(self, u, v):
+        """(base, s1, s2) as ints for pixel (u, v), or None if unreachable / off-frame"""
+        gx, gy = u / self.step, v / self.step
+        ix, iy = int(gx), int(gy)
+        if ix < 0 or iy < 0 or iy + 1 >= self.grid.shape[0] or ix + 1 >= self.grid.shape[1]:
+            return None
+        fx, fy = gx - ix, gy - iy
+        (a00, a01), (a10, a11) = self._cells[iy][ix:ix + 2], self._cells[iy + 1][ix:ix + 2]
+        if a00 is None or a01 is None or a10 is None or a11 is None:
+            return None
+        w00, w01, w10, w11 = (1 - fx) * (1 - fy), fx * (1 - fy), (1 - fx) * fy, fx * fy
+        return tuple(int(round(w00 * p + w01 * q + w10 * r + w11 * s))
+                     for p, q, r, s in zip(a00, a01, a10, a11))
+
+    @classmethod
+    def load(cls, frame_w, frame_h, z=PICK_Z, path=DEFAULT_PATH, step=8):
+        """Lookup from a saved calibration, or None if there isn't one yet."""
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            calib = json.load(f)
+        H = np.asarray(calib["homography"], dtype=np.float64)
+        cw, ch = calib.get("frame_size", [frame_w, frame_h])
+        if (cw, ch) != (frame_w, frame_h):
+            # calibrated at another resolution: rescale pixels first
+            H = H @ np.diag([cw / frame_w, ch / frame_h, 1.0])
+        # per servo, so a file can override a single field (e.g. just an offset)
+        overrides = calib.get("servo", {})
+        servo_map = {name: {**m, **overrides.get(name, {})} for name, m in SERVO_MAP.items()}
+        return cls(H, frame_w, frame_h, z, step, servo_map)
+
+
+def calibrate(points_path, frame_w, frame_h, out=DEFAULT_PATH):
+    with open(points_path) as f:
+        pairs = json.load(f)
+    px = np.array([p["px"] for p in pairs], dtype=np.float64)
+    mm = np.array([p["mm"] for p in pairs], dtype=np.float64)
+    H = fit_homography(px, mm)
+    err = np.linalg.norm(image_to_world(H, px) - mm, axis=1)
+    calib = {"homography": H.tolist(), "frame_size": [frame_w, frame_h], "points": pairs}
+    if os.path.exists(out):
+        with open(out) as f:
+            calib["servo"] = json.load(f).get("servo", {})  # keep hand-tuned servo offsets
+    with open(out, "w") as f:
+        json.dump(calib, f, indent=2)
+    print(f"[INFO] {len(px)} points, reprojection error mean={err.mean():.1f}mm max={err.max():.1f}mm")
+    print("[INFO] Saved", out)
+
+
+def check(frame_w, frame_h, path=DEFAULT_PATH, step=8):
+    lookup = ArmLookup.load(frame_w, frame_h, path=path, step=step)
+    if lookup is None:
+        print(f"[WARN] {path} not found, checking with a synthetic top-down calibration")
+        # 0.5 mm per pixel, image centre 150 mm in front of the base
+        H = np.array([[0.5, 0.0, -0.5 * frame_w / 2], [0.0, -0.5, 150 + 0.5 * frame_h / 2], [0, 0, 1]])
+        lookup = ArmLookup(H, frame_w, frame_h, step=step)
+    rng = np.random.default_rng(0)
+    pts = rng.uniform([0, 0], [frame_w - 1, frame_h - 1], (2000, 2))
+    world = image_to_world(lookup.H, pts)
+    exact = solve_ik(world[:, 0], world[:, 1], lookup.z, lookup.servo_map)
+
+    errs, misses = [], 0
+    t0 = time.perf_counter()
+    results = [lookup.angles(u, v) for u, v in pts]
+    per_call = (time.perf_counter() - t0) / len(pts) * 1e6
+    for res, ref in zip(results, exact):
+        if res is None or not np.isfinite(ref).all():
+            misses += (res is None) != (not np.isfinite(ref).all())
+            continue
+        errs.append(np.abs(np.array(res) - ref).max())
+    print(f"[INFO] grid {lookup.grid.shape[1]}x{lookup.grid.shape[0]} step={step}px, "
+          f"reachable {lookup.reachable_fraction:.0%} of the frame")
+    if errs:
+        print(f"[INFO] max |lookup - IK| = {max(errs):.2f} deg (p95 {np.percentile(errs, 95):.2f}), "
+              f"reachability disagreements at the edge: {misses}")
+    print(f"[INFO] {per_call:.1f} us per lookup")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Camera -> MeArm calibration and IK lookup")
+    parser.add_argument("command", choices=["calibrate", "check"])
+    parser.add_argument("--points", default="points.json", help="[{px: [u, v], mm: [x, y]}, ...]")
+    parser.add_argument("--w", type=int, default=640)
+    parser.add_argument("--h", type=int, default=480)
+    parser.add_argument("--step", type=int, default=8, help="lookup grid spacing in pixels")
+    parser.add_argument("--out", default=DEFAULT_PATH)
+    args = parser.parse_args()
+
+    if args.command == "calibrate":
+        calibrate(args.points, args.w, args.h, args.out)
+    else:
+        check(args.w, args.h, args.out, args.step)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+arm_scheduler.py
+Motion scheduler thread that owns the Arduino serial port.
+
+Callers submit whole programs (lists of MotionStep) and get a
+concurrent.futures.Future back immediately; the detection loop never
+sleeps. The scheduler thread sends one step at a time and moves on as soon
+as the Arduino answers with any line (the firmware prints a reply for every
+command), or when the step's timeout expires for a silent board.
+
+The ack only means the line was read, not that the servos have arrived, so
+each step also has a dwell: the minimum time from sending it to sending the
+next one. Steps built with dwell=None get it from the scheduler's
+ServoTimingModel (servo_timing.py), from the last commanded pose to the
+step's target. Waiting is then proportional to how far the servos travel
+instead of a fixed guess. Without a timing model (or for a step with no
+known target) dwell=None means the step's timeout, the fixed sleep it
+replaces, so a step never outruns the servos on firmware that acks on
+receipt. Pass dwell=0 explicitly to step on the ack alone. With log= every
+step is written as a JSON line that servo_timing.py can calibrate from.
+
+Every step's serial round trip and every program's cycle time are recorded
+(stats() and the /metrics histograms), so the fixed sleeps they replace can
+be compared directly.
+
+Usage:
+    arm = ArmScheduler(serial.Serial("/dev/ttyACM0", 115200)).start()
+    fut = arm.submit([move(90, 120, 60, 60), move(90, 120, 60, 20), home()], name="pick")
+    fut.add_done_callback(lambda f: print(f.result()["cycle_ms"]))
+    asyncio code: await asyncio.wrap_future(fut)
+    ArmScheduler(ser, timing=ServoTimingModel.load())   # model-based dwells
+"""
+
+import collections
+import json
+import queue
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+
+import numpy as np
+
+from metrics import Counter, Histogram
+from servo_timing import HOME_ANGLES
+
+# command : line without newline
+# timeout : max wait for the ack (s)
+# dwell   : min time from sending this step to sending the next (s),
+#           None = timing model, or the timeout without one
+# target  : (base, s1, s2, claw) the step drives to, None if unknown
+MotionStep = namedtuple("MotionStep", ["command", "timeout", "dwell", "target"])
+
+SERIAL_RTT_SECONDS = Histogram("robot_serial_rtt_seconds", "Command to first Arduino reply line",
+                               buckets=(0.005, 0.01, 0.02, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0))
+PROGRAM_SECONDS = Histogram("robot_arm_program_seconds", "Arm program (e.g. pick cycle) duration",
+                            ["program"], buckets=(0.5, 1, 2, 3, 4, 5, 7.5, 10, 15, 20))
+STEP_TIMEOUTS = Counter("robot_arm_step_timeouts_total", "Arm steps that got no reply in time")
+
+
+def move(base, s1, s2, claw, timeout=2.0, dwell=None):
+    target = (int(base), int(s1), int(s2), int(claw))
+    return MotionStep("M,{},{},{},{}".format(*target), timeout, dwell, target)
+
+
+def home(timeout=3.0, dwell=None):
+    return MotionStep("HOME", timeout, dwell, HOME_ANGLES)
+
+
+class ArmScheduler:
+    """
+    ser : open serial port; its read timeout is capped at READ_TIMEOUT so the
+          per-step timeouts are honoured
+    """
+
+    READ_TIMEOUT = 0.05
+
+    def __init__(self, ser, timing=None, log=None):
+        self.ser = ser
+        self.timing = timing  # ServoTimingModel, or None for the steps' fixed timeouts
+        self.pose = None      # last commanded angles, unknown until the first move
+        self._log = log
+        if ser.timeout is None or ser.timeout > self.READ_TIMEOUT:
+            ser.timeout = self.READ_TIMEOUT
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._pending = 0  # submitted programs not finished yet
+        self._running = False
+        self._thread = None
+        self.rtts = collections.deque(maxlen=500)
+        self.cycles = collections.deque(maxlen=100)
+        self.counts = {"programs": 0, "steps": 0, "acks": 0, "timeouts": 0, "errors": 0}
+
+    @property
+    def busy(self):
+        with self._lock:
+            return self._pending > 0
+
+    def start(self):
+        if not self._running:
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name="arm", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        self._running = False
+        self._queue.put(None)
+        if self._thread:
+            self._thread.join(timeout)
+
+    def submit(self, steps, name="program", if_idle=False):
+        """
+        Queue a program; returns a Future resolving to its timing report.
+        With if_idle=True nothing is queued while another program is pending
+        and None is returned instead.
+        """
+        with self._lock:
+            if if_idle and self._pending:
+                return None
+            self._pending += 1
+        fut = Future()
+        self._queue.put((name, list(steps), fut))
+        return fut
+
+    # ---- scheduler thread ----
+    def _run(self):
+        while self._running:
+            job = self._queue.get()
+            if job is None:
+                break
+            name, steps, fut = job
+            if not fut.set_running_or_notify_cancel():
+                self._finish()
+                continue
+            try:
+                fut.set_result(self._execute(name, steps))
+            except Exception as e:
+                self.counts["errors"] += 1
+                print(f"[ERROR] Arm program {name!r} failed:", e)
+                fut.set_exception(e)
+            finally:
+                self._finish()
+
+    def _finish(self):
+        with self._lock:
+            self._pending -= 1
+
+    def _execute(self, name, steps):
+        t_start = time.perf_counter()
+        report = []
+        for step in steps:
+            dwell = self._dwell(step)
+            t_send, reply, rtt = self._send(step)
+            remaining = t_send + dwell - time.perf_counter()
+            if remaining > 0:
+                time.sleep(remaining)
+            report.append({"command": step.command, "reply": reply,
+                           "rtt_ms": None if rtt is None else rtt * 1000.0,
+                           "dwell_ms": dwell * 1000.0})
+            if self._log is not None:
+                self._log.write(json.dumps({
+                    "t": round(time.time(), 4), "cmd": step.command,
+                    "start": self.pose, "target": step.target,
+                    "reply_s": None if rtt is None else round(rtt, 4),
+                    "dwell_s": round(dwell, 4)}) + "\n")
+                self._log.flush()
+            if step.target is not None:
+                self.pose = list(step.target)
+        cycle = time.perf_counter() - t_start
+        self.cycles.append(cycle)
+        self.counts["programs"] += 1
+        PROGRAM_SECONDS.labels(name).observe(cycle)
+        return {"name": name, "cycle_ms": cycle * 1000.0, "steps": report}
+
+    def _dwell(self, step):
+        if step.dwell is not None:
+            return step.dwell
+        if self.timing is None or step.target is None:
+            return step.timeout  # the baseline's fixed sleep: safe without knowing the motion
+        return self.timing.dwell(self.pose, step.target)
+
+    def _send(self, step):
+        """Write one command and wait for a reply line; returns (t_send, reply, rtt)"""
+        self.ser.reset_input_buffer()  # drop stale/unsolicited lines
+        t0 = time.perf_counter()
+        self.ser.write((step.command + "\n").encode("utf-8"))
+        self.counts["steps"] += 1
+        deadline = t0 + step.timeout
+        while time.perf_counter() < deadline:
+            line = self.ser.readline()
+            if line.strip():
+                rtt = time.perf_counter() - t0
+                self.rtts.append(rtt)
+                self.counts["acks"] += 1
+                SERIAL_RTT_SECONDS.observe(rtt)
+                return t0, line.decode("utf-8", "replace").strip(), rtt
+        self.counts["timeouts"] += 1
+        STEP_TIMEOUTS.inc()
+        return t0, None, None
+
+    # ---- reporting ----
+    def stats(self):
+        rtt = np.array(self.rtts) * 1000.0
+        cyc = np.array(self.cycles) * 1000.0
+        return {
+            **self.counts,
+            "busy": self.busy,
+            "rtt_ms_p50": float(np.percentile(rtt, 50)) if rtt.size else None,
+            "rtt_ms_p95": float(np.percentile(rtt, 95)) if rtt.size else None,
+            "cycle_ms_p50": float(np.percentile(cyc, 50)) if cyc.size else None,
+            "cycle_ms_last": float(cyc[-1]) if cyc.size else None,
+        }
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+bench_nms.py
+Microbenchmark for nms.py at 100, 1k and 8k candidates.
+
+Candidates are clustered around a few dozen "objects" the way YOLO emits
+many overlapping boxes per tomato in a crowded field. Every backend is
+checked against the greedy reference before it is timed.
+
+Usage:
+    python bench_nms.py [--repeat 50] [--classes 2] [--sizes 100,1000,8000]
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from nms import nms
+
+
+def make_candidates(n, n_classes, rng, frame=640, n_objects=40):
+    centres = rng.uniform(40, frame - 40, (n_objects, 2))
+    sizes = rng.uniform(15, 80, (n_objects, 2))
+    obj = rng.integers(0, n_objects, n)
+    xy = centres[obj] + rng.normal(0, 4, (n, 2))
+    wh = sizes[obj] * rng.uniform(0.85, 1.15, (n, 2))
+    boxes = np.concatenate([xy - wh / 2, xy + wh / 2], axis=1).astype(np.float32)
+    scores = rng.uniform(0.3, 1.0, n).astype(np.float32)
+    class_ids = (obj % n_classes).astype(np.int64)
+    return boxes, scores, class_ids
+
+
+def time_call(fn, repeat):
+    fn()  # warm-up
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    samples = np.array(samples) * 1000.0
+    return np.median(samples), np.percentile(samples, 95)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--classes", type=int, default=2)
+    parser.add_argument("--sizes", default="100,1000,8000")
+    parser.add_argument("--iou", type=float, default=0.45)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    backends = ["matrix", "greedy", "auto"]
+    try:
+        import cv2  # noqa: F401
+        backends.append("cv2")
+    except ImportError:
+        print("[INFO] OpenCV not installed, skipping cv2 backend")
+
+    print(f"{'N':>6} {'backend':>8} {'top_k':>6} {'kept':>5} {'p50 ms':>8} {'p95 ms':>8}")
+    for n in [int(s) for s in args.sizes.split(",")]:
+        boxes, scores, cls = make_candidates(n, args.classes, rng)
+        ref = nms(boxes, scores, cls, args.iou, top_k=0, max_det=0, backend="greedy")
+        for backend in backends:
+            for top_k in (0, 1000):
+                if top_k and top_k >= n:
+                    continue
+                # the matrix path is O(N^2) memory, only run it where it is sane
+                if backend == "matrix" and min(n, top_k or n) > 2000:
+                    continue
+                fn = lambda: nms(boxes, scores, cls, args.iou, top_k=top_k,
+                                 max_det=0, backend=backend)
+                keep = fn()
+                if not top_k and set(keep.tolist()) != set(ref.tolist()):
+                    print(f"[WARN] {backend} disagrees with greedy reference at N={n}")
+                p50, p95 = time_call(fn, args.repeat)
+                print(f"{n:>6} {backend:>8} {top_k or '-':>6} {len(keep):>5} {p50:>8.3f} {p95:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+bench_pipeline.py
+Offline replay benchmark for the detection pipeline; no camera or browser needed.
+
+Frames from a recorded video, an image directory or the synthetic source
+(frame_source.py) go through the same YoloDetector stages the streamers use
+(preprocess, infer, decode, NMS), then draw_detections and cv2.imencode. The report is JSON: per-stage
+p50/p95/p99/mean latency, end-to-end throughput and peak RSS. Pass
+--baseline with an earlier report to fail on regressions.
+
+--detector tflite:model.tflite / eim:model.eim times another backend through
+detectors.py instead; those report infer (the whole backend call), draw,
+encode and total, so run the ONNX model the same way to compare like for like.
+
+Usage:
+    python bench_pipeline.py --input clip.mp4 --model best.onnx [--frames 500] [--out report.json]
+    python bench_pipeline.py --input data/pencil --baseline report.json --tolerance 0.10
+    python bench_pipeline.py --input synthetic:640x480 --frames 200
+    python bench_pipeline.py --input clip.mp4 --detector tflite:best_float16.tflite
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import resource
+import sys
+import time
+
+import cv2
+import numpy as np
+import onnxruntime as rt
+
+from frame_source import open_source
+from yolo_detector import YoloDetector, draw_detections
+
+STAGES = ["preprocess", "infer", "decode", "nms", "draw", "encode", "total"]
+BACKEND_STAGES = ["infer", "draw", "encode", "total"]
+
+
+def read_frames(uri, limit):
+    """Decode up front so file I/O and video decoding stay out of the timings."""
+    source = open_source(uri, rate="max", loop=False)
+    frames = []
+    while len(frames) < limit:
+        ret, frame = source.read()
+        if not ret:
+            break
+        frames.append(frame)
+    source.release()
+    return frames
+
+
+def peak_rss_mb():
+    # ru_maxrss is KB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024.0 * 1024.0) if sys.platform == "darwin" else rss / 1024.0
+
+
+def summarize(samples):
+    ms = np.array(samples) * 1000.0
+    return {
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "mean_ms": round(float(ms.mean()), 3),
+    }
+
+
+def run(detector, frames, n, warmup, label, jpeg_quality):
+    times = {s: [] for s in STAGES}
+    params = [int(cv2.IMWRITE_JPEG_QUALITY), jpeg_quality]
+    detections = 0
+    t_start = None
+    for i in range(n + warmup):
+        if i == warmup:
+            t_start = time.perf_counter()
+        frame = frames[i % len(frames)].copy()  # drawing mutates the frame
+
+        t0 = time.perf_counter()
+        detector.preprocess(frame)
+        t1 = time.perf_counter()
+        output = detector.infer()
+        t2 = time.perf_counter()
+        dets = detector.decode(output)
+        t3 = time.perf_counter()
+        dets = detector.nms(dets)
+        t4 = time.perf_counter()
+        draw_detections(frame, dets, label)
+        t5 = time.perf_counter()
+        cv2.imencode('.jpg', frame, params)
+        t6 = time.perf_counter()
+
+        if i < warmup:
+            continue
+        detections += len(dets.scores)
+        for stage, dt in zip(STAGES, (t1 - t0, t2 - t1, t3 - t2, t4 - t3, t5 - t4, t6 - t5, t6 - t0)):
+            times[stage].append(dt)
+    wall = time.perf_counter() - t_start
+    return times, wall, detections
+
+
+def run_backend(detector, frames, n, warmup, jpeg_quality):
+    """run() for a detectors.Detector, whose stages are not exposed one by one"""
+    from detectors import draw_prediction
+
+    times = {s: [] for s in BACKEND_STAGES}
+    params = [int(cv2.IMWRITE_JPEG_QUALITY), jpeg_quality]
+    detections = 0
+    t_start = None
+    for i in range(n + warmup):
+        if i == warmup:
+            t_start = time.perf_counter()
+        frame = frames[i % len(frames)].copy()
+
+        t0 = time.perf_counter()
+        pred = detector.detect(frame)
+        t1 = time.perf_counter()
+        draw_prediction(frame, pred, detector)
+        t2 = time.perf_counter()
+        cv2.imencode('.jpg', frame, params)
+        t3 = time.perf_counter()
+
+        if i < warmup:
+            continue
+        detections += len(pred.detections.scores)
+        for stage, dt in zip(BACKEND_STAGES, (t1 - t0, t2 - t1, t3 - t2, t3 - t0)):
+            times[stage].append(dt)
+    wall = time.perf_counter() - t_start
+    return times, wall, detections
+
+
+def compare(report, baseline, tolerance):
+    """returns a list of stages whose p95 regressed by more than tolerance"""
+    regressions = []
+    for stage, cur in report["stages"].items():
+        old = baseline.get("stages", {}).get(stage)
+        if not old or old["p95_ms"] <= 0:
+            continue
+        change = cur["p95_ms"] / old["p95_ms"] - 1.0
+        if change > tolerance:
+            regressions.append(f"{stage}: p95 {old['p95_ms']:.2f} -> {cur['p95_ms']:.2f} ms (+{change:.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", required=True,
+                        help="frame source: video file, image directory or synthetic[:WxH]")
+    parser.add_argument("--model", default="best.onnx")
+    parser.add_argument("--size", type=int, default=640)
+    parser.add_argument("--conf", type=float, default=0.30)
+    parser.add_argument("--iou", type=float, default=0.45)
+    parser.add_argument("--profile", default=None, help="ort_session profile")
+    parser.add_argument("--frames", type=int, default=300, help="frames to time (input loops)")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--jpeg-quality", type=int, default=80)
+    parser.add_argument("--label", default="Pencil")
+    parser.add_argument("--detector", default="",
+                        help="backend:model from detectors.py instead of the staged ONNX run")
+    parser.add_argument("--out", default="", help="write the JSON report here as well")
+    parser.add_argument("--baseline", default="", help="earlier report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed p95 regression")
+    args = parser.parse_args()
+
+    frames = read_frames(args.input, args.frames)
+    if not frames:
+        print(f"No frames could be read from {args.input}", file=sys.stderr)
+        exit(1)
+
+    # keep stdout clean for the JSON report
+    if args.detector:
+        from detectors import create_detector
+
+        with contextlib.redirect_stdout(sys.stderr):
+            detector = create_detector(args.detector, warmup=False)
+        times, wall, detections = run_backend(detector, frames, args.frames, args.warmup, args.jpeg_quality)
+        detector.close()
+        model, input_size = args.detector, detector.input_shape[0]
+    else:
+        with contextlib.redirect_stdout(sys.stderr):
+            detector = YoloDetector(args.model, args.size, args.conf, args.iou, profile=args.profile)
+        times, wall, detections = run(detector, frames, args.frames, args.warmup,
+                                      args.label, args.jpeg_quality)
+        model, input_size = args.model, args.size
+
+    h, w = frames[0].shape[:2]
+    report = {
+        "input": args.input,
+        "model": model,
+        "frame_size": [w, h],
+        "input_size": input_size,
+        "frames": args.frames,
+        "distinct_frames": len(frames),
+        "throughput_fps": round(args.frames / wall, 2),
+        "detections_per_frame": round(detections / args.frames, 2),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "stages": {s: summarize(v) for s, v in times.items()},
+        "env": {
+            "python": platform.python_version(),
+            "onnxruntime": rt.__version__,
+            "opencv": cv2.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+        },
+    }
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for r in regressions:
+            print("[REGRESSION]", r, file=sys.stderr)
+        if regressions:
+            exit(2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+bench_preprocess.py
+Per-frame allocation and time of the old preprocess + sess.run path versus
+Preprocessor + BoundSession (preprocess.py).
+
+Allocations are measured with tracemalloc, which sees every NumPy buffer:
+"alloc KB/frame" is how far traced memory rises above its level before the
+frame, i.e. the transient heap the hot loop needs. Memory that OpenCV and
+ONNX Runtime allocate internally is invisible to tracemalloc, so the numbers
+cover the Python-side hot loop only.
+
+Usage:
+    python bench_preprocess.py --model best.onnx [--frames 200] [--w 640 --h 480]
+"""
+
+import argparse
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+import onnxruntime as rt
+
+from preprocess import BoundSession, Preprocessor
+
+
+def legacy_preprocess(frame, size):
+    # what pencil_detection.preprocess did before
+    img = cv2.resize(frame, (size, size))
+    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    img = img.astype(np.float32) / 255.0
+    img = img.transpose(2, 0, 1)
+    img = np.expand_dims(img, 0)
+    return img
+
+
+def measure(step, frames, n):
+    for f in frames[:5]:
+        step(f)  # warm-up: one-time buffers are not per-frame cost
+
+    tracemalloc.start()
+    alloc = []
+    for i in range(n):
+        base, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        step(frames[i % len(frames)])
+        _, peak = tracemalloc.get_traced_memory()
+        alloc.append(peak - base)
+    tracemalloc.stop()
+
+    times = []
+    for i in range(n):
+        t0 = time.perf_counter()
+        step(frames[i % len(frames)])
+        times.append(time.perf_counter() - t0)
+    times = np.array(times) * 1000.0
+    return np.mean(alloc) / 1024.0, np.median(times), np.percentile(times, 95)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="best.onnx")
+    parser.add_argument("--size", type=int, default=640)
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--w", type=int, default=640, help="camera frame width")
+    parser.add_argument("--h", type=int, default=480, help="camera frame height")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(0, 255, (args.h, args.w, 3), dtype=np.uint8) for _ in range(8)]
+
+    sess = rt.InferenceSession(args.model, providers=['CPUExecutionProvider'])
+    input_name = sess.get_inputs()[0].name
+    pre = Preprocessor(args.size)
+    runner = BoundSession(sess, pre.input)
+
+    cases = [
+        ("legacy preprocess", lambda f: legacy_preprocess(f, args.size)),
+        ("Preprocessor", lambda f: pre(f)),
+        ("legacy preprocess + run", lambda f: sess.run(None, {input_name: legacy_preprocess(f, args.size)})),
+        ("Preprocessor + IOBinding", lambda f: (pre(f), runner.run())),
+    ]
+    print(f"{'case':<28} {'alloc KB/frame':>15} {'p50 ms':>8} {'p95 ms':>8}")
+    for name, step in cases:
+        kb, p50, p95 = measure(step, frames, args.frames)
+        print(f"{name:<28} {kb:>15.1f} {p50:>8.2f} {p95:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
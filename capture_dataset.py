@@ -12,7 +12,12 @@ Controls:
 """
 
 import cv2, os, time, argparse, glob, threading
-from flask import Flask, Response
+from flask import Flask, Response, jsonify, request
+
+from frame_source import add_source_args, open_source
+from latest_slot import LatestSlot
+from metrics import CAMERA_READ_FAILURES, FRAMES, STAGE_SECONDS, register_metrics_route
+from mjpeg_hub import MJPEG_MIMETYPE, MjpegHub
 
 # ------------------------
 # Parse arguments
@@ -23,6 +28,7 @@ parser.add_argument("--classes", default="", help="comma separated class names")
 parser.add_argument("--w", type=int, default=640, help="camera width")
 parser.add_argument("--h", type=int, default=480, help="camera height")
 parser.add_argument("--interval", type=float, default=1.0, help="auto-capture interval (sec)")
+add_source_args(parser)
 args = parser.parse_args()
 
 if not args.classes:
@@ -43,9 +49,7 @@ for c in classes:
 # ------------------------
 # Initialize camera
 # ------------------------
-cap = cv2.VideoCapture(0, cv2.CAP_V4L2)
-cap.set(cv2.CAP_PROP_FRAME_WIDTH, args.w)
-cap.set(cv2.CAP_PROP_FRAME_HEIGHT, args.h)
+cap = open_source(args.source, args.rate, args.w, args.h)
 
 if not cap.isOpened():
     print("? Cannot open camera")
@@ -55,20 +59,41 @@ if not cap.isOpened():
 # Flask App for Streaming
 # ------------------------
 app = Flask(__name__)
+hub = MjpegHub()
+latest = LatestSlot()  # newest raw frame, read by the capture loop below
 
-def generate():
+def camera_loop():
+    """Only reader of the camera: keeps the newest frame and encodes it once for all viewers."""
+    read_time, encode_time = STAGE_SECONDS.labels("capture"), STAGE_SECONDS.labels("encode")
+    captured = FRAMES.labels("captured")
     while True:
+        t0 = time.perf_counter()
         success, frame = cap.read()
         if not success:
+            CAMERA_READ_FAILURES.inc()
+            time.sleep(0.05)
             continue
-        ret, buffer = cv2.imencode('.jpg', frame)
-        frame_bytes = buffer.tobytes()
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+        read_time.observe(time.perf_counter() - t0)
+        captured.inc()
+        latest.put(frame)
+        if hub.has_clients:
+            with encode_time.time():
+                ret, buffer = cv2.imencode('.jpg', frame)
+            if ret:
+                hub.publish(buffer.tobytes())
 
 @app.route('/video')
 def video():
-    return Response(generate(), mimetype='multipart/x-mixed-replace; boundary=frame')
+    return Response(hub.subscribe(request.remote_addr), mimetype=MJPEG_MIMETYPE)
+
+@app.route('/video/stats')
+def video_stats():
+    return jsonify(hub.stats())
+
+register_metrics_route(app)
+
+camera_thread = threading.Thread(target=camera_loop, daemon=True)
+camera_thread.start()
 
 # Run Flask in background thread
 def run_flask():
@@ -87,8 +112,8 @@ print("? Capturing... Open browser at http://<pi_ip>:5000/video to view stream")
 print("Controls in terminal: n=next, p=prev, c=capture, a=toggle auto, q=quit")
 
 while True:
-    ret, frame = cap.read()
-    if not ret:
+    _, frame = latest.get(timeout=1.0)
+    if frame is None:
         time.sleep(0.2)
         continue
 
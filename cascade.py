@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+cascade.py
+Detect, then classify: the ONNX detector finds the objects and the TFLite
+crop classifier (veggie_model.tflite, tomato / potato) labels each one.
+
+Classifying every box in every frame would cost one classifier run per
+object per frame. Labels are cached per tracker.Track instead. A track's crop
+is (re)classified only:
+    - when the track is new
+    - when its box has moved or resized so much that the IoU with the box it
+      was classified on drops below refresh_iou
+    - when its label is older than max_age seconds
+and only on frames where the detector matched the track (since_update == 0),
+so the crop is a real detection and not a Kalman prediction. Crops that need
+a label are batched into one classifier call, at most max_crops per frame,
+new tracks first and then the ones with the oldest labels. The rest
+wait for the next frame, which caps classifier work when many objects
+appear at once.
+
+    cascade = Cascade(TFLiteDetector("veggie_model.tflite", max_batch=4))
+    tracks = tracker.update(dets)
+    labels = cascade.update(frame, tracks)      # {track_id: (label, score)}
+
+pencil/pencil_detection.py turns this on with CASCADE_MODEL=veggie_model.tflite.
+Classifier runs vs. objects seen on a clip:
+    python cascade.py --source clip.mp4 --model best.onnx --classifier veggie_model.tflite
+"""
+
+import argparse
+import contextlib
+import sys
+import time
+
+import numpy as np
+
+from metrics import Counter
+from nms import box_iou_matrix
+
+CROPS_CLASSIFIED = Counter("robot_cascade_crops_classified_total", "Crops run through the classifier")
+LABEL_CACHE_HITS = Counter("robot_cascade_cache_hits_total", "Track labels served from the cache")
+
+
+class Cascade:
+    """
+    classifier  : detectors.Detector with classification output (TFLiteDetector)
+    refresh_iou : reclassify once the box overlaps its classified box less than this
+    max_age     : seconds before a cached label is refreshed anyway
+    max_crops   : crops classified per update() at most (default: the classifier's batch)
+    pad         : context added around each box, as a fraction of its size
+    min_side    : boxes smaller than this (pixels) are not classified
+    """
+
+    def __init__(self, classifier, refresh_iou=0.5, max_age=2.0, max_crops=None, pad=0.1, min_side=12):
+        self.classifier = classifier
+        self.refresh_iou = refresh_iou
+        self.max_age = max_age
+        self.max_crops = max_crops or getattr(classifier, "max_batch", 1)
+        self.pad = pad
+        self.min_side = min_side
+        self._cache = {}  # track_id -> (label, score, box, t)
+        self.classified = 0
+        self.hits = 0
+        self.calls = 0
+
+    def _crop(self, frame, box):
+        x1, y1, x2, y2 = box
+        px, py = (x2 - x1) * self.pad, (y2 - y1) * self.pad
+        h, w = frame.shape[:2]
+        x1, y1 = int(max(0, x1 - px)), int(max(0, y1 - py))
+        x2, y2 = int(min(w, x2 + px)), int(min(h, y2 + py))
+        if x2 - x1 < self.min_side or y2 - y1 < self.min_side:
+            return None
+        return frame[y1:y2, x1:x2]
+
+    def _stale(self, track, now):
+        cached = self._cache.get(track.track_id)
+        if cached is None:
+            return True
+        _, _, box, t = cached
+        if now - t > self.max_age:
+            return True
+        return box_iou_matrix(box[None], track.box[None])[0, 0] < self.refresh_iou
+
+    def update(self, frame, tracks):
+        """Call before drawing on frame; returns {track_id: (label, score)} for the tracks with a label."""
+        now = time.monotonic()
+        live = {t.track_id for t in tracks}
+        for track_id in list(self._cache):
+            if track_id not in live:
+                del self._cache[track_id]
+
+        todo, crops = [], []
+        # unlabelled tracks first (they have nothing to show yet), then the oldest labels;
+        # a stale label still draws, a missing one doesn't
+        for track in sorted(tracks, key=lambda t: self._cache.get(t.track_id, (0, 0, 0, -1.0))[3]):
+            if len(todo) >= self.max_crops:
+                break
+            if track.since_update or not self._stale(track, now):
+                continue
+            crop = self._crop(frame, track.box)
+            if crop is not None:
+                todo.append(track)
+                crops.append(crop)
+
+        if crops:
+            self.calls += 1
+            for track, pred in zip(todo, self.classifier.infer(crops)):
+                best = int(np.argmax(pred.classification))
+                self._cache[track.track_id] = (self.classifier.label(best), float(pred.classification[best]),
+                                               track.box.copy(), now)
+            self.classified += len(crops)
+            CROPS_CLASSIFIED.inc(len(crops))
+
+        hits = len(self._cache) - len(crops)
+        self.hits += hits
+        LABEL_CACHE_HITS.inc(hits)
+        return {track_id: (label, score) for track_id, (label, score, _, _) in self._cache.items()}
+
+    def stats(self):
+        return {
+            "tracked_labels": len(self._cache),
+            "classified": self.classified,
+            "classifier_calls": self.calls,
+            "cache_hits": self.hits,
+        }
+
+
+def main():
+    from detectors import create_detector
+    from frame_source import add_source_args, open_source
+    from tracker import Tracker
+
+    parser = argparse.ArgumentParser(description="Detector + cached crop classifier on a clip")
+    add_source_args(parser, default="synthetic")
+    parser.add_argument("--model", default="best.onnx", help="ONNX detector")
+    parser.add_argument("--classifier", default="veggie_model.tflite")
+    parser.add_argument("--labels", default="tomato,potato")
+    parser.add_argument("--batch", type=int, default=4, help="crops per classifier call")
+    parser.add_argument("--refresh-iou", type=float, default=0.5)
+    parser.add_argument("--max-age", type=float, default=2.0)
+    parser.add_argument("--frames", type=int, default=300)
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(sys.stderr):
+        detector = create_detector(f"onnx:{args.model}")
+        classifier = create_detector(f"tflite:{args.classifier}", labels=args.labels.split(","),
+                                     max_batch=args.batch)
+    cascade = Cascade(classifier, args.refresh_iou, args.max_age)
+    tracker = Tracker()
+    source = open_source(args.source, rate="max", loop=False)
+
+    frames = objects = 0
+    t0 = time.perf_counter()
+    while frames < args.frames:
+        ok, frame = source.read()
+        if not ok:
+            break
+        tracks = tracker.update(detector.detect(frame).detections)
+        cascade.update(frame, tracks)
+        frames += 1
+        objects += sum(t.since_update == 0 for t in tracks)
+    wall = time.perf_counter() - t0
+    source.release()
+    if not frames:
+        raise RuntimeError(f"No frames from {args.source}")
+
+    s = cascade.stats()
+    print(f"[INFO] {frames} frames in {wall:.1f}s, {objects} detected objects ({objects / wall:.1f}/s)")
+    print(f"[INFO] classifier: {s['classified']} crops in {s['classifier_calls']} calls "
+          f"({s['classified'] / wall:.1f} crops/s, {s['classified'] / max(objects, 1):.1%} of objects), "
+          f"{s['cache_hits']} cached labels reused")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,20 @@
 #!/usr/bin/env python3
-import cv2
-import numpy as np
-from edge_impulse_linux.runner import ImpulseRunner
+from detectors import EdgeImpulseDetector
+from frame_source import source_from_cli
 
 MODEL_FILE = '/home/kartik/robot/vegetable-detection-linux-aarch64-v2.eim'
 
 def main():
-    runner = ImpulseRunner(MODEL_FILE)
-    model_info = runner.init()
-    print("? Model loaded:", model_info['project']['name'])
+    # grayscale, stretched to the model input, flattened in [0, 1]
+    detector = EdgeImpulseDetector(MODEL_FILE, gray=True)
+    print("? Model loaded:", detector.model_info['project']['name'])
 
-    h = model_info['model_parameters']['image_input_height']
-    w = model_info['model_parameters']['image_input_width']
-    labels = model_info['model_parameters']['labels']
-    print(f"Expecting input shape: ({h},{w},1) with labels {labels}")
+    h, w, _ = detector.input_shape
+    print(f"Expecting input shape: ({h},{w},1) with labels {detector.labels}")
 
-    cap = cv2.VideoCapture(0)
+    cap = source_from_cli()
     if not cap.isOpened():
-        raise Exception("? Could not open camera")
+        raise Exception("? Could not open frame source")
 
     try:
         while True:
@@ -25,31 +22,17 @@ def main():
             if not ret:
                 break
 
-            # Preprocess ? grayscale ? flatten
-            resized = cv2.resize(frame, (w, h))
-            gray = cv2.cvtColor(resized, cv2.COLOR_BGR2GRAY)
-            features = np.float32(gray).flatten() / 255.0
-
-            # Run inference
-            res = runner.classify(features)
-
-            if "result" in res:
-                # For object detection models
-                boxes = res["result"].get("bounding_boxes", [])
-                if boxes:
-                    print("Detections:")
-                    for b in boxes:
-                        label = b["label"]
-                        score = b["value"]
-                        x = b["x"]
-                        y = b["y"]
-                        w_box = b["width"]
-                        h_box = b["height"]
-                        print(f"  {label} ({score:.2f}) at x={x}, y={y}, w={w_box}, h={h_box}")
+            # Run inference; boxes come back in frame pixels
+            dets = detector.detect(frame).detections
+            if len(dets.boxes):
+                print("Detections:")
+                for (x1, y1, x2, y2), score, cid in zip(dets.boxes, dets.scores, dets.class_ids):
+                    print(f"  {detector.label(int(cid))} ({score:.2f}) at x={x1:.0f}, y={y1:.0f}, "
+                          f"w={x2 - x1:.0f}, h={y2 - y1:.0f}")
 
     finally:
         cap.release()
-        runner.stop()
+        detector.close()
 
 if __name__ == "__main__":
     main()
@@ -1,56 +1,65 @@
-from flask import Flask, Response
-import cv2
-import numpy as np
-import onnxruntime as rt
+import os
+
+from flask import Flask, Response, jsonify, request
+
+from detectors import create_detector, draw_prediction
+from frame_pipeline import FramePipeline
+from frame_source import source_from_cli
+from inference_pool import InferencePool, PooledFramePipeline
+from metrics import register_metrics_route
+from mjpeg_hub import MJPEG_MIMETYPE
+from motion_gate import MotionGate
+from yolo_detector import draw_detections
 
 app = Flask(__name__)
 
 # Load ONNX model
-sess = rt.InferenceSession("/home/kartik/robot/best.onnx")
-
-# Open camera
-cap = cv2.VideoCapture(0)
+MODEL_PATH = "/home/kartik/robot/best.onnx"
 CONF_THRESHOLD = 0.3
+IOU_THRESHOLD = 0.45
+WORKERS = int(os.environ.get("INFERENCE_WORKERS", "0"))  # >0: ORT in worker processes (inference_pool.py)
+
+# Open camera (or --source clip.mp4 / data dir / synthetic)
+cap = source_from_cli()
+
+if not WORKERS:
+    # DETECTOR=tflite:model.tflite / eim:model.eim swaps the backend (detectors.py);
+    # the ONNX default honours $IMG_SIZE / $RESOLUTIONS
+    detector = create_detector(os.environ.get("DETECTOR") or f"onnx:{MODEL_PATH}")
 
-def preprocess(frame):
-    img = cv2.resize(frame, (640, 640))
-    img = img.astype(np.float32) / 255.0
-    img = np.transpose(img, (2, 0, 1))  # HWC -> CHW
-    img = np.expand_dims(img, axis=0)
-    return img
-
-def generate_frames():
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-
-        input_data = preprocess(frame)
-        outputs = sess.run(None, {sess.get_inputs()[0].name: input_data})
-
-        # outputs[0] shape: [1, num_boxes, 6] -> [x1, y1, x2, y2, conf, class]
-        boxes = outputs[0][0]
-        for box in boxes:
-            # Take only the first 6 elements: x1, y1, x2, y2, conf, cls
-            x1, y1, x2, y2, conf, cls = box[:6]
-            if conf > CONF_THRESHOLD:
-                h, w, _ = frame.shape
-                x1 = int(x1 * w / 640)
-                y1 = int(y1 * h / 640)
-                x2 = int(x2 * w / 640)
-                y2 = int(y2 * h / 640)
-                cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                cv2.putText(frame, f"Pencil {conf:.2f}", (x1, y1-5),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
-
-        ret, buffer = cv2.imencode('.jpg', frame)
-        frame_bytes = buffer.tobytes()
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+# Skip the detector while nothing moves; MOTION_GATE=0 runs it on every frame
+gate = MotionGate()
+pred = None
+
+def process(frame):
+    global pred
+    # decoded, NMS-filtered frame-space boxes (or class scores for a classifier)
+    if pred is None or gate.check(frame):
+        pred = detector.detect(frame)
+    draw_prediction(frame, pred, detector)
+    return frame
+
+if WORKERS:
+    # every worker busy on a frame of its own; the pool forks before any thread starts
+    ok, first = cap.read()
+    if not ok:
+        raise RuntimeError("Cannot read from frame source.")
+    pool = InferencePool(MODEL_PATH, first.shape, int(os.environ.get("IMG_SIZE", "640")), WORKERS,
+                         conf_threshold=CONF_THRESHOLD, iou_threshold=IOU_THRESHOLD)
+    pipeline = PooledFramePipeline(cap, pool, lambda frame, dets: draw_detections(frame, dets, "Pencil"))
+else:
+    pipeline = FramePipeline(cap, process)
 
 @app.route('/video')
 def video():
-    return Response(generate_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
+    return Response(pipeline.stream(request.remote_addr), mimetype=MJPEG_MIMETYPE)
+
+@app.route('/video/stats')
+def video_stats():
+    return jsonify(pipeline.hub.stats())
+
+register_metrics_route(app)
 
 if __name__ == "__main__":
+    pipeline.start()
     app.run(host="0.0.0.0", port=5000)
@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""
+detectors.py
+One Detector interface over the robot's inference backends.
+
+    onnx:best.onnx                  YOLOv8 through ONNX Runtime (YoloDetector, or a
+                                    ResolutionSwitcher when $RESOLUTIONS is set)
+    tflite:veggie_model.tflite      TFLite classifier (predict.py) or YOLO export
+    eim:model.eim                   Edge Impulse ImageImpulseRunner (predict_stream_ei*.py)
+    eim-gray:model.eim              Edge Impulse ImpulseRunner fed grayscale features (detect.py)
+
+Every backend takes BGR frames straight from a FrameSource and returns a
+Prediction:
+    detections      yolo_decode.Detections in frame pixels (empty for classifiers)
+    classification  per-label scores, index = label id (None for detectors)
+    latency_s       time spent on this frame (a batch is split evenly)
+Detector.labels names the class ids, and Detector.caps says what a backend
+can do (boxes, classification, native batching, zero-copy input).
+infer(frames) takes a batch; backends without native batching loop.
+
+Scripts choose a backend with create_detector(spec) or add_detector_args()
+(--detector, default $DETECTOR). The same frames through several backends:
+    python detectors.py --source synthetic --detector onnx:best.onnx --detector tflite:veggie_model.tflite
+"""
+
+import argparse
+import collections
+import contextlib
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from metrics import STAGE_SECONDS
+from yolo_decode import Detections, decode, empty_detections
+
+Prediction = collections.namedtuple("Prediction", ["detections", "classification", "latency_s"])
+Capabilities = collections.namedtuple("Capabilities", ["boxes", "classification", "native_batch", "zero_copy"])
+
+DEFAULT_SPEC = os.environ.get("DETECTOR", "onnx:best.onnx")
+
+
+class Detector:
+    """Base class: subclasses set name, labels, caps, input_shape and implement _infer(frames)."""
+
+    name = "base"
+    caps = Capabilities(False, False, False, False)
+    stage_timed = False  # the backend records STAGE_SECONDS itself
+
+    def __init__(self, labels=None):
+        self.labels = list(labels or [])
+        self._timer = STAGE_SECONDS.labels("infer")
+
+    def _infer(self, frames):
+        """list of BGR frames -> list of (Detections, classification)"""
+        raise NotImplementedError
+
+    def infer(self, frames):
+        t0 = time.perf_counter()
+        raw = self._infer(frames)
+        per_frame = (time.perf_counter() - t0) / max(len(frames), 1)
+        if not self.stage_timed:
+            for _ in frames:
+                self._timer.observe(per_frame)
+        return [Prediction(d, c, per_frame) for d, c in raw]
+
+    def detect(self, frame):
+        return self.infer([frame])[0]
+
+    def warmup(self, runs=2, frame_shape=(480, 640, 3)):
+        """A few runs on a blank frame so the first camera frame doesn't pay for lazy init."""
+        blank = np.zeros(frame_shape, dtype=np.uint8)
+        for _ in range(runs):
+            self.infer([blank])
+        return self
+
+    def label(self, class_id):
+        return self.labels[class_id] if 0 <= class_id < len(self.labels) else str(class_id)
+
+    def close(self):
+        pass
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.name}>"
+
+
+class OnnxDetector(Detector):
+    """
+    YOLOv8 ONNX through YoloDetector. Batches run as one ORT call when the
+    export has a dynamic batch axis (multi_camera.BatchDetector).
+    detector : an existing YoloDetector / ResolutionSwitcher to wrap instead of loading model_path
+    """
+
+    name = "onnx"
+    stage_timed = True
+
+    def __init__(self, model_path="best.onnx", conf_threshold=0.3, iou_threshold=0.45, labels=("Pencil",),
+                 profile=None, detector=None, max_batch=4):
+        super().__init__(labels)
+        from resolution_switcher import ResolutionSwitcher, detector_from_env
+
+        self.detector = detector or detector_from_env(model_path, conf_threshold, iou_threshold, profile)
+        self.input_shape = (self.detector.size, self.detector.size, 3)
+        self.max_batch = max_batch
+        self._batcher = None
+        batch = self.detector.sess.get_inputs()[0].shape[0]
+        # a switcher changes size under us, and in-graph NMS rows have no batch index: frame by frame
+        dynamic = (not isinstance(batch, int) and not isinstance(self.detector, ResolutionSwitcher)
+                   and not self.detector.final)
+        self.caps = Capabilities(True, False, dynamic, True)
+
+    def _infer(self, frames):
+        if len(frames) == 1 or not self.caps.native_batch:
+            return [(self.detector.detect(f), None) for f in frames]
+        if self._batcher is None:
+            from multi_camera import BatchDetector
+            self._batcher = BatchDetector(self.detector, self.max_batch)
+        out = []
+        for i in range(0, len(frames), self.max_batch):
+            out += [(d, None) for d in self._batcher.detect_batch(frames[i:i + self.max_batch])]
+        return out
+
+
+def _load_tflite(model_path, threads):
+    try:
+        import tflite_runtime.interpreter as tflite
+        return tflite.Interpreter(model_path=model_path, num_threads=threads)
+    except ImportError:
+        from tensorflow import lite  # full TensorFlow also ships the interpreter
+        return lite.Interpreter(model_path=model_path, num_threads=threads)
+
+
+class TFLiteDetector(Detector):
+    """
+    TFLite model on a stretched, [0, 1]-scaled NHWC frame, as predict.py feeds it.
+    A (1, C) output is a classifier; a (1, 4+C, N) output is decoded as YOLOv8.
+    swap_rb   : feed RGB (YOLO exports); the veggie classifier was trained on BGR frames
+    max_batch : resize the input to this batch so infer() runs up to max_batch
+                frames per invoke (falls back to 1 if the model won't resize)
+    """
+
+    name = "tflite"
+
+    def __init__(self, model_path="veggie_model.tflite", labels=("tomato", "potato"), swap_rb=False,
+                 conf_threshold=0.3, iou_threshold=0.45, threads=None, max_batch=1):
+        super().__init__(labels)
+        self.interpreter = _load_tflite(model_path, threads or os.cpu_count())
+        self._input = self.interpreter.get_input_details()[0]
+        _, h, w, c = self._input["shape"]
+        self.max_batch = 1
+        if max_batch > 1:
+            try:
+                self.interpreter.resize_tensor_input(self._input["index"], [max_batch, h, w, c])
+                self.max_batch = max_batch
+            except (ValueError, RuntimeError) as e:
+                print(f"[WARN] {model_path} has a fixed batch, running crops one by one: {e}")
+        self.interpreter.allocate_tensors()
+        self._output = self.interpreter.get_output_details()[0]
+        self.input_shape = (int(h), int(w), int(c))
+        self.swap_rb = swap_rb
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+        self.yolo = len(self._output["shape"]) == 3
+        self._tensor = np.empty((self.max_batch, h, w, c), dtype=self._input["dtype"])
+        self.caps = Capabilities(self.yolo, not self.yolo, self.max_batch > 1, False)
+
+    def _prepare(self, frame, index=0):
+        h, w, _ = self.input_shape
+        img = cv2.resize(frame, (w, h))
+        if self.swap_rb:
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        if self._tensor.dtype == np.uint8:
+            self._tensor[index] = img
+        else:
+            cv2.multiply(img, 1.0 / 255.0, dst=self._tensor[index], dtype=cv2.CV_32F)
+
+    def _infer(self, frames):
+        from nms import nms
+
+        out = []
+        for i in range(0, len(frames), self.max_batch):
+            chunk = frames[i:i + self.max_batch]
+            for j, frame in enumerate(chunk):
+                self._prepare(frame, j)
+            # a short last chunk runs the whole tensor; the rows past len(chunk) are ignored
+            self.interpreter.set_tensor(self._input["index"], self._tensor)
+            self.interpreter.invoke()
+            output = self.interpreter.get_tensor(self._output["index"])
+            for j, frame in enumerate(chunk):
+                if not self.yolo:
+                    out.append((empty_detections(), output[j].astype(np.float32)))
+                    continue
+                fh, fw = frame.shape[:2]
+                dets = decode(output[j], fw, fh, input_size=self.input_shape[0],
+                              conf_threshold=self.conf_threshold)
+                keep = nms(dets.boxes, dets.scores, dets.class_ids, self.iou_threshold)
+                out.append((Detections(dets.boxes[keep], dets.scores[keep], dets.class_ids[keep]), None))
+        return out
+
+
+class EdgeImpulseDetector(Detector):
+    """
+    Edge Impulse .eim model, classification or object detection.
+    gray=False : ImageImpulseRunner, features from the RGB frame (centre crop to
+                 the model's aspect ratio, then resize), as predict_stream_ei*.py
+    gray=True  : ImpulseRunner with stretched grayscale features in [0, 1], as detect.py
+    Boxes come back in model-input pixels and are mapped to the frame.
+    """
+
+    name = "eim"
+
+    def __init__(self, model_path, gray=False):
+        if not os.access(model_path, os.X_OK):
+            os.chmod(model_path, 0o755)  # .eim files lose +x when copied over
+        if gray:
+            from edge_impulse_linux.runner import ImpulseRunner
+            self.runner = ImpulseRunner(model_path)
+        else:
+            from edge_impulse_linux.image import ImageImpulseRunner
+            self.runner = ImageImpulseRunner(model_path)
+        self.model_info = self.runner.init()
+        params = self.model_info["model_parameters"]
+        super().__init__(params["labels"])
+        self.gray = gray
+        self.name = "eim-gray" if gray else "eim"
+        self.input_shape = (params["image_input_height"], params["image_input_width"], 1 if gray else 3)
+        is_od = params.get("model_type") in ("object_detection", "constrained_object_detection")
+        self.caps = Capabilities(is_od, not is_od, False, False)
+
+    def _crop(self, fw, fh):
+        """(x0, y0, scale) of the region the runner resized into the model input"""
+        h, w = self.input_shape[:2]
+        if self.gray:
+            return 0.0, 0.0, (fw / w, fh / h)
+        side = min(fw / w, fh / h)
+        return (fw - w * side) / 2.0, (fh - h * side) / 2.0, (side, side)
+
+    def _parse(self, res, fw, fh):
+        r = res.get("result", res)
+        scores = None
+        if "classification" in r:
+            scores = np.array([r["classification"].get(l, 0.0) for l in self.labels], dtype=np.float32)
+        boxes = r.get("bounding_boxes") or []
+        if not boxes:
+            return empty_detections(), scores
+        x0, y0, (sx, sy) = self._crop(fw, fh)
+        xyxy = np.array([[x0 + b["x"] * sx, y0 + b["y"] * sy,
+                          x0 + (b["x"] + b["width"]) * sx, y0 + (b["y"] + b["height"]) * sy] for b in boxes],
+                        dtype=np.float32)
+        ids = np.array([self.labels.index(b["label"]) if b["label"] in self.labels else -1 for b in boxes],
+                       dtype=np.int64)
+        return Detections(xyxy, np.array([b["value"] for b in boxes], dtype=np.float32), ids), scores
+
+    def _infer(self, frames):
+        h, w = self.input_shape[:2]
+        out = []
+        for frame in frames:
+            if self.gray:
+                gray = cv2.cvtColor(cv2.resize(frame, (w, h)), cv2.COLOR_BGR2GRAY)
+                features = (np.float32(gray) / 255.0).flatten().tolist()
+            else:
+                got = self.runner.get_features_from_image(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+                features = got[0] if isinstance(got, tuple) else got  # newer SDKs also return the crop
+            out.append(self._parse(self.runner.classify(features), frame.shape[1], frame.shape[0]))
+        return out
+
+    def close(self):
+        self.runner.stop()
+
+
+BACKENDS = {
+    "onnx": OnnxDetector,
+    "tflite": TFLiteDetector,
+    "eim": EdgeImpulseDetector,
+    "eim-gray": lambda path, **kw: EdgeImpulseDetector(path, gray=True, **kw),
+}
+
+
+def create_detector(spec=None, warmup=True, **kwargs):
+    """'backend:path' (default $DETECTOR) -> warmed-up Detector; kwargs go to the adapter."""
+    spec = spec or DEFAULT_SPEC
+    backend, _, path = spec.partition(":")
+    if backend not in BACKENDS or not path:
+        raise ValueError(f"Detector spec must be <backend>:<model path> with backend in {sorted(BACKENDS)}, "
+                         f"got {spec!r}")
+    det = BACKENDS[backend](path, **kwargs)
+    return det.warmup() if warmup else det
+
+
+def add_detector_args(parser, multiple=False):
+    if multiple:
+        parser.add_argument("--detector", action="append", default=None,
+                            help="backend:model (repeat to compare); default $DETECTOR")
+    else:
+        parser.add_argument("--detector", default=DEFAULT_SPEC,
+                            help=f"backend:model with backend in {sorted(BACKENDS)}")
+    return parser
+
+
+def draw_prediction(frame, pred, detector, color=(0, 255, 0)):
+    """Boxes for detectors, the label scores for classifiers."""
+    if len(pred.detections.boxes):
+        with STAGE_SECONDS.labels("draw").time():
+            for (x1, y1, x2, y2), conf, cid in zip(pred.detections.boxes.astype(int), pred.detections.scores,
+                                                   pred.detections.class_ids):
+                cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+                cv2.putText(frame, f"{detector.label(int(cid))} {conf:.2f}", (x1, max(y1 - 5, 0)),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
+    elif pred.classification is not None:
+        y = 30
+        for i, score in enumerate(pred.classification):
+            cv2.putText(frame, f"{detector.label(i)}: {score * 100:.1f}%", (10, y),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
+            y += 30
+    return frame
+
+
+def main():
+    from frame_source import add_source_args, open_source
+
+    parser = argparse.ArgumentParser(description="Compare detector backends on the same frames")
+    add_source_args(parser, default="synthetic")
+    add_detector_args(parser, multiple=True)
+    parser.add_argument("--frames", type=int, default=100)
+    parser.add_argument("--batch", type=int, default=1, help="frames per infer() call")
+    args = parser.parse_args()
+
+    source = open_source(args.source, rate="max", loop=False)
+    frames = []
+    while len(frames) < args.frames:
+        ok, frame = source.read()
+        if not ok:
+            break
+        frames.append(frame)
+    source.release()
+    if not frames:
+        raise RuntimeError(f"No frames from {args.source}")
+
+    print(f"{'backend':<34} {'caps':<18} {'p50 ms':>8} {'fps':>7} {'boxes/frame':>11} {'top class':>12}")
+    for spec in args.detector or [DEFAULT_SPEC]:
+        with contextlib.redirect_stdout(sys.stderr):
+            det = create_detector(spec)
+        latencies, boxes, top = [], 0, collections.Counter()
+        t0 = time.perf_counter()
+        for i in range(0, len(frames), args.batch):
+            for pred in det.infer(frames[i:i + args.batch]):
+                latencies.append(pred.latency_s)
+                boxes += len(pred.detections.boxes)
+                if pred.classification is not None and len(pred.classification):
+                    top[det.label(int(np.argmax(pred.classification)))] += 1
+        wall = time.perf_counter() - t0
+        det.close()
+        caps = "".join(flag for flag, on in zip(("B", "C", "N", "Z"), det.caps) if on) or "-"
+        most = top.most_common(1)[0][0] if top else "-"
+        print(f"{spec:<34} {caps:<18} {np.median(latencies) * 1000:>8.2f} {len(frames) / wall:>7.1f} "
+              f"{boxes / len(frames):>11.2f} {most:>12}")
+    print("caps: B boxes, C classification, N native batch, Z zero-copy input")
+
+
+if __name__ == "__main__":
+    main()
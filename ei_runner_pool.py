@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""
+ei_runner_pool.py
+Several Edge Impulse .eim processes with requests in flight on all of them.
+
+An ImageImpulseRunner talks to one .eim subprocess over a unix socket and waits
+for each reply. predict_stream_ei*.py therefore spend every frame waiting on
+the same round trip: feature extraction, JSON encode, socket send, the model's
+DSP + inference, then the reply. The pool starts `runners` copies of the
+model. Each copy gets one thread that keeps a request in flight. The threads
+spend most of their time blocked in recv(), and the GIL is released while
+they wait, so N processes work on N frames at once. get() returns results in
+submission order through a reorder buffer, as inference_pool.py does for ONNX.
+
+Features are built with numpy instead of the SDK's per-pixel Python loop. They
+are the same values: fit-shortest resize (INTER_AREA), centre crop, and
+0xRRGGBB ints, or gray replicated into all three bytes for grayscale models.
+Frames go in as BGR, straight from the camera.
+
+    pool = EiRunnerPool("model.eim", runners=3)
+    seq = pool.submit(frame)
+    res = pool.get()              # next frame in order: res.frame, res.result, res.latency_s
+    pool.close()
+
+EiPooledFramePipeline streams from the pool the way FramePipeline does from
+a single model (predict_stream_ei*.py with EI_RUNNERS > 1, on a pool built
+with depth=0).
+
+eim_stub.py speaks the same protocol for tests. Throughput against the
+one-runner loop of predict_stream_ei.py:
+    python ei_runner_pool.py --model ./eim_stub.py --runners 1,2,4 --frames 200
+"""
+
+import argparse
+import atexit
+import json
+import math
+import os
+import queue
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from frame_pipeline import FramePipeline
+from metrics import CAMERA_READ_FAILURES, FRAMES, FRAMES_DROPPED, STAGE_SECONDS
+
+DEFAULT_RUNNERS = max(2, (os.cpu_count() or 1) - 1)
+
+
+def image_features(frame, width, height, gray=False):
+    """
+    ImageImpulseRunner.get_features_from_image(rgb) for a BGR frame, vectorized.
+    Returns (features int32 array, cropped BGR image).
+    """
+    fh, fw = frame.shape[:2]
+    factor = max(width / fw, height / fh)
+    rw, rh = int(math.ceil(factor * fw)), int(math.ceil(factor * fh))
+    resized = cv2.resize(frame, (rw, rh), interpolation=cv2.INTER_AREA)
+    x0, y0 = int((rw - width) / 2), int((rh - height) / 2)
+    cropped = resized[y0:y0 + height, x0:x0 + width]
+    if gray:
+        # the SDK converts its RGB input with BGR2GRAY; RGB2GRAY on BGR gives the same values
+        g = cv2.cvtColor(cropped, cv2.COLOR_RGB2GRAY).astype(np.int32)
+        return ((g << 16) | (g << 8) | g).ravel(), cropped
+    px = cropped.astype(np.int32)
+    return ((px[..., 2] << 16) | (px[..., 1] << 8) | px[..., 0]).ravel(), cropped
+
+
+class EimProcess:
+    """One .eim subprocess and its socket: the protocol of edge_impulse_linux.runner.ImpulseRunner."""
+
+    def __init__(self, model_path, timeout=30.0):
+        if not os.access(model_path, os.X_OK):
+            os.chmod(model_path, 0o755)  # .eim files lose +x when copied over
+        self._tempdir = tempfile.mkdtemp(prefix="eim-")
+        path = os.path.join(self._tempdir, "runner.sock")
+        self.proc = subprocess.Popen([os.path.abspath(model_path), path],
+                                     stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        deadline = time.monotonic() + timeout
+        while True:
+            if self.proc.poll() is not None:
+                err = self.proc.stderr.read().decode(errors="replace").strip()
+                self.close()
+                raise RuntimeError(f"{model_path} exited with {self.proc.returncode}: {err}")
+            try:
+                self.sock.connect(path)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.monotonic() > deadline:
+                    self.close()
+                    raise RuntimeError(f"{model_path} did not open its socket in {timeout:.0f}s")
+                time.sleep(0.05)
+        self._id = 0
+        self._buf = b""
+        self.model_info = self.request({"hello": 1})
+
+    def request(self, msg):
+        """Send one message and wait for its reply (dict without id / success)."""
+        self._id += 1
+        msg["id"] = self._id
+        self.sock.sendall(json.dumps(msg).encode("utf-8"))
+        while b"\0" not in self._buf:
+            chunk = self.sock.recv(65536)
+            if not chunk:
+                raise ConnectionError("The .eim process closed its socket")
+            self._buf += chunk
+        data, _, self._buf = self._buf.partition(b"\0")
+        resp = json.loads(data.decode("utf-8"))
+        if not resp.pop("success", False):
+            raise RuntimeError(resp.get("error", "classify failed"))
+        resp.pop("id", None)
+        return resp
+
+    def classify(self, features):
+        return self.request({"classify": features.tolist()})
+
+    def close(self):
+        self.sock.close()
+        if self.proc.poll() is None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(timeout=2)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+        shutil.rmtree(self._tempdir, ignore_errors=True)
+
+
+class EiResult:
+    def __init__(self, seq, frame, resp, runner, t_submit, timings, error=None):
+        self.seq = seq
+        self.frame = frame
+        self.result = (resp or {}).get("result", {})
+        self.timing = (resp or {}).get("timing", {})
+        self.runner = runner
+        self.t_submit = t_submit
+        self.features_s, self.classify_s, self.latency_s = timings
+        self.error = error
+
+
+class EiRunnerPool:
+    """
+    model_path : .eim model, started `runners` times
+    depth      : frames queued for the runners beyond the ones in flight;
+                 submit() blocks (or returns None) past runners + depth.
+                 The default (= runners) keeps the runners fed for the
+                 throughput benchmark; a live stream wants 0, so a frame
+                 never waits behind older ones (EiPooledFramePipeline)
+    """
+
+    def __init__(self, model_path, runners=DEFAULT_RUNNERS, depth=None):
+        self.runners = runners
+        self.slots = runners + (runners if depth is None else depth)
+        self._procs = []
+        try:
+            for _ in range(runners):
+                self._procs.append(EimProcess(model_path))
+        except Exception:
+            for p in self._procs:
+                p.close()
+            raise
+        self.model_info = self._procs[0].model_info
+        params = self.model_info["model_parameters"]
+        self.labels = params["labels"]
+        self.width, self.height = params["image_input_width"], params["image_input_height"]
+        self.gray = params.get("image_channel_count", 3) == 1
+
+        self._tasks = queue.Queue()
+        self._free = threading.Semaphore(self.slots)
+        self._seq = 0
+        self._next = 1          # next seq get() hands out
+        self._submitted = {}    # seq -> t_submit
+        self._finished = {}     # seq -> EiResult
+        self._cond = threading.Condition()
+        self.out_of_order = 0   # completions that overtook an earlier frame
+        self._last_done = 0
+        self._running = True
+        self._timers = {s: STAGE_SECONDS.labels(s) for s in ("preprocess", "infer")}
+        self._threads = [threading.Thread(target=self._run, args=(i,), name=f"eim-{i}", daemon=True)
+                         for i in range(runners)]
+        for t in self._threads:
+            t.start()
+        atexit.register(self.close)
+        print(f"[INFO] Edge Impulse pool: {runners} x {self.model_info['project']['name']} "
+              f"({self.width}x{self.height}{' gray' if self.gray else ''}), {self.slots} frames in flight")
+
+    # ---- submit ----
+    def submit(self, frame, block=True, timeout=None):
+        """Queue a BGR frame (not copied: don't reuse its buffer); returns its seq, or None if full."""
+        if not self._free.acquire(block, timeout):
+            return None
+        with self._cond:
+            self._seq += 1
+            seq = self._seq
+            self._submitted[seq] = time.perf_counter()
+        self._tasks.put((seq, frame))
+        return seq
+
+    def _run(self, index):
+        proc = self._procs[index]
+        while True:
+            task = self._tasks.get()
+            if task is None:
+                return
+            seq, frame = task
+            t0 = time.perf_counter()
+            t1, resp, error = t0, None, None
+            try:
+                features, _ = image_features(frame, self.width, self.height, self.gray)
+                t1 = time.perf_counter()
+                resp = proc.classify(features)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            t2 = time.perf_counter()
+            self._timers["preprocess"].observe(t1 - t0)
+            self._timers["infer"].observe(t2 - t1)
+            with self._cond:
+                t_submit = self._submitted[seq]
+                if seq < self._last_done:
+                    self.out_of_order += 1
+                self._last_done = max(self._last_done, seq)
+                self._finished[seq] = EiResult(seq, frame, resp, index, t_submit, (t1 - t0, t2 - t1, 0.0), error)
+                self._cond.notify_all()
+
+    # ---- results ----
+    def get(self, timeout=None):
+        """Next EiResult in submission order, or None on timeout."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._next in self._finished, timeout):
+                return None
+            res = self._finished.pop(self._next)
+            del self._submitted[self._next]
+            self._next += 1
+        self._free.release()
+        res.latency_s = time.perf_counter() - res.t_submit
+        FRAMES.labels("inferred").inc()
+        return res
+
+    @property
+    def in_flight(self):
+        with self._cond:
+            return self._seq - self._next + 1
+
+    def close(self):
+        if not self._running:
+            return
+        self._running = False
+        for _ in self._threads:
+            self._tasks.put(None)
+        for p in self._procs:
+            p.close()  # unblocks a thread stuck in recv()
+        for t in self._threads:
+            t.join(timeout=2)
+
+
+class EiPooledFramePipeline(FramePipeline):
+    """
+    FramePipeline whose inference stage is an EiRunnerPool: the capture thread
+    submits frames (dropping them while the pool is full) and the inference
+    thread annotates results in capture order. Build the pool with depth=0:
+    a queue beyond the runners only fills with frames that are already
+    stale by the time a runner takes them.
+
+    annotate : callable(frame, EiResult) -> frame
+    """
+
+    def __init__(self, cap, pool, annotate, **kwargs):
+        super().__init__(cap, process=None, **kwargs)
+        self.pool = pool
+        self.annotate = annotate
+
+    def _capture_loop(self):
+        read_time = STAGE_SECONDS.labels("capture")
+        captured = FRAMES.labels("captured")
+        dropped = FRAMES_DROPPED.labels("infer")
+        while self._running:
+            t0 = time.perf_counter()
+            ret, frame = self.cap.read()
+            if not ret:
+                CAMERA_READ_FAILURES.inc()
+                time.sleep(0.01)
+                continue
+            read_time.observe(time.perf_counter() - t0)
+            self.counts["captured"] += 1
+            captured.inc()
+            if self.pool.submit(frame, block=False) is None:
+                dropped.inc()
+
+    def _infer_loop(self):
+        process_time = STAGE_SECONDS.labels("process")
+        while self._running:
+            res = self.pool.get(timeout=0.5)
+            if res is None:
+                continue
+            if res.error:
+                print(f"[ERROR] Runner {res.runner} failed:", res.error)
+                continue
+            t0 = time.perf_counter()
+            frame = self.annotate(res.frame, res)
+            process_time.observe(res.classify_s + time.perf_counter() - t0)
+            self.annotated.put((res.t_submit, frame))
+            self.counts["inferred"] += 1
+
+    def stop(self):
+        super().stop()
+        self.pool.close()
+
+
+def run_single(model_path, frames, n):
+    """The predict_stream_ei.py loop: one runner, features + classify per frame. (frames/s, latency s)"""
+    try:
+        from edge_impulse_linux.image import ImageImpulseRunner
+    except ImportError:
+        ImageImpulseRunner = None
+
+    latencies = []
+    if ImageImpulseRunner is not None:
+        runner = ImageImpulseRunner(model_path)
+        runner.init()
+        classify = lambda f: runner.classify(runner.get_features_from_image(cv2.cvtColor(f, cv2.COLOR_BGR2RGB)))
+        close = runner.stop
+    else:
+        proc = EimProcess(model_path)
+        params = proc.model_info["model_parameters"]
+        size = (params["image_input_width"], params["image_input_height"], params["image_channel_count"] == 1)
+        classify = lambda f: proc.classify(image_features(f, *size)[0])
+        close = proc.close
+    try:
+        for f in frames[:5]:
+            classify(f)
+        t0 = time.perf_counter()
+        for i in range(n):
+            t = time.perf_counter()
+            classify(frames[i % len(frames)])
+            latencies.append(time.perf_counter() - t)
+        wall = time.perf_counter() - t0
+    finally:
+        close()
+    return n / wall, float(np.mean(latencies)), ImageImpulseRunner is not None
+
+
+def run(pool, frames, n):
+    """Keep every slot busy for n frames; returns (frames/s, mean latency s)"""
+    latencies = []
+    i = 0
+    t0 = time.perf_counter()
+    for _ in range(min(pool.slots, n)):
+        pool.submit(frames[i % len(frames)])
+        i += 1
+    last_seq = None
+    for _ in range(n):
+        res = pool.get(timeout=30)
+        if res is None:
+            raise RuntimeError("Timed out waiting for a runner")
+        if res.error:
+            raise RuntimeError(res.error)
+        if last_seq is not None and res.seq != last_seq + 1:
+            raise RuntimeError("Results left the reorder buffer out of order")
+        last_seq = res.seq
+        latencies.append(res.latency_s)
+        if i < n:
+            pool.submit(frames[i % len(frames)])
+            i += 1
+    wall = time.perf_counter() - t0
+    return n / wall, float(np.mean(latencies))
+
+
+def main():
+    from frame_source import add_source_args, open_source
+
+    parser = argparse.ArgumentParser(description="Edge Impulse runner pool vs the one-runner loop")
+    add_source_args(parser, default="synthetic")
+    parser.add_argument("--model", default="./eim_stub.py", help=".eim model (default: the local stub)")
+    parser.add_argument("--runners", default=",".join(str(n) for n in sorted({1, 2, DEFAULT_RUNNERS})))
+    parser.add_argument("--frames", type=int, default=200)
+    args = parser.parse_args()
+
+    source = open_source(args.source, rate="max", loop=False)
+    frames = []
+    while len(frames) < 50:
+        ok, frame = source.read()
+        if not ok:
+            break
+        frames.append(frame)
+    source.release()
+    if not frames:
+        raise RuntimeError(f"No frames from {args.source}")
+
+    base, base_latency, sdk = run_single(args.model, frames, args.frames)
+    print(f"[BENCH] {os.cpu_count()} cores, {args.frames} frames {frames[0].shape[1]}x{frames[0].shape[0]}, "
+          f"model {args.model}")
+    print(f"  one runner, synchronous ({'SDK' if sdk else 'SDK-equivalent'})  {base:7.1f} frames/s  "
+          f"latency {base_latency * 1000:.1f}ms")
+    for n in [int(v) for v in args.runners.split(",")]:
+        pool = EiRunnerPool(args.model, runners=n)
+        try:
+            run(pool, frames, min(args.frames, 4 * pool.slots))  # warm-up
+            fps, latency = run(pool, frames, args.frames)
+        finally:
+            pool.close()
+        print(f"  pool, {n} runner{'s' if n > 1 else ' '}                      {fps:7.1f} frames/s  "
+              f"x{fps / base:.2f}  latency {latency * 1000:.1f}ms  out-of-order completions {pool.out_of_order}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+eim_stub.py
+Stand-in for an Edge Impulse .eim model, for testing without the real binary
+(like arduino_sim.py for the arm). It speaks the same socket protocol that
+edge_impulse_linux.runner uses:
+
+    <model> <socket path>       the runner starts the model with a unix socket path
+    {"hello": 1, "id": 1}       -> model_parameters / project
+    {"classify": [...], "id": 2} -> result / timing
+Requests are bare JSON objects and each response ends with a NUL byte.
+
+Classification scores come from the pixels (the "tomato" score is the share of
+red in the image, "potato" the rest), so tests can tell results apart.
+Set EIM_STUB_MODEL=object_detection to get one box around the reddest pixels
+instead. EIM_STUB_DELAY_MS (default 25) is how long a classify takes. That is
+slept, so several stubs on one core still overlap the way real .eim processes
+on separate cores do.
+
+    chmod +x eim_stub.py
+    python ei_runner_pool.py --model ./eim_stub.py --runners 1,2,4
+    EI_MODEL=./eim_stub.py EI_RUNNERS=2 python predict_stream_ei.py --source synthetic
+"""
+
+import json
+import os
+import socket
+import sys
+import time
+
+import numpy as np
+
+WIDTH = int(os.environ.get("EIM_STUB_SIZE", "96"))
+HEIGHT = WIDTH
+CHANNELS = int(os.environ.get("EIM_STUB_CHANNELS", "3"))
+LABELS = os.environ.get("EIM_STUB_LABELS", "tomato,potato").split(",")
+MODEL_TYPE = os.environ.get("EIM_STUB_MODEL", "classification")
+DELAY = float(os.environ.get("EIM_STUB_DELAY_MS", "25")) / 1000.0
+
+
+def hello():
+    return {
+        "model_parameters": {
+            "image_input_width": WIDTH,
+            "image_input_height": HEIGHT,
+            "image_channel_count": CHANNELS,
+            "input_features_count": WIDTH * HEIGHT,
+            "labels": LABELS,
+            "label_count": len(LABELS),
+            "model_type": MODEL_TYPE,
+            "sensor": 3,
+            "image_resize_mode": "fit-shortest",
+            "has_anomaly": 0,
+        },
+        "project": {"name": "eim-stub", "owner": "local", "id": 0, "deploy_version": 1},
+    }
+
+
+def classify(features):
+    t0 = time.perf_counter()
+    pixels = np.asarray(features, dtype=np.int64)
+    if pixels.size != WIDTH * HEIGHT:
+        raise ValueError(f"Expected {WIDTH * HEIGHT} features, got {pixels.size}")
+    r = (pixels >> 16) & 0xFF
+    g = (pixels >> 8) & 0xFF
+    b = pixels & 0xFF
+    red = float(r.sum()) / max(float(r.sum() + g.sum() + b.sum()), 1.0)
+    time.sleep(max(0.0, DELAY - (time.perf_counter() - t0)))
+
+    if MODEL_TYPE == "classification":
+        scores = [red] + [(1.0 - red) / max(len(LABELS) - 1, 1)] * (len(LABELS) - 1)
+        result = {"classification": dict(zip(LABELS, scores))}
+    else:
+        redness = (r - (g + b) // 2).reshape(HEIGHT, WIDTH)
+        ys, xs = np.nonzero(redness > 60)
+        boxes = []
+        if len(xs):
+            boxes.append({"label": LABELS[0], "value": round(min(1.0, red * 2), 4),
+                          "x": int(xs.min()), "y": int(ys.min()),
+                          "width": int(xs.max() - xs.min() + 1), "height": int(ys.max() - ys.min() + 1)})
+        result = {"bounding_boxes": boxes}
+    ms = int((time.perf_counter() - t0) * 1000)
+    return {"result": result, "timing": {"dsp": 0, "classification": ms, "anomaly": 0}}
+
+
+def serve(conn):
+    decoder = json.JSONDecoder()
+    buf = ""
+    while True:
+        chunk = conn.recv(65536)
+        if not chunk:
+            return
+        buf += chunk.decode("utf-8")
+        while buf:
+            try:
+                msg, end = decoder.raw_decode(buf)
+            except ValueError:
+                break  # incomplete: wait for the rest
+            buf = buf[end:].lstrip()
+            try:
+                if "hello" in msg:
+                    resp = hello()
+                elif "classify" in msg:
+                    resp = classify(msg["classify"])
+                else:
+                    raise ValueError(f"Unknown message {sorted(msg)}")
+                resp["success"] = True
+            except Exception as e:
+                resp = {"success": False, "error": str(e)}
+            resp["id"] = msg.get("id")
+            conn.sendall(json.dumps(resp).encode("utf-8") + b"\0")
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(f"usage: {sys.argv[0]} <socket path>", file=sys.stderr)
+        sys.exit(1)
+    path = sys.argv[1]
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen(1)
+    try:
+        conn, _ = server.accept()
+        with conn:
+            serve(conn)
+    finally:
+        server.close()
+        os.unlink(path)
+
+
+if __name__ == "__main__":
+    main()
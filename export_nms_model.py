@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+export_nms_model.py
+Append box decoding, the confidence filter and NonMaxSuppression to the
+YOLOv8 ONNX graph, so ORT returns final detections instead of the raw
+(1, 4+C, 8400) tensor.
+
+The appended graph:
+    (1, 4+C, N) -> boxes (1, N, 4) cx,cy,w,h  +  scores (1, C, N)
+    scores of all but each candidate's best class -> 0   (one class per box,
+                                                         like yolo_decode)
+    TopK: the top_k best candidates only                 (like nms.py's top_k)
+    NonMaxSuppression(center_point_box=1, iou, conf, max_det per class)
+    GatherND the kept boxes / scores, cx,cy,w,h -> x1,y1,x2,y2
+    TopK: best max_det overall, highest score first
+    -> "detections" (K, 6): x1, y1, x2, y2, score, class   K <= max_det
+Coordinates stay in model-input pixels, so YoloDetector only undoes the
+letterbox on K rows (yolo_decode.decode_final). Layout questions (are the
+rows transposed, are the coordinates normalized) are answered once here,
+by running the model on a test image, not on every frame.
+Boxes are clipped to the frame after NMS rather than before, so a few boxes
+that run off the frame edge can survive that Python NMS would have merged.
+conf / iou / max_det / top_k are fixed at export and recorded in the model metadata.
+The input batch is fixed to 1, the shape the YoloDetector path runs.
+
+    python export_nms_model.py --model best.onnx [--out best.nms.onnx] [--conf 0.3 --iou 0.45 --max-det 100]
+then point the scripts at best.nms.onnx. The tool also compares the new
+model with best.onnx + Python decode / NMS on a few frames (agreement,
+latency per stage).
+"""
+
+import argparse
+import contextlib
+import os
+import sys
+import time
+
+import numpy as np
+import onnx
+from onnx import TensorProto, helper, numpy_helper
+
+from yolo_decode import FINAL_OUTPUT
+
+CONF_THRESHOLD = 0.30
+NMS_IOU = 0.45
+MAX_DET = 100
+TOP_K = 1000
+
+
+def _dims(value_info):
+    return [d.dim_value if d.HasField("dim_value") else (d.dim_param or None)
+            for d in value_info.type.tensor_type.shape.dim]
+
+
+def _probe(model_path, size):
+    """(transposed, normalized) from one run on a mid-gray image"""
+    import onnxruntime as ort
+
+    sess = ort.InferenceSession(model_path, providers=["CPUExecutionProvider"])
+    inp = sess.get_inputs()[0]
+    out = sess.run(None, {inp.name: np.full((1, 3, size, size), 0.5, dtype=np.float32)})[0][0]
+    transposed = out.shape[0] > out.shape[1]  # (N, 4+C) exports
+    if transposed:
+        out = out.T
+    return transposed, bool(out[:4].max() <= 1.0 + 1e-6)
+
+
+def add_nms(model, size, conf=CONF_THRESHOLD, iou=NMS_IOU, max_det=MAX_DET, top_k=TOP_K, transposed=False,
+            normalized=False):
+    """Returns a copy of model whose only output is FINAL_OUTPUT (K, 6)."""
+    model = onnx.ModelProto.FromString(model.SerializeToString())
+    g = model.graph
+    opset = next(o.version for o in model.opset_import if o.domain in ("", "ai.onnx"))
+    if opset < 11:
+        raise ValueError(f"NonMaxSuppression needs opset >= 11, the model has {opset}")
+    raw = g.output[0]
+    rows = _dims(raw)[2 if transposed else 1]
+    if not isinstance(rows, int) or rows < 5:
+        raise ValueError(f"Can't read the class count from output shape {_dims(raw)}")
+    n_cls = rows - 4
+
+    # batch 1 in and out, as the YoloDetector path runs it
+    for vi in (g.input[0], raw):
+        vi.type.tensor_type.shape.dim[0].Clear()
+        vi.type.tensor_type.shape.dim[0].dim_value = 1
+
+    nodes, inits = [], []
+
+    def const(name, value, dtype=np.float32):
+        inits.append(numpy_helper.from_array(np.asarray(value, dtype=dtype), f"nms_{name}"))
+        return f"nms_{name}"
+
+    def node(op, inputs, name, **attrs):
+        nodes.append(helper.make_node(op, inputs, [f"nms_{name}"], name=f"nms_{name}", **attrs))
+        return f"nms_{name}"
+
+    pred = raw.name
+    if transposed:
+        pred = node("Transpose", [pred], "pred", perm=[0, 2, 1])
+    xywh = node("Slice", [pred, const("s0", [0], np.int64), const("s4", [4], np.int64),
+                          const("axis1", [1], np.int64)], "xywh")
+    if normalized:
+        xywh = node("Mul", [xywh, const("size", float(size))], "xywh_px")
+    scores = node("Slice", [pred, "nms_s4", const("s4c", [4 + n_cls], np.int64), "nms_axis1"], "scores")
+    if n_cls > 1:
+        if opset >= 18:
+            best = node("ReduceMax", [scores, "nms_axis1"], "best", keepdims=1)
+        else:
+            best = node("ReduceMax", [scores], "best", axes=[1], keepdims=1)
+        is_best = node("Cast", [node("Equal", [scores, best], "is_best_b")], "is_best", to=TensorProto.FLOAT)
+        scores = node("Mul", [scores, is_best], "scores_best")
+        best = node("Squeeze" if opset >= 13 else "Reshape",
+                    [best, "nms_axis1" if opset >= 13 else const("flat", [1, -1], np.int64)], "best_flat")
+    else:
+        best = node("Reshape", [scores, const("flat", [1, -1], np.int64)], "best_flat")
+    boxes = node("Transpose", [xywh], "boxes", perm=[0, 2, 1])
+    if top_k:
+        # bound the NMS input like nms.py does; cheap next to NMS on thousands of weak boxes
+        n = node("Shape", [best], "n_all")
+        k = node("Min", [node("Slice", [n, "nms_axis1", const("s_end", [2], np.int64)], "n"),
+                         const("top_k", [top_k], np.int64)], "k_pre")
+        nodes.append(helper.make_node("TopK", [best, k], ["nms_pre_scores", "nms_pre"], name="nms_pre_topk",
+                                      axis=1, largest=1, sorted=0))
+        order = node("Squeeze" if opset >= 13 else "Reshape",
+                     ["nms_pre", const("axis0", [0], np.int64) if opset >= 13 else const("flat1", [-1], np.int64)],
+                     "pre_idx")
+        scores = node("Gather", [scores, order], "scores_top", axis=2)
+        boxes = node("Gather", [boxes, order], "boxes_top", axis=1)
+    selected = node("NonMaxSuppression",
+                    [boxes, scores, const("max_det", [max_det], np.int64), const("iou", [iou]),
+                     const("conf", [conf])], "selected", center_point_box=1)
+
+    # selected (K, 3) = [batch, class, box]
+    sel_box = node("Gather", [selected, const("i02", [0, 2], np.int64)], "sel_box", axis=1)
+    kept = node("GatherND", [boxes, sel_box], "kept")                         # (K, 4) cx,cy,w,h
+    kept_scores = node("GatherND", [scores, selected], "kept_scores")         # (K,)
+    kept_cls = node("Gather", [selected, const("i1", [1], np.int64)], "kept_cls", axis=1)  # (K, 1)
+
+    k = node("Min", [node("Shape", [kept_scores], "k_all"), "nms_max_det"], "k")
+    top_scores, top = "nms_top_scores", "nms_top"
+    nodes.append(helper.make_node("TopK", [kept_scores, k], [top_scores, top], name="nms_topk", axis=0,
+                                  largest=1, sorted=1))
+    kept = node("Gather", [kept, top], "top_boxes", axis=0)
+    xy = node("Slice", [kept, "nms_s0", const("s2", [2], np.int64), "nms_axis1"], "xy")
+    wh = node("Slice", [kept, "nms_s2", "nms_s4", "nms_axis1"], "wh")
+    half = node("Mul", [wh, const("half", 0.5)], "half_wh")
+    cls = node("Cast", [node("Gather", [kept_cls, top], "top_cls", axis=0)], "cls_f", to=TensorProto.FLOAT)
+    col = node("Reshape", [top_scores, const("col", [-1, 1], np.int64)], "score_col")
+    nodes.append(helper.make_node("Concat", [node("Sub", [xy, half], "x1y1"), node("Add", [xy, half], "x2y2"),
+                                             col, cls], [FINAL_OUTPUT], name="nms_detections", axis=1))
+
+    g.node.extend(nodes)
+    g.initializer.extend(inits)
+    del g.output[:]
+    g.output.append(helper.make_tensor_value_info(FINAL_OUTPUT, TensorProto.FLOAT, ["detections", 6]))
+    for key, value in {"postprocess": "nms", "conf_threshold": conf, "iou_threshold": iou,
+                       "max_det": max_det, "top_k": top_k, "classes": n_cls, "input_size": size}.items():
+        model.metadata_props.append(onnx.StringStringEntryProto(key=key, value=str(value)))
+    onnx.checker.check_model(model)
+    return model
+
+
+def compare(raw_path, final_path, size, source, n, conf=CONF_THRESHOLD, iou=NMS_IOU):
+    """Agreement and per-stage latency: best.onnx + Python decode / NMS vs the exported model."""
+    from frame_source import open_source
+    from quantize_model import agreement
+    from yolo_detector import YoloDetector
+
+    src = open_source(source, rate="max", loop=False)
+    frames = []
+    while len(frames) < n:
+        ok, frame = src.read()
+        if not ok:
+            break
+        frames.append(frame)
+    src.release()
+
+    with contextlib.redirect_stdout(sys.stderr):
+        raw = YoloDetector(raw_path, size, conf, iou)
+        final = YoloDetector(final_path, size, conf, iou)
+    stats = {}
+    matched = n_ref = n_test = 0
+    for name, det in (("python", raw), ("in-graph", final)):
+        ms = {s: [] for s in ("infer", "decode", "nms")}
+        results = []
+        for frame in frames:
+            det.preprocess(frame)
+            t0 = time.perf_counter()
+            out = det.infer()
+            t1 = time.perf_counter()
+            dets = det.decode(out)
+            t2 = time.perf_counter()
+            dets = det.nms(dets)
+            t3 = time.perf_counter()
+            for s, dt in zip(ms, (t1 - t0, t2 - t1, t3 - t2)):
+                ms[s].append(dt * 1000.0)
+            results.append((dets.boxes, dets.class_ids))
+        stats[name] = ({s: float(np.median(v)) for s, v in ms.items()}, results)
+    for ref, test in zip(stats["python"][1], stats["in-graph"][1]):
+        m, r, t = agreement(ref, test)
+        matched, n_ref, n_test = matched + m, n_ref + r, n_test + t
+    f1 = 2 * matched / (n_ref + n_test) if n_ref + n_test else 1.0
+
+    print(f"{'post-processing':<16} {'infer ms':>9} {'decode ms':>10} {'nms ms':>8} {'total ms':>9}")
+    for name, (ms, _) in stats.items():
+        print(f"{name:<16} {ms['infer']:>9.2f} {ms['decode']:>10.3f} {ms['nms']:>8.3f} {sum(ms.values()):>9.2f}")
+    print(f"[INFO] {len(frames)} frames, {n_ref} vs {n_test} boxes, agreement F1 {f1:.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Append decode + NMS to a YOLOv8 ONNX model")
+    parser.add_argument("--model", default="best.onnx")
+    parser.add_argument("--out", default="", help="default: <model>.nms.onnx")
+    parser.add_argument("--size", type=int, default=0, help="input size (default: from the model)")
+    parser.add_argument("--conf", type=float, default=CONF_THRESHOLD)
+    parser.add_argument("--iou", type=float, default=NMS_IOU)
+    parser.add_argument("--max-det", type=int, default=MAX_DET)
+    parser.add_argument("--top-k", type=int, default=TOP_K, help="candidates entering NMS (0 = all)")
+    parser.add_argument("--normalized", choices=("auto", "yes", "no"), default="auto",
+                        help="box rows in [0, 1] instead of input pixels")
+    parser.add_argument("--compare", default="synthetic", help="frame source to compare on ('' to skip)")
+    parser.add_argument("--frames", type=int, default=50)
+    args = parser.parse_args()
+
+    model = onnx.load(args.model)
+    size = args.size or _dims(model.graph.input[0])[2]
+    if not isinstance(size, int):
+        parser.error("The model has a dynamic input size; pass --size")
+    transposed, normalized = _probe(args.model, size)
+    if args.normalized != "auto":
+        normalized = args.normalized == "yes"
+    out = args.out or os.path.splitext(args.model)[0] + ".nms.onnx"
+
+    final = add_nms(model, size, args.conf, args.iou, args.max_det, args.top_k, transposed, normalized)
+    onnx.save(final, out)
+    print(f"[INFO] {out}: {size}x{size}, {'(N, 4+C)' if transposed else '(4+C, N)'} rows, "
+          f"{'normalized' if normalized else 'pixel'} boxes -> {FINAL_OUTPUT} (K<={args.max_det}, 6), "
+          f"conf {args.conf} iou {args.iou}")
+    if args.compare:
+        compare(args.model, out, size, args.compare, args.frames, args.conf, args.iou)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+frame_pipeline.py
+Threaded capture -> inference -> encode pipeline for the Flask streamers.
+
+Each stage runs in its own thread and hands work to the next one through a
+LatestSlot: a single-slot buffer where a new item overwrites the old one.
+A slow stage therefore never builds a backlog; it just skips to the newest
+frame, and the stale ones are counted as dropped. Camera I/O, ONNX Runtime
+and cv2.imencode all release the GIL, so the stages overlap on the Pi's
+cores instead of running back to back inside the Flask generator.
+
+The encode stage publishes each JPEG once to an MjpegHub, which fans it
+out to every connected viewer.
+
+Stage times, frame counts and drops are also recorded in metrics.py for the
+/metrics route; a slow camera read shows up as stage="capture". The periodic
+[PIPE] line includes the process CPU, with or without viewers, so idle and
+streaming cost can be read off the same log.
+
+Usage:
+    pipeline = FramePipeline(cap, process)   # process(frame) -> annotated frame
+    pipeline.start()
+    Response(pipeline.stream(), mimetype=MJPEG_MIMETYPE)
+"""
+
+import collections
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from latest_slot import LatestSlot
+from metrics import CAMERA_READ_FAILURES, FRAMES, FRAMES_DROPPED, STAGE_SECONDS, CpuMeter
+from mjpeg_hub import MjpegHub
+
+
+class FramePipeline:
+    """
+    cap     : anything with read() -> (ok, frame), e.g. cv2.VideoCapture
+    process : callable(frame) -> annotated frame (inference + drawing)
+    hub     : MjpegHub the encoded frames are broadcast on (one is created if None)
+    """
+
+    def __init__(self, cap, process, hub=None, jpeg_quality=80, report_every=10.0):
+        self.cap = cap
+        self.process = process
+        self.hub = hub or MjpegHub()
+        self.encode_params = [int(cv2.IMWRITE_JPEG_QUALITY), int(jpeg_quality)]
+        self.report_every = report_every
+
+        self.raw = LatestSlot()        # (t_capture, frame)
+        self.annotated = LatestSlot()  # (t_capture, frame)
+
+        self.latencies = collections.deque(maxlen=300)
+        self.counts = {"captured": 0, "inferred": 0, "encoded": 0}
+        self._encode_time = STAGE_SECONDS.labels("encode")
+        self._latency = STAGE_SECONDS.labels("capture_to_jpeg")
+        self._encoded = FRAMES.labels("encoded")
+        self._cpu = CpuMeter()
+        self._running = False
+        self._threads = []
+
+    # ---- stages ----
+    def _capture_loop(self):
+        read_time = STAGE_SECONDS.labels("capture")
+        captured = FRAMES.labels("captured")
+        while self._running:
+            t0 = time.perf_counter()
+            ret, frame = self.cap.read()
+            if not ret:
+                CAMERA_READ_FAILURES.inc()
+                time.sleep(0.01)
+                continue
+            # read() returning is the closest we get to the sensor timestamp,
+            # so capture->jpeg latency is our glass-to-glass estimate
+            t_cap = time.perf_counter()
+            read_time.observe(t_cap - t0)
+            self.raw.put((t_cap, frame))
+            self.counts["captured"] += 1
+            captured.inc()
+
+    def _infer_loop(self):
+        process_time = STAGE_SECONDS.labels("process")
+        inferred = FRAMES.labels("inferred")
+        dropped = FRAMES_DROPPED.labels("infer")
+        seq = 0
+        while self._running:
+            new_seq, item = self.raw.get(seq, timeout=0.5)
+            if item is None:
+                continue
+            if seq and new_seq - seq > 1:
+                dropped.inc(new_seq - seq - 1)
+            seq = new_seq
+            t_cap, frame = item
+            t0 = time.perf_counter()
+            try:
+                frame = self.process(frame)
+            except Exception as e:
+                print("[ERROR] Inference stage failed:", e)
+                continue
+            process_time.observe(time.perf_counter() - t0)
+            self.annotated.put((t_cap, frame))
+            self.counts["inferred"] += 1
+            inferred.inc()
+
+    def _encode_loop(self):
+        dropped = FRAMES_DROPPED.labels("encode")
+        seq = 0
+        last_encoded = 0  # frames skipped with no viewers aren't drops
+        last_report = time.perf_counter()
+        while self._running:
+            now = time.perf_counter()
+            if self.report_every and now - last_report >= self.report_every:
+                last_report = now
+                self.print_stats()
+            seq, item = self.annotated.get(seq, timeout=0.5)
+            if item is None:
+                continue
+            if not self.hub.has_clients:
+                last_encoded = 0
+                continue  # nobody watching, skip the encode
+            if last_encoded and seq - last_encoded > 1:
+                dropped.inc(seq - last_encoded - 1)
+            last_encoded = seq
+            self._publish(*item)
+
+    def _publish(self, t_cap, frame):
+        """Encode one annotated frame and broadcast it to the viewers."""
+        t0 = time.perf_counter()
+        ok, buf = cv2.imencode('.jpg', frame, self.encode_params)
+        if not ok:
+            return
+        self.hub.publish(buf.tobytes())
+        now = time.perf_counter()
+        self._encode_time.observe(now - t0)
+        self._latency.observe(now - t_cap)
+        self.latencies.append(now - t_cap)
+        self.counts["encoded"] += 1
+        self._encoded.inc()
+
+    # ---- control ----
+    def start(self):
+        if self._running:
+            return self
+        self._running = True
+        self._threads = [
+            threading.Thread(target=self._capture_loop, name="capture", daemon=True),
+            threading.Thread(target=self._infer_loop, name="infer", daemon=True),
+            threading.Thread(target=self._encode_loop, name="encode", daemon=True),
+        ]
+        for t in self._threads:
+            t.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        for slot in (self.raw, self.annotated):
+            slot.close()
+        self.hub.close()
+        for t in self._threads:
+            t.join(timeout=2)
+
+    def stream(self, name=None, max_fps=None):
+        """Generator for one Flask multipart response, see MjpegHub.subscribe()."""
+        return self.hub.subscribe(name, max_fps=max_fps)
+
+    # ---- reporting ----
+    def stats(self):
+        lat = np.array(self.latencies) * 1000.0
+        return {
+            **self.counts,
+            "dropped_before_infer": self.raw.dropped,
+            "dropped_before_encode": self.annotated.dropped,
+            "latency_ms_p50": float(np.percentile(lat, 50)) if lat.size else None,
+            "latency_ms_p95": float(np.percentile(lat, 95)) if lat.size else None,
+        }
+
+    def print_stats(self):
+        s = self.stats()
+        cpu = self._cpu.percent()  # since the previous report
+        if not self.hub.has_clients or s["latency_ms_p50"] is None:
+            print(f"[PIPE] captured={s['captured']} inferred={s['inferred']} no viewers, cpu={cpu:.0f}%")
+            return
+        print(f"[PIPE] captured={s['captured']} inferred={s['inferred']} encoded={s['encoded']} "
+              f"dropped={s['dropped_before_infer']}/{s['dropped_before_encode']} "
+              f"capture->jpeg p50={s['latency_ms_p50']:.1f}ms p95={s['latency_ms_p95']:.1f}ms cpu={cpu:.0f}%")
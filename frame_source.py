@@ -0,0 +1,242 @@
+"""
+frame_source.py
+Pluggable frame sources so every script can run without a real camera.
+
+All sources mimic the part of cv2.VideoCapture the scripts use
+(read() -> (ok, frame), isOpened(), release()), so they drop in for `cap`.
+Like VideoCapture.read(image), read(buf) fills a caller's buffer of the
+frame's shape (e.g. a shared-memory slot of inference_pool.py), straight
+from the decoder for cameras and video files.
+
+Source URIs:
+    0, 1, /dev/video0, v4l2:0      V4L2 camera
+    clip.mp4, file:clip.mp4        video file (loops by default)
+    data/pencil, dir:data/pencil   directory of .jpg/.jpeg/.png images (sorted, loops)
+    synthetic, synthetic:640x480   generated frames with moving pencil-like bars
+
+Rate control:
+    realtime   camera: as delivered; video: its own FPS; images/synthetic: 30 FPS
+    max        as fast as read() is called
+    <number>   fixed FPS, e.g. 15
+
+Scripts read the URI from --source / --rate on the command line, falling back
+to $FRAME_SOURCE / $FRAME_RATE and finally camera 0.
+"""
+
+import argparse
+import glob
+import os
+import time
+
+import cv2
+import numpy as np
+
+VIDEO_EXTS = (".mp4", ".avi", ".mkv", ".mov", ".h264", ".mjpeg", ".webm")
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp")
+DEFAULT_FPS = 30.0
+
+
+class FrameSource:
+    """Base class: subclasses implement _read(); rate control lives here."""
+
+    native_fps = None  # FPS "realtime" means for this source, None = don't pace
+
+    def __init__(self, rate="realtime"):
+        self.rate = rate
+        self._interval = None
+        self._next = None
+        self.frames_read = 0
+
+    def _setup_rate(self):
+        if self.rate in (None, "max"):
+            fps = None
+        elif self.rate == "realtime":
+            fps = self.native_fps
+        else:
+            fps = float(self.rate)
+        self._interval = 1.0 / fps if fps else None
+
+    def _pace(self):
+        if self._interval is None:
+            return
+        now = time.perf_counter()
+        if self._next is None or now - self._next > self._interval:
+            self._next = now  # fell behind (or first frame): don't try to catch up
+        elif self._next > now:
+            time.sleep(self._next - now)
+        self._next += self._interval
+
+    def read(self, image=None):
+        ok, frame = self._read(image)
+        if ok:
+            if image is not None and frame is not image and frame.shape == image.shape:
+                np.copyto(image, frame)  # sources that can't decode in place
+                frame = image
+            self._pace()
+            self.frames_read += 1
+        return ok, frame
+
+    def _read(self, image=None):
+        raise NotImplementedError
+
+    def isOpened(self):
+        return True
+
+    def release(self):
+        pass
+
+
+class CameraSource(FrameSource):
+    def __init__(self, device=0, width=None, height=None, rate="realtime"):
+        super().__init__(rate)
+        self.cap = cv2.VideoCapture(device, cv2.CAP_V4L2)
+        if not self.cap.isOpened():
+            self.cap = cv2.VideoCapture(device)  # non-V4L2 platforms
+        if width:
+            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        if height:
+            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        self._setup_rate()
+
+    def _read(self, image=None):
+        return self.cap.read(image)
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def release(self):
+        self.cap.release()
+
+
+class VideoFileSource(FrameSource):
+    def __init__(self, path, loop=True, rate="realtime"):
+        super().__init__(rate)
+        self.path = path
+        self.loop = loop
+        self.cap = cv2.VideoCapture(path)
+        self.native_fps = self.cap.get(cv2.CAP_PROP_FPS) or DEFAULT_FPS
+        self._setup_rate()
+
+    def _read(self, image=None):
+        ok, frame = self.cap.read(image)
+        if not ok and self.loop and self.frames_read:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, frame = self.cap.read(image)
+        return ok, frame
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def release(self):
+        self.cap.release()
+
+
+class ImageDirSource(FrameSource):
+    native_fps = DEFAULT_FPS
+
+    def __init__(self, path, loop=True, rate="realtime", width=None, height=None):
+        super().__init__(rate)
+        self.paths = sorted(p for p in glob.glob(os.path.join(path, "**", "*"), recursive=True)
+                            if p.lower().endswith(IMAGE_EXTS))
+        self.loop = loop
+        self.size = (width, height) if width and height else None
+        self._i = 0
+        self._setup_rate()
+
+    def _read(self, image=None):
+        while self.paths:
+            if self._i >= len(self.paths):
+                if not self.loop:
+                    return False, None
+                self._i = 0
+            path = self.paths[self._i]
+            self._i += 1
+            frame = cv2.imread(path)
+            if frame is None:
+                continue
+            if self.size:
+                frame = cv2.resize(frame, self.size)
+            return True, frame
+        return False, None
+
+    def isOpened(self):
+        return bool(self.paths)
+
+
+class SyntheticSource(FrameSource):
+    """
+    Deterministic test pattern: textured background with a few bright bars
+    drifting across it. The ground-truth xyxy boxes of the last frame are in
+    .last_boxes, so benchmarks can score recall without labelled data.
+    """
+
+    native_fps = DEFAULT_FPS
+
+    def __init__(self, width=640, height=480, objects=2, seed=0, rate="realtime"):
+        super().__init__(rate)
+        self.width, self.height = width, height
+        rng = np.random.default_rng(seed)
+        self._background = cv2.GaussianBlur(
+            rng.integers(60, 140, (height, width, 3), dtype=np.uint8), (0, 0), 3)
+        self._pos = rng.uniform([0, 0], [width, height], (objects, 2))
+        self._vel = rng.uniform(-4, 4, (objects, 2))
+        self._size = rng.uniform([80, 12], [160, 24], (objects, 2))
+        self.last_boxes = np.zeros((0, 4), dtype=np.float32)
+        self._setup_rate()
+
+    def _read(self, image=None):
+        if image is not None and image.shape == self._background.shape:
+            frame = image
+            np.copyto(frame, self._background)
+        else:
+            frame = self._background.copy()
+        self._pos = (self._pos + self._vel) % (self.width, self.height)
+        boxes = []
+        for (x, y), (bw, bh) in zip(self._pos, self._size):
+            x1, y1 = int(x), int(y)
+            x2, y2 = min(int(x + bw), self.width - 1), min(int(y + bh), self.height - 1)
+            cv2.rectangle(frame, (x1, y1), (x2, y2), (30, 200, 240), -1)
+            boxes.append((x1, y1, x2, y2))
+        self.last_boxes = np.array(boxes, dtype=np.float32).reshape(-1, 4)
+        return True, frame
+
+
+def open_source(uri="0", rate="realtime", width=None, height=None, loop=True):
+    """Build a FrameSource from a source URI (see module docstring)."""
+    uri = str(uri)
+    kind, _, rest = uri.partition(":") if ":" in uri else ("", "", uri)
+
+    if kind == "synthetic" or uri == "synthetic":
+        if rest and "x" in rest:
+            width, height = (int(v) for v in rest.split("x"))
+        return SyntheticSource(width or 640, height or 480, rate=rate)
+    if kind in ("v4l2", "camera"):
+        return CameraSource(int(rest) if rest.isdigit() else rest, width, height, rate)
+    if kind == "file":
+        return VideoFileSource(rest, loop, rate)
+    if kind == "dir":
+        return ImageDirSource(rest, loop, rate, width, height)
+
+    if uri.isdigit():
+        return CameraSource(int(uri), width, height, rate)
+    if uri.startswith("/dev/video"):
+        return CameraSource(uri, width, height, rate)
+    if os.path.isdir(uri):
+        return ImageDirSource(uri, loop, rate, width, height)
+    if uri.lower().endswith(VIDEO_EXTS) or os.path.isfile(uri):
+        return VideoFileSource(uri, loop, rate)
+    raise ValueError(f"Don't know how to open frame source {uri!r}")
+
+
+def add_source_args(parser, default=None):
+    parser.add_argument("--source", default=default or os.environ.get("FRAME_SOURCE", "0"),
+                        help="camera index, /dev/videoN, video file, image dir or synthetic[:WxH]")
+    parser.add_argument("--rate", default=os.environ.get("FRAME_RATE", "realtime"),
+                        help="realtime, max, or a fixed FPS")
+    return parser
+
+
+def source_from_cli(width=None, height=None, default=None):
+    """Open the source named by --source/--rate, ignoring any other arguments."""
+    args, _ = add_source_args(argparse.ArgumentParser(add_help=False), default).parse_known_args()
+    return open_source(args.source, args.rate, width, height)
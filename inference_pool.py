@@ -0,0 +1,587 @@
+#!/usr/bin/env python3
+"""
+inference_pool.py
+ONNX Runtime in worker processes, with frames and outputs in shared memory.
+
+The pool owns two multiprocessing.shared_memory rings with one slot per
+in-flight frame:
+    frames   slots x (H, W, 3) uint8       written by the parent (or straight
+                                           by cap.read(buf) into acquire()'s buffer)
+    outputs  slots x model output float32  written by ORT itself: each worker
+                                           binds the slot as its IOBinding output
+Only (seq, slot) and a few timings go through the queues, so there is no
+pickling of frames or tensors. Each worker has its own task queue and the
+pool hands a frame to the worker with the fewest queued, so frames finish
+out of order. get() puts them back in submission order through a
+reorder buffer (ordered=False hands them out as they finish). Decoding and
+NMS run in the caller, on the shared output slot. A model from
+export_nms_model.py has a variable-length (K, 6) output, which ORT can't
+write into a fixed slot: its slots are (max_det, 6), the worker copies the
+K rows in, and the caller only rescales them (yolo_decode.decode_final).
+
+Each worker is a separate process with the single-threaded "worker" ORT
+profile, so N workers use N cores without fighting over the GIL or over
+one session's thread pool. Separate task queues also mean a worker that
+dies can't take a shared queue's read lock with it, and the pool knows
+which frames it held. Those come back from get() with .error set, so the
+reorder buffer doesn't stall on them.
+The pool forks its workers; create it before starting other threads (Flask,
+FramePipeline, ArmScheduler).
+
+    pool = InferencePool("best.onnx", frame_shape=(480, 640, 3), workers=4)
+    seq = pool.submit(frame)                 # None if every slot is busy (block=False)
+    res = pool.get()                         # next frame in order
+    draw_detections(res.frame, res.dets); res.release()
+
+submit() queues every frame, which is what a benchmark wants. A live camera
+wants the newest frame instead: submit_latest() hands a frame to a worker
+as soon as one is idle and otherwise parks it, and a newer frame replaces
+the parked one (latest wins, like LatestSlot). No frame ever waits behind
+an older one that hasn't started. PooledFramePipeline runs a FramePipeline
+on top of the pool this way (detect_stream.py does this when
+INFERENCE_WORKERS is set). Throughput vs worker count:
+    python inference_pool.py --model best.onnx --workers 1,2,4 --frames 300
+"""
+
+import argparse
+import atexit
+import contextlib
+import multiprocessing as mp
+import os
+import queue
+import sys
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from frame_pipeline import FramePipeline
+from metrics import CAMERA_READ_FAILURES, FRAMES, FRAMES_DROPPED, STAGE_SECONDS
+from nms import nms
+from yolo_decode import Detections, decode, decode_final, final_thresholds, is_final_output
+
+DEFAULT_WORKERS = max(1, (os.cpu_count() or 1) - 1)  # leave a core for capture / encode / Flask
+
+
+def _output_spec(model_path, size, profile, conf_threshold=None, iou_threshold=None):
+    """
+    (shape, dtype, final) of one output slot; final is True for (K, 6) in-graph
+    NMS models. Also builds the optimized-graph cache once, before the fork.
+    """
+    from ort_session import load_session
+
+    with contextlib.redirect_stdout(sys.stderr):
+        sess, _ = load_session(model_path, profile, warmup_runs=0)
+    out = sess.get_outputs()[0]
+    if is_final_output(sess):
+        meta = final_thresholds(sess, conf_threshold, iou_threshold)
+        if "max_det" not in meta:
+            raise ValueError(f"{model_path} has no max_det metadata; re-export it with export_nms_model.py")
+        dtype = np.float16 if out.type == 'tensor(float16)' else np.float32
+        del sess
+        return (int(meta["max_det"]), 6), dtype, True
+    shape = list(out.shape)
+    if len(shape) != 3:
+        raise ValueError(f"Can't size the output ring for {out.shape}; expected a raw (1, 4+C, N) output")
+    if not isinstance(shape[1], int):
+        raise ValueError(f"Can't size the output ring for {out.shape}; export with a static class count")
+    shape[0] = 1
+    if not isinstance(shape[2], int):
+        shape[2] = sum((size // s) ** 2 for s in (8, 16, 32))  # YOLOv8 anchors at this input size
+    dtype = np.float16 if out.type == 'tensor(float16)' else np.float32
+    del sess
+    return tuple(shape), dtype, False
+
+
+def _worker(index, model_path, size, profile, frame_shm, out_shm, frame_shape, out_shape, out_dtype,
+            final, slots, tasks, done):
+    import onnxruntime as ort
+
+    from ort_session import create_session
+    from preprocess import Preprocessor
+
+    frames_mem = shared_memory.SharedMemory(name=frame_shm)
+    outs_mem = shared_memory.SharedMemory(name=out_shm)
+    frames = np.ndarray((slots,) + frame_shape, dtype=np.uint8, buffer=frames_mem.buf)
+    outs = np.ndarray((slots,) + out_shape, dtype=out_dtype, buffer=outs_mem.buf)
+    try:
+        try:
+            with contextlib.redirect_stdout(sys.stderr if index else sys.stdout):
+                sess = create_session(model_path, profile)
+            pre = Preprocessor(size)
+            io = sess.io_binding()
+            input_value = ort.OrtValue.ortvalue_from_numpy(pre.input)
+            io.bind_ortvalue_input(sess.get_inputs()[0].name, input_value)
+            out_name = sess.get_outputs()[0].name
+            # ORT writes each result straight into its shared output slot
+            out_values = [] if final else [ort.OrtValue.ortvalue_from_numpy(outs[i]) for i in range(slots)]
+        except Exception as e:
+            done.put(("failed", index, repr(e)))
+            return
+        done.put(("ready", index))
+
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            seq, slot = task
+            t0 = time.perf_counter()
+            try:
+                ratio, pad = pre.fill(frames[slot])
+                t1 = time.perf_counter()
+                if final:
+                    # K varies per frame: let ORT allocate, then copy the (at most max_det) rows over
+                    io.bind_output(out_name)
+                    sess.run_with_iobinding(io)
+                    rows = io.copy_outputs_to_cpu()[0]
+                    outs[slot, :len(rows)] = rows
+                    n = len(rows)
+                else:
+                    io.bind_ortvalue_output(out_name, out_values[slot])
+                    sess.run_with_iobinding(io)
+                    n = None
+                done.put((seq, slot, index, ratio, pad, n, t0, t1, time.perf_counter(), None))
+            except Exception as e:
+                done.put((seq, slot, index, 1.0, (0, 0), None, t0, t0, time.perf_counter(), repr(e)))
+    finally:
+        del frames, outs
+        frames_mem.close()
+        outs_mem.close()
+
+
+class PoolResult:
+    def __init__(self, pool, seq, slot, dets, worker, t_submit, timings, error=None):
+        self._pool = pool
+        self.seq = seq
+        self.slot = slot
+        self.dets = dets
+        self.worker = worker
+        self.t_submit = t_submit
+        self.preprocess_s, self.infer_s, self.latency_s = timings
+        self.error = error
+
+    @property
+    def frame(self):
+        """The submitted frame, still in its shared slot: valid until release()"""
+        return self._pool.frames[self.slot]
+
+    @property
+    def output(self):
+        return self._pool.outputs[self.slot]
+
+    def release(self):
+        if self.slot is not None:
+            self._pool.release(self.slot)
+            self.slot = None
+
+
+class InferencePool:
+    """
+    model_path  : ONNX model, loaded once per worker
+    frame_shape : (H, W, 3) of every frame that will be submitted
+    workers     : worker processes (default: cores - 1)
+    slots       : frames in flight, default 2 per worker so no worker waits on the parent
+    """
+
+    def __init__(self, model_path, frame_shape, size=640, workers=DEFAULT_WORKERS, slots=None,
+                 conf_threshold=0.3, iou_threshold=0.45, profile="worker"):
+        self.size = size
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+        self.frame_shape = tuple(frame_shape)
+        self.workers = workers
+        self.slots = slots or 2 * workers
+        out_shape, out_dtype, self.final = _output_spec(model_path, size, profile, conf_threshold, iou_threshold)
+
+        frame_bytes = int(np.prod(self.frame_shape))
+        out_bytes = int(np.prod(out_shape)) * np.dtype(out_dtype).itemsize
+        self._frames_mem = shared_memory.SharedMemory(create=True, size=self.slots * frame_bytes)
+        self._outs_mem = shared_memory.SharedMemory(create=True, size=self.slots * out_bytes)
+        self.frames = np.ndarray((self.slots,) + self.frame_shape, dtype=np.uint8, buffer=self._frames_mem.buf)
+        self.outputs = np.ndarray((self.slots,) + out_shape, dtype=out_dtype, buffer=self._outs_mem.buf)
+
+        ctx = mp.get_context("fork")  # spawn would re-run scripts that have no __main__ guard
+        self._tasks = [ctx.Queue() for _ in range(workers)]
+        self._done = ctx.Queue()
+        self._procs = [
+            ctx.Process(target=_worker, name=f"infer-{i}", daemon=True,
+                        args=(i, model_path, size, profile, self._frames_mem.name, self._outs_mem.name,
+                              self.frame_shape, out_shape, out_dtype, self.final, self.slots, self._tasks[i],
+                              self._done))
+            for i in range(workers)
+        ]
+        for p in self._procs:
+            p.start()
+        for _ in range(workers):
+            msg = self._done.get(timeout=120)
+            if msg[0] != "ready":
+                raise RuntimeError(f"Worker failed to start: {msg}")
+
+        self._free = queue.Queue()
+        for i in range(self.slots):
+            self._free.put(i)
+        self._seq = 0
+        self._next = 1          # next seq get(ordered=True) hands out
+        self._submitted = {}    # seq -> (t_submit, slot)
+        self._finished = {}     # seq -> raw completion tuple
+        self._cond = threading.Condition()
+        self.out_of_order = 0   # completions that overtook an earlier frame
+        self._last_done = 0
+        self._dead = set()      # worker indexes whose process exited
+        self._assigned = [set() for _ in range(workers)]  # seqs queued on / running in each worker
+        self._busy = 0          # frames handed to workers and not finished yet
+        self._pending = None    # (slot, t_capture) waiting in submit_latest() for an idle worker
+        self.replaced = 0       # submit_latest() frames dropped for a newer one
+        self._replaced_metric = FRAMES_DROPPED.labels("infer")
+        self._running = True
+        self._collector = threading.Thread(target=self._collect, name="pool-collect", daemon=True)
+        self._collector.start()
+        atexit.register(self.close)  # unlink the shared memory on a normal exit
+        print(f"[INFO] Inference pool: {workers} workers, {self.slots} shared slots "
+              f"({frame_bytes * self.slots / 1e6:.1f} MB frames, {out_bytes * self.slots / 1e6:.1f} MB outputs)")
+
+    # ---- submit ----
+    def acquire(self, block=True, timeout=None, latest=False):
+        """
+        A free slot and its frame buffer (fill it, e.g. cap.read(buf), then
+        submit_slot / submit_latest). None if busy. latest=True: with no slot
+        free, take back the frame parked in submit_latest(); it is dropped.
+        """
+        if latest:
+            with self._cond:
+                if self._pending is not None and self._free.empty():
+                    slot, self._pending = self._pending[0], None
+                    self._drop()
+                    return slot, self.frames[slot]
+        try:
+            slot = self._free.get(block, timeout)
+        except queue.Empty:
+            return None
+        return slot, self.frames[slot]
+
+    def _queue(self, slot, t_submit=None):
+        # holding self._cond, so seqs reach the task queue in order
+        self._seq += 1
+        self._submitted[self._seq] = (t_submit or time.perf_counter(), slot)
+        alive = [i for i in range(self.workers) if i not in self._dead]
+        if not alive:
+            now = time.perf_counter()
+            self._finished[self._seq] = (self._seq, slot, None, 1.0, (0, 0), None, now, now, now,
+                                         "no inference worker left")
+            self._cond.notify_all()
+            return self._seq
+        index = min(alive, key=lambda i: len(self._assigned[i]))
+        self._assigned[index].add(self._seq)
+        self._busy += 1
+        self._tasks[index].put((self._seq, slot))
+        return self._seq
+
+    def _dispatch(self):
+        # holding self._cond: start the parked frame if a worker is idle
+        if self._pending is not None and self._busy < self.workers - len(self._dead):
+            (slot, t_capture), self._pending = self._pending, None
+            self._queue(slot, t_capture)
+
+    def _drop(self):
+        self.replaced += 1
+        self._replaced_metric.inc()
+
+    def release(self, slot):
+        """Give back an acquired slot that was never submitted."""
+        self._free.put(slot)
+
+    def submit_slot(self, slot):
+        with self._cond:
+            return self._queue(slot)
+
+    def submit_latest(self, slot, t_capture=None):
+        """
+        Latest-wins submit for live sources: slot goes to a worker as soon as
+        one is idle; until then a newer submit_latest() replaces it and its
+        slot goes back to the free list. Results keep t_capture as t_submit,
+        so latency includes the wait.
+        """
+        with self._cond:
+            if self._pending is not None:
+                self._free.put(self._pending[0])
+                self._drop()
+            self._pending = (slot, t_capture or time.perf_counter())
+            self._dispatch()
+
+    def submit(self, frame, block=True, timeout=None):
+        """Copy frame into a free slot and queue it; returns its seq, or None if no slot freed up."""
+        if frame.shape != self.frame_shape:
+            raise ValueError(f"Pool frames are {self.frame_shape}, got {frame.shape}")
+        got = self.acquire(block, timeout)
+        if got is None:
+            return None
+        slot, buf = got
+        np.copyto(buf, frame)
+        return self.submit_slot(slot)
+
+    # ---- results ----
+    def _collect(self):
+        last_check = time.monotonic()
+        while self._running:
+            try:
+                msg = self._done.get(timeout=0.5)
+            except queue.Empty:
+                msg = None
+            except (EOFError, OSError):
+                break
+            if msg is not None:
+                self._complete(msg)
+            if time.monotonic() - last_check >= 0.5:
+                last_check = time.monotonic()
+                self._reap()
+
+    def _complete(self, msg):
+        with self._cond:
+            seq = msg[0]
+            if seq not in self._submitted or seq in self._finished:
+                return  # already failed by _reap(), and maybe handed out since
+            self._assigned[msg[2]].discard(seq)
+            if seq < self._last_done:
+                self.out_of_order += 1
+            self._last_done = max(self._last_done, seq)
+            self._finished[seq] = msg
+            self._busy -= 1
+            self._dispatch()
+            self._cond.notify_all()
+
+    def _reap(self):
+        """Fail the frames a dead worker held (running or queued), so get(ordered=True) moves past them."""
+        if not self._running:
+            return  # close() is stopping them
+        exited = [i for i, p in enumerate(self._procs) if i not in self._dead and not p.is_alive()]
+        if not exited:
+            return
+        # a worker can finish its frame and then die: take what it sent before failing anything
+        while True:
+            try:
+                self._complete(self._done.get_nowait())
+            except (queue.Empty, EOFError, OSError):
+                break
+        for index in exited:
+            p = self._procs[index]
+            self._dead.add(index)
+            error = f"worker {index} exited with code {p.exitcode}"
+            print(f"[ERROR] Inference {error}; {self.workers - len(self._dead)} workers left")
+            with self._cond:
+                lost, self._assigned[index] = self._assigned[index], set()
+                now = time.perf_counter()
+                for seq in sorted(lost):
+                    if seq in self._submitted and seq not in self._finished:
+                        _, slot = self._submitted[seq]
+                        self._finished[seq] = (seq, slot, index, 1.0, (0, 0), None, now, now, now, error)
+                        self._busy -= 1
+                self._dispatch()
+                self._cond.notify_all()
+
+    def _take(self, ordered, timeout):
+        with self._cond:
+            if ordered:
+                ready = lambda: self._next in self._finished
+            else:
+                ready = lambda: bool(self._finished)
+            if not self._cond.wait_for(ready, timeout):
+                return None
+            seq = self._next if ordered else min(self._finished)
+            msg = self._finished.pop(seq)
+            t_submit, _ = self._submitted.pop(seq)
+            if seq == self._next:
+                self._next += 1
+                while self._next < self._seq + 1 and self._next not in self._submitted:
+                    self._next += 1  # already handed out unordered
+            return msg, t_submit
+
+    def get(self, timeout=None, ordered=True):
+        """Next PoolResult (in submission order unless ordered=False), or None on timeout."""
+        got = self._take(ordered, timeout)
+        if got is None:
+            return None
+        (seq, slot, worker, ratio, pad, n, t0, t1, t2, error), t_submit = got
+        timings = (t1 - t0, t2 - t1, time.perf_counter() - t_submit)
+        if error:
+            return PoolResult(self, seq, slot, None, worker, t_submit, timings, error)
+        h, w = self.frame_shape[:2]
+        if self.final:
+            dets = decode_final(self.outputs[slot][:n], w, h, input_size=self.size,
+                                conf_threshold=self.conf_threshold, ratio=ratio, pad=pad)
+            return PoolResult(self, seq, slot, dets, worker, t_submit, timings)
+        dets = decode(self.outputs[slot], w, h, input_size=self.size, conf_threshold=self.conf_threshold,
+                      ratio=ratio, pad=pad)
+        keep = nms(dets.boxes, dets.scores, dets.class_ids, self.iou_threshold)
+        dets = Detections(dets.boxes[keep], dets.scores[keep], dets.class_ids[keep])
+        return PoolResult(self, seq, slot, dets, worker, t_submit, timings)
+
+    @property
+    def in_flight(self):
+        return self.slots - self._free.qsize()
+
+    def close(self):
+        if not self._running:
+            return
+        self._running = False
+        for tasks in self._tasks:
+            tasks.put(None)
+        for p in self._procs:
+            p.join(timeout=5)
+            if p.is_alive():
+                p.terminate()
+        self._collector.join(timeout=2)
+        del self.frames, self.outputs
+        for mem in (self._frames_mem, self._outs_mem):
+            mem.close()
+            mem.unlink()
+
+
+class PooledFramePipeline(FramePipeline):
+    """
+    FramePipeline whose inference stage is an InferencePool: the capture
+    thread submits frames with submit_latest(), so while every worker is busy
+    the newest frame waits and older waiting ones are dropped, and the
+    inference thread collects results in order and annotates them.
+
+    Frames are never copied: the camera decodes into an acquired shared slot,
+    and the inference thread draws on that slot and encodes the JPEG itself
+    before releasing it. The encode thread is left with the periodic report.
+
+    annotate : callable(frame, dets) -> frame, drawing in place
+    """
+
+    def __init__(self, cap, pool, annotate, **kwargs):
+        super().__init__(cap, process=None, **kwargs)
+        self.pool = pool
+        self.annotate = annotate
+
+    def _capture_loop(self):
+        read_time = STAGE_SECONDS.labels("capture")
+        captured = FRAMES.labels("captured")
+        while self._running:
+            # a frame waiting for a worker gives up its slot to this newer one (counted by the pool)
+            got = self.pool.acquire(timeout=0.5, latest=True)
+            if got is None:
+                continue  # every slot holds a frame in flight or being drawn
+            slot, buf = got
+            t0 = time.perf_counter()
+            ret, frame = self.cap.read(buf)  # decoded straight into the shared slot
+            if not ret:
+                self.pool.release(slot)
+                CAMERA_READ_FAILURES.inc()
+                time.sleep(0.01)
+                continue
+            if frame is not buf:
+                np.copyto(buf, frame)  # the reader allocated its own frame after all
+            t_cap = time.perf_counter()
+            read_time.observe(t_cap - t0)
+            self.counts["captured"] += 1
+            captured.inc()
+            self.pool.submit_latest(slot, t_cap)
+
+    def _infer_loop(self):
+        process_time = STAGE_SECONDS.labels("process")
+        inferred = FRAMES.labels("inferred")
+        while self._running:
+            res = self.pool.get(timeout=0.5)
+            if res is None:
+                continue
+            if res.error:
+                print(f"[ERROR] Worker {res.worker} failed:", res.error)
+                res.release()
+                continue
+            t0 = time.perf_counter()
+            frame = self.annotate(res.frame, res.dets)  # in place, on the shared slot
+            process_time.observe(res.infer_s + time.perf_counter() - t0)
+            self.counts["inferred"] += 1
+            inferred.inc()
+            if self.hub.has_clients:
+                self._publish(res.t_submit, frame)  # encode before the slot is reused
+            res.release()
+
+    def stats(self):
+        s = super().stats()
+        s["dropped_before_infer"] += self.pool.replaced
+        return s
+
+    def stop(self):
+        super().stop()
+        self.pool.close()
+
+
+def run(pool, frames, n):
+    """Keep every slot busy for n frames; returns (frames/s, mean latency s, ordered ok)"""
+    latencies = []
+    last_seq = None
+    i = 0
+    t0 = time.perf_counter()
+    for _ in range(min(pool.slots, n)):
+        pool.submit(frames[i % len(frames)])
+        i += 1
+    for _ in range(n):
+        res = pool.get(timeout=30)
+        if res is None:
+            raise RuntimeError("Timed out waiting for a worker")
+        ordered = last_seq is None or res.seq == last_seq + 1
+        last_seq = res.seq
+        latencies.append(res.latency_s)
+        res.release()
+        if i < n:
+            pool.submit(frames[i % len(frames)])
+            i += 1
+        if not ordered:
+            raise RuntimeError("Results left the reorder buffer out of order")
+    wall = time.perf_counter() - t0
+    return n / wall, float(np.mean(latencies))
+
+
+def main():
+    from frame_source import add_source_args, open_source
+    from yolo_detector import YoloDetector
+
+    parser = argparse.ArgumentParser(description="Inference pool throughput vs worker count")
+    add_source_args(parser, default="synthetic")
+    parser.add_argument("--model", default="best.onnx")
+    parser.add_argument("--size", type=int, default=640)
+    parser.add_argument("--workers", default=",".join(str(n) for n in sorted({1, 2, DEFAULT_WORKERS + 1})))
+    parser.add_argument("--frames", type=int, default=200)
+    args = parser.parse_args()
+
+    source = open_source(args.source, rate="max", loop=False)
+    frames = []
+    while len(frames) < 50:
+        ok, frame = source.read()
+        if not ok:
+            break
+        frames.append(frame)
+    source.release()
+    if not frames:
+        raise RuntimeError(f"No frames from {args.source}")
+
+    with contextlib.redirect_stdout(sys.stderr):
+        det = YoloDetector(args.model, args.size)
+    for f in frames[:5]:
+        det.detect(f)
+    t0 = time.perf_counter()
+    for i in range(args.frames):
+        det.detect(frames[i % len(frames)])
+    base = args.frames / (time.perf_counter() - t0)
+    del det
+    print(f"[BENCH] {os.cpu_count()} cores, {args.frames} frames {frames[0].shape[1]}x{frames[0].shape[0]}")
+    print(f"  in-process (low_latency, all cores)  {base:7.1f} frames/s")
+
+    for n in [int(v) for v in args.workers.split(",")]:
+        with contextlib.redirect_stdout(sys.stderr):
+            pool = InferencePool(args.model, frames[0].shape, args.size, workers=n)
+        try:
+            run(pool, frames, min(args.frames, 4 * pool.slots))  # warm-up
+            fps, latency = run(pool, frames, args.frames)
+        finally:
+            pool.close()
+        print(f"  pool, {n} worker{'s' if n > 1 else ' '}                       {fps:7.1f} frames/s  "
+              f"x{fps / base:.2f}  latency {latency * 1000:.1f}ms  out-of-order completions {pool.out_of_order}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+latest_slot.py
+Single-slot "latest wins" buffer used to hand frames between threads.
+
+put() overwrites whatever is waiting, so a slow consumer never builds a
+backlog; it skips straight to the newest item and the overwritten ones are
+counted in .dropped. Items carry a sequence number so several consumers can
+each wait for "something newer than what I last saw".
+"""
+
+import threading
+
+
+class LatestSlot:
+    """Single-slot "latest wins" handoff between threads."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._item = None
+        self._seq = 0
+        self._taken = 0
+        self._closed = False
+        self.dropped = 0
+
+    @property
+    def seq(self):
+        return self._seq
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def put(self, item):
+        with self._cond:
+            if self._seq > self._taken:
+                self.dropped += 1  # previous item was never picked up
+            self._item = item
+            self._seq += 1
+            self._cond.notify_all()
+
+    def get(self, last_seq=0, timeout=None):
+        """
+        Block until an item newer than last_seq exists.
+        returns (seq, item), or (last_seq, None) on timeout / close
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._seq > last_seq or self._closed, timeout):
+                return last_seq, None
+            if self._closed and self._seq <= last_seq:
+                return last_seq, None
+            self._taken = self._seq
+            return self._seq, self._item
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
@@ -0,0 +1,298 @@
+"""
+metrics.py
+Always-on counters, gauges and latency histograms with a Prometheus /metrics route.
+
+Every script shares one registry, so the pipeline threads, the detector
+stages and the pick logic all land on the same page. Recording is a bisect
+plus a few integer adds under a per-metric lock (~1 us), cheap enough to
+leave on at camera frame rates. Rendering happens only when /metrics is
+scraped. No prometheus_client dependency; the text format is written here.
+
+Metrics:
+    robot_stage_seconds{stage}        histogram: capture, preprocess, infer, decode,
+                                      nms, draw, process, encode, capture_to_jpeg
+    robot_frames_total{stage}         counter: captured, inferred, encoded
+    robot_frames_dropped_total{stage} counter: frames overwritten before infer / encode
+    robot_camera_read_failures_total  counter
+    robot_detections_total            counter: boxes kept after NMS
+    robot_pick_triggers_total         counter
+    robot_mjpeg_clients               gauge
+    robot_cpu_percent                 gauge: process CPU since the previous scrape (100 = one core)
+    robot_soc_temp_celsius            gauge: thermal_zone0, NaN where there is none
+
+Usage:
+    from metrics import STAGE_SECONDS, register_metrics_route
+    with STAGE_SECONDS.labels("infer").time():
+        ...
+    register_metrics_route(app)        # adds GET /metrics
+"""
+
+import bisect
+import math
+import threading
+import time
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+THERMAL_ZONE = "/sys/class/thermal/thermal_zone0/temp"
+
+# seconds; spans a fast NMS (~0.1 ms) up to a stalled camera or a 640 model on a Pi
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.075, 0.1,
+                   0.15, 0.25, 0.5, 1.0, 2.5)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+                    for k, v in pairs)
+    return "{" + body + "}"
+
+
+def _format_value(v):
+    if isinstance(v, float) and (math.isinf(v) or math.isnan(v)):
+        return "NaN" if math.isnan(v) else ("+Inf" if v > 0 else "-Inf")
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class _Timer:
+    __slots__ = ("_metric", "_t0")
+
+    def __init__(self, metric):
+        self._metric = metric
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._metric.observe(time.perf_counter() - self._t0)
+
+
+class _CounterValue:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class _GaugeValue:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+        self._fn = None
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set_function(self, fn):
+        """Evaluate fn() at scrape time instead of storing a value."""
+        self._fn = fn
+
+    def get(self):
+        return self._fn() if self._fn else self.value
+
+
+class _HistogramValue:
+    def __init__(self, buckets):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self):
+        return _Timer(self)
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self.labels()  # export 0 before the first event
+        (REGISTRY if registry is None else registry).register(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """Child for one label combination; keep a reference to it on hot paths."""
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _default(self):
+        if self.labelnames:
+            raise ValueError(f"{self.name} has labels {self.labelnames}; use .labels()")
+        return self.labels()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            lines += self._render_child(values, child)
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterValue()
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {child.value}"]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeValue()
+
+    def set(self, value):
+        self._default().set(value)
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+    def dec(self, amount=1):
+        self._default().dec(amount)
+
+    def set_function(self, fn):
+        self._default().set_function(fn)
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.get())}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+    def _render_child(self, values, child):
+        counts, total, count = child.snapshot()
+        lines = []
+        cumulative = 0
+        for bound, n in zip(self.buckets + (float("inf"),), counts):
+            cumulative += n
+            le = _format_labels(self.labelnames, values, [("le", _format_value(bound))])
+            lines.append(f"{self.name}_bucket{le} {cumulative}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {total!r}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = Histogram("robot_stage_seconds", "Time spent per pipeline stage", ["stage"])
+FRAMES = Counter("robot_frames_total", "Frames that completed a stage", ["stage"])
+FRAMES_DROPPED = Counter("robot_frames_dropped_total",
+                         "Frames overwritten before the stage picked them up", ["stage"])
+CAMERA_READ_FAILURES = Counter("robot_camera_read_failures_total", "Failed frame source reads")
+DETECTIONS = Counter("robot_detections_total", "Boxes kept after NMS")
+PICK_TRIGGERS = Counter("robot_pick_triggers_total", "Pick sequences started")
+MJPEG_CLIENTS = Gauge("robot_mjpeg_clients", "Connected /video viewers")
+
+
+class CpuMeter:
+    """Process CPU use between calls, in percent of one core."""
+
+    def __init__(self):
+        self._last = (time.perf_counter(), time.process_time())
+
+    def percent(self):
+        now = (time.perf_counter(), time.process_time())
+        wall, cpu = now[0] - self._last[0], now[1] - self._last[1]
+        self._last = now
+        return 100.0 * cpu / wall if wall > 0 else 0.0
+
+
+def read_soc_temp():
+    """SoC temperature in C (Raspberry Pi thermal_zone0), NaN if unavailable"""
+    try:
+        with open(THERMAL_ZONE) as f:
+            return int(f.read().strip()) / 1000.0
+    except (OSError, ValueError):
+        return float("nan")
+
+
+CPU_PERCENT = Gauge("robot_cpu_percent", "Process CPU use since the previous scrape, 100 = one core")
+CPU_PERCENT.set_function(CpuMeter().percent)
+SOC_TEMP = Gauge("robot_soc_temp_celsius", "SoC temperature")
+SOC_TEMP.set_function(read_soc_temp)
+
+
+def register_metrics_route(app, registry=None, path="/metrics"):
+    """Add a Prometheus scrape endpoint to a Flask app."""
+    from flask import Response  # scripts without Flask can still record metrics
+
+    registry = REGISTRY if registry is None else registry
+
+    def metrics():
+        return Response(registry.render(), content_type=CONTENT_TYPE)
+
+    app.add_url_rule(path, "metrics", metrics)
+    return app
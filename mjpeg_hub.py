@@ -0,0 +1,122 @@
+"""
+mjpeg_hub.py
+Encode-once MJPEG broadcast for any number of /video viewers.
+
+The producer publishes each annotated JPEG exactly once; every subscriber
+gets its own generator that always jumps to the newest frame. A slow client
+blocked on its socket simply skips the frames it missed instead of building
+a backlog, and every client's sent / skipped / bytes counters are kept for
+the /video/stats route. A client can also be capped to max_fps (default
+$MJPEG_MAX_FPS, 0 = as fast as frames arrive): it sleeps between sends and
+then takes the newest frame, so a phone on Wi-Fi doesn't cost a full-rate
+stream.
+
+Usage:
+    hub = MjpegHub()
+    hub.publish(jpeg_bytes)          # from the single encode thread
+    Response(hub.subscribe(request.remote_addr), mimetype=MJPEG_MIMETYPE)
+    Response(hub.subscribe(request.remote_addr, max_fps=5), mimetype=MJPEG_MIMETYPE)
+"""
+
+import itertools
+import os
+import threading
+import time
+
+from latest_slot import LatestSlot
+from metrics import MJPEG_CLIENTS
+
+MJPEG_MIMETYPE = 'multipart/x-mixed-replace; boundary=frame'
+MAX_FPS = float(os.environ.get("MJPEG_MAX_FPS", "0"))
+
+
+def mjpeg_part(jpeg_bytes):
+    return (b'--frame\r\n'
+            b'Content-Type: image/jpeg\r\n\r\n' + jpeg_bytes + b'\r\n')
+
+
+class ClientStats:
+    def __init__(self, client_id, name, max_fps=0.0):
+        self.client_id = client_id
+        self.name = name
+        self.max_fps = max_fps
+        self.connected_at = time.time()
+        self.sent = 0
+        self.skipped = 0
+        self.bytes = 0
+        self.last_send_ms = 0.0
+
+    def as_dict(self):
+        up = max(time.time() - self.connected_at, 1e-6)
+        return {
+            "id": self.client_id,
+            "name": self.name,
+            "sent": self.sent,
+            "skipped": self.skipped,
+            "bytes": self.bytes,
+            "fps": round(self.sent / up, 2),
+            "max_fps": self.max_fps or None,
+            "last_send_ms": round(self.last_send_ms, 2),
+            "connected_s": round(up, 1),
+        }
+
+
+class MjpegHub:
+    def __init__(self):
+        self._slot = LatestSlot()
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._ids = itertools.count(1)
+        self.published = 0
+
+    @property
+    def has_clients(self):
+        return bool(self._clients)
+
+    def publish(self, jpeg_bytes):
+        self._slot.put(jpeg_bytes)
+        self.published += 1
+
+    def subscribe(self, name=None, timeout=1.0, max_fps=None):
+        """Generator of multipart chunks for one client; unregisters itself on disconnect."""
+        max_fps = MAX_FPS if max_fps is None else max_fps
+        interval = 1.0 / max_fps if max_fps > 0 else 0.0
+        stats = ClientStats(next(self._ids), name, max_fps)
+        with self._lock:
+            self._clients[stats.client_id] = stats
+        MJPEG_CLIENTS.inc()
+        seq = self._slot.seq - 1 if self._slot.seq else 0  # start with the current frame
+        next_send = 0.0
+        try:
+            while True:
+                if interval:
+                    wait = next_send - time.perf_counter()
+                    if wait > 0:
+                        time.sleep(wait)  # frames published meanwhile count as skipped
+                new_seq, jpeg = self._slot.get(seq, timeout)
+                if jpeg is None:
+                    if self._slot.closed:
+                        return
+                    continue
+                if seq:
+                    stats.skipped += new_seq - seq - 1
+                seq = new_seq
+                t0 = time.perf_counter()
+                next_send = t0 + interval
+                yield mjpeg_part(jpeg)
+                # resumes once the WSGI server has written the chunk
+                stats.last_send_ms = (time.perf_counter() - t0) * 1000.0
+                stats.sent += 1
+                stats.bytes += len(jpeg)
+        finally:
+            with self._lock:
+                self._clients.pop(stats.client_id, None)
+            MJPEG_CLIENTS.dec()
+
+    def stats(self):
+        with self._lock:
+            clients = [c.as_dict() for c in self._clients.values()]
+        return {"published": self.published, "clients": clients}
+
+    def close(self):
+        self._slot.close()
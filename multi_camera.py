@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+"""
+multi_camera.py
+Several cameras, one batched detector, one MJPEG stream per camera.
+
+Each source gets its own capture thread and LatestSlot, as in
+FramePipeline. A single inference thread waits for a new frame from any
+camera, then gives the others up to `gather` seconds to catch up, and runs
+all the new frames as ONE batched ORT call (BatchDetector). The detections
+are split back out per camera, drawn, and every camera's own encode thread
+publishes to its own MjpegHub, served on /video/<name>.
+
+Batching needs an export with a dynamic batch axis
+(yolo export format=onnx dynamic=True) or one fixed to the number of
+cameras. A batch-1 model still works, frame by frame, and so does a model
+from export_nms_model.py: its (K, 6) rows don't say which frame they belong
+to, so it never runs batched.
+
+Camera FPS (frames through inference per second) is on /video/stats and
+/metrics as robot_camera_fps{camera=...}.
+
+Usage:
+    python multi_camera.py --sources 0,2 --model best.onnx            # /video/cam0, /video/cam1
+    FRAME_SOURCES=/dev/video0,/dev/video2,synthetic python multi_camera.py
+    python multi_camera.py --sources synthetic,synthetic,synthetic --bench 100
+        batched vs sequential throughput on the same frames
+"""
+
+import argparse
+import collections
+import contextlib
+import os
+import sys
+import threading
+import time
+
+import cv2
+
+from latest_slot import LatestSlot
+from metrics import (CAMERA_READ_FAILURES, DETECTIONS, FRAMES, FRAMES_DROPPED, STAGE_SECONDS, Gauge,
+                     register_metrics_route)
+from mjpeg_hub import MJPEG_MIMETYPE, MjpegHub
+from nms import nms
+from preprocess import BoundSession, Preprocessor
+from yolo_decode import Detections, decode
+from yolo_detector import YoloDetector, draw_detections
+
+CAMERA_FPS = Gauge("robot_camera_fps", "Frames per second through inference", ["camera"])
+BATCH_SIZE = Gauge("robot_inference_batch_size", "Frames in the last batched inference call")
+
+
+class BatchDetector:
+    """
+    Runs up to max_batch frames through detector's session in one call.
+    detector  : YoloDetector; session, input size and thresholds are shared
+    """
+
+    def __init__(self, detector, max_batch):
+        self.detector = detector
+        self.max_batch = max_batch
+        batch = detector.sess.get_inputs()[0].shape[0]
+        self.dynamic = not isinstance(batch, int)
+        # final (K, 6) rows carry no batch index, so in-graph NMS models run frame by frame
+        self.batched = max_batch > 1 and (self.dynamic or batch == max_batch) and not detector.final
+        self._timers = {s: STAGE_SECONDS.labels(s) for s in ("preprocess", "infer", "decode", "nms")}
+        if not self.batched:
+            return
+        self.pre = Preprocessor(detector.size, batch=max_batch)
+        # one binding per batch size over the front of the same buffer (a fixed batch only has one)
+        sizes = range(1, max_batch + 1) if self.dynamic else [max_batch]
+        self._runners = {k: BoundSession(detector.sess, self.pre.input[:k]) for k in sizes}
+
+    def detect_batch(self, frames):
+        """list of frames -> list of Detections, same order"""
+        if not self.batched:
+            return [self.detector.detect(f) for f in frames]
+        det = self.detector
+        t0 = time.perf_counter()
+        geometry = [self.pre.fill(frame, i) for i, frame in enumerate(frames)]
+        t1 = time.perf_counter()
+        output = self._runners[len(frames) if self.dynamic else self.max_batch].run()
+        t2 = time.perf_counter()
+        decoded = [decode(output[i], f.shape[1], f.shape[0], input_size=det.size,
+                          conf_threshold=det.conf_threshold, ratio=ratio, pad=pad)
+                   for i, (f, (ratio, pad)) in enumerate(zip(frames, geometry))]
+        t3 = time.perf_counter()
+        results = []
+        for d in decoded:
+            keep = nms(d.boxes, d.scores, d.class_ids, det.iou_threshold)
+            results.append(Detections(d.boxes[keep], d.scores[keep], d.class_ids[keep]))
+            DETECTIONS.inc(len(keep))
+        self._timers["preprocess"].observe(t1 - t0)
+        self._timers["infer"].observe(t2 - t1)
+        self._timers["decode"].observe(t3 - t2)
+        self._timers["nms"].observe(time.perf_counter() - t3)
+        return results
+
+
+class Camera:
+    def __init__(self, name, cap):
+        self.name = name
+        self.cap = cap
+        self.raw = LatestSlot()        # (t_capture, frame)
+        self.annotated = LatestSlot()  # (t_capture, frame)
+        self.hub = MjpegHub()
+        self.seen = 0                  # raw seq the inference thread last took
+        self.counts = {"captured": 0, "inferred": 0, "encoded": 0}
+        self._done = collections.deque(maxlen=30)
+        CAMERA_FPS.labels(name).set_function(self.fps)
+
+    def inferred(self):
+        self._done.append(time.perf_counter())
+        self.counts["inferred"] += 1
+
+    def fps(self):
+        t = self._done
+        return (len(t) - 1) / (t[-1] - t[0]) if len(t) > 1 and t[-1] > t[0] else 0.0
+
+    def stats(self):
+        return {**self.counts, "fps": round(self.fps(), 2), "dropped_before_infer": self.raw.dropped,
+                "dropped_before_encode": self.annotated.dropped, **self.hub.stats()}
+
+
+def annotate(camera, frame, dets):
+    draw_detections(frame, dets, "Pencil")
+    cv2.putText(frame, f"{camera.name} {camera.fps():.1f} FPS", (10, 25),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
+    return frame
+
+
+class MultiCameraPipeline:
+    """
+    sources  : FrameSources (anything with read() -> (ok, frame))
+    detector : YoloDetector; its session is run batched over the cameras
+    names    : route names, default cam0, cam1, ...
+    annotate : callable(camera, frame, dets) -> frame
+    gather   : seconds to wait for the other cameras once one has a new frame
+    """
+
+    def __init__(self, sources, detector, names=None, annotate=annotate, jpeg_quality=80,
+                 gather=0.015, report_every=10.0):
+        names = names or [f"cam{i}" for i in range(len(sources))]
+        self.cameras = [Camera(n, s) for n, s in zip(names, sources)]
+        self.by_name = {c.name: c for c in self.cameras}
+        self.batcher = BatchDetector(detector, len(self.cameras))
+        self.annotate = annotate
+        self.encode_params = [int(cv2.IMWRITE_JPEG_QUALITY), int(jpeg_quality)]
+        self.gather = gather
+        self.report_every = report_every
+        self._arrived = threading.Condition()
+        self._running = False
+        self._threads = []
+
+    # ---- stages ----
+    def _capture_loop(self, cam):
+        read_time = STAGE_SECONDS.labels("capture")
+        captured = FRAMES.labels("captured")
+        while self._running:
+            t0 = time.perf_counter()
+            ret, frame = cam.cap.read()
+            if not ret:
+                CAMERA_READ_FAILURES.inc()
+                time.sleep(0.01)
+                continue
+            t_cap = time.perf_counter()
+            read_time.observe(t_cap - t0)
+            cam.raw.put((t_cap, frame))
+            cam.counts["captured"] += 1
+            captured.inc()
+            with self._arrived:
+                self._arrived.notify()
+
+    def _fresh(self):
+        return [c for c in self.cameras if c.raw.seq > c.seen]
+
+    def _infer_loop(self):
+        process_time = STAGE_SECONDS.labels("process")
+        inferred = FRAMES.labels("inferred")
+        dropped = FRAMES_DROPPED.labels("infer")
+        while self._running:
+            with self._arrived:
+                if not self._arrived.wait_for(self._fresh, timeout=0.5):
+                    continue
+                # one camera is ready; give the rest a moment so they share the batch
+                self._arrived.wait_for(lambda: len(self._fresh()) == len(self.cameras), self.gather)
+            batch = []
+            for cam in self._fresh():
+                seq, item = cam.raw.get(cam.seen, timeout=0)
+                if item is None:
+                    continue
+                if cam.seen and seq - cam.seen > 1:
+                    dropped.inc(seq - cam.seen - 1)
+                cam.seen = seq
+                batch.append((cam, item))
+            if not batch:
+                continue
+            t0 = time.perf_counter()
+            try:
+                results = self.batcher.detect_batch([frame for _, (_, frame) in batch])
+                BATCH_SIZE.set(len(batch))
+                for (cam, (t_cap, frame)), dets in zip(batch, results):
+                    cam.annotated.put((t_cap, self.annotate(cam, frame, dets)))
+                    cam.inferred()
+            except Exception as e:
+                print("[ERROR] Inference stage failed:", e)
+                continue
+            process_time.observe(time.perf_counter() - t0)
+            inferred.inc(len(batch))
+
+    def _encode_loop(self, cam):
+        encode_time = STAGE_SECONDS.labels("encode")
+        latency = STAGE_SECONDS.labels("capture_to_jpeg")
+        encoded = FRAMES.labels("encoded")
+        seq = 0
+        while self._running:
+            seq, item = cam.annotated.get(seq, timeout=0.5)
+            if item is None or not cam.hub.has_clients:
+                continue  # nobody watching this camera, skip the encode
+            t_cap, frame = item
+            t0 = time.perf_counter()
+            ok, buf = cv2.imencode('.jpg', frame, self.encode_params)
+            if not ok:
+                continue
+            cam.hub.publish(buf.tobytes())
+            now = time.perf_counter()
+            encode_time.observe(now - t0)
+            latency.observe(now - t_cap)
+            cam.counts["encoded"] += 1
+            encoded.inc()
+
+    def _report_loop(self):
+        while self._running:
+            time.sleep(self.report_every)
+            print("[MULTI] " + " ".join(f"{c.name}={c.fps():.1f}fps" for c in self.cameras)
+                  + f" batch={BATCH_SIZE.labels().get()}")
+
+    # ---- control ----
+    def start(self):
+        if self._running:
+            return self
+        self._running = True
+        self._threads = [threading.Thread(target=self._infer_loop, name="infer", daemon=True)]
+        for cam in self.cameras:
+            self._threads += [
+                threading.Thread(target=self._capture_loop, args=(cam,), name=f"capture-{cam.name}", daemon=True),
+                threading.Thread(target=self._encode_loop, args=(cam,), name=f"encode-{cam.name}", daemon=True),
+            ]
+        if self.report_every:
+            self._threads.append(threading.Thread(target=self._report_loop, name="report", daemon=True))
+        for t in self._threads:
+            t.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        for cam in self.cameras:
+            cam.raw.close()
+            cam.annotated.close()
+            cam.hub.close()
+        for t in self._threads:
+            t.join(timeout=2)
+
+    def stream(self, name, client=None):
+        return self.by_name[name].hub.subscribe(client)
+
+    def stats(self):
+        return {"batched": self.batcher.batched, "cameras": {c.name: c.stats() for c in self.cameras}}
+
+
+def bench(sources, detector, n):
+    """Batched vs one-by-one inference over the same frame sets."""
+    sets = []
+    for _ in range(n):
+        frames = []
+        for s in sources:
+            ok, frame = s.read()
+            if not ok:
+                break
+            frames.append(frame)
+        if len(frames) < len(sources):
+            break
+        sets.append(frames)
+    if not sets:
+        raise RuntimeError("No frames from the sources")
+    batcher = BatchDetector(detector, len(sources))
+    if not batcher.batched:
+        print("[WARN] The model has a fixed batch of 1; both runs are sequential")
+    for frames in sets[:3]:  # warm-up, incl. the first run of every batch size
+        batcher.detect_batch(frames)
+        for f in frames:
+            detector.detect(f)
+
+    t0 = time.perf_counter()
+    for frames in sets:
+        for f in frames:
+            detector.detect(f)
+    seq = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for frames in sets:
+        batcher.detect_batch(frames)
+    bat = time.perf_counter() - t0
+
+    total = len(sets) * len(sources)
+    print(f"[BENCH] {len(sources)} cameras x {len(sets)} frames, input {detector.size}")
+    print(f"  sequential {total / seq:7.1f} frames/s  ({total / seq / len(sources):.1f} FPS per camera)")
+    print(f"  batched    {total / bat:7.1f} frames/s  ({total / bat / len(sources):.1f} FPS per camera)"
+          f"  x{seq / bat:.2f}")
+
+
+def main():
+    from flask import Flask, Response, abort, jsonify, request
+
+    from frame_source import open_source
+
+    parser = argparse.ArgumentParser(description="Multi-camera batched detection")
+    parser.add_argument("--sources", default=os.environ.get("FRAME_SOURCES", "0,1"),
+                        help="comma-separated frame source URIs (see frame_source.py)")
+    parser.add_argument("--names", default="", help="comma-separated route names, default cam0,cam1,...")
+    parser.add_argument("--rate", default=os.environ.get("FRAME_RATE", "realtime"))
+    parser.add_argument("--model", default="best.onnx")
+    parser.add_argument("--size", type=int, default=int(os.environ.get("IMG_SIZE", "640")))
+    parser.add_argument("--conf", type=float, default=0.3)
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--bench", type=int, default=0, help="compare batched vs sequential on N frame sets")
+    args = parser.parse_args()
+
+    uris = [u for u in args.sources.split(",") if u]
+    sources = [open_source(u, "max" if args.bench else args.rate) for u in uris]
+    for uri, s in zip(uris, sources):
+        if not s.isOpened():
+            raise RuntimeError(f"Cannot open frame source {uri}")
+    with contextlib.redirect_stdout(sys.stderr) if args.bench else contextlib.nullcontext():
+        detector = YoloDetector(args.model, args.size, args.conf)
+
+    if args.bench:
+        bench(sources, detector, args.bench)
+        return
+
+    names = args.names.split(",") if args.names else None
+    pipeline = MultiCameraPipeline(sources, detector, names)
+    app = Flask(__name__)
+
+    @app.route('/video')
+    @app.route('/video/<cam>')
+    def video(cam=None):
+        cam = cam or pipeline.cameras[0].name
+        if cam not in pipeline.by_name:
+            abort(404)
+        return Response(pipeline.stream(cam, request.remote_addr), mimetype=MJPEG_MIMETYPE)
+
+    @app.route('/video/stats')
+    def video_stats():
+        return jsonify(pipeline.stats())
+
+    register_metrics_route(app)
+
+    pipeline.start()
+    print(f"[INFO] {len(sources)} cameras, batched={pipeline.batcher.batched}: "
+          + ", ".join(f"/video/{c.name}" for c in pipeline.cameras))
+    app.run(host="0.0.0.0", port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
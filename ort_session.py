@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+ort_session.py
+ONNX Runtime session factory with tuned profiles and a cached optimized graph.
+
+Profiles:
+    low_latency : one camera stream, all cores on a single inference, spinning threads
+    throughput  : several sessions / streams at once, fewer threads each, no spinning
+    low_memory  : no memory arena or pattern planning, two threads
+    worker      : one thread, no spinning; one process per core (inference_pool.py)
+
+The first start with a given profile saves the optimized graph next to the
+model (optimized_model_filepath); later starts load that file with graph
+optimization switched off, which skips the optimizer entirely. The cached
+file may contain CPU-specific layouts, so delete *.opt.onnx when moving the
+model to a different board. Every session runs a warm-up inference before it
+is returned, so the first camera frame doesn't pay for lazy initialisation.
+The profile defaults to $ORT_PROFILE, else low_latency.
+
+If quantize_model.py has recommended an INT8 variant (best.recommended.json)
+that variant is loaded instead of the float32 model; set
+ORT_MODEL_VARIANT=fp32 to force the original.
+
+Usage:
+    sess = create_session("best.onnx", profile="low_latency")
+    python ort_session.py --model best.onnx      # cold vs warm start timing
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import onnxruntime as ort
+
+DEFAULT_PROFILE = os.environ.get("ORT_PROFILE", "low_latency")
+CPU_COUNT = os.cpu_count() or 1
+
+PROFILES = {
+    "low_latency": {
+        "intra_op_threads": CPU_COUNT,
+        "inter_op_threads": 1,
+        "spinning": True,
+        "mem_arena": True,
+    },
+    "throughput": {
+        "intra_op_threads": max(1, CPU_COUNT // 2),
+        "inter_op_threads": 1,
+        "spinning": False,
+        "mem_arena": True,
+    },
+    "low_memory": {
+        "intra_op_threads": min(2, CPU_COUNT),
+        "inter_op_threads": 1,
+        "spinning": False,
+        "mem_arena": False,
+    },
+    "worker": {
+        "intra_op_threads": 1,
+        "inter_op_threads": 1,
+        "spinning": False,
+        "mem_arena": True,
+    },
+}
+
+
+def cache_path(model_path, profile):
+    """Optimized graph location; tied to the ORT version because saved graphs are not portable."""
+    stem, _ = os.path.splitext(model_path)
+    return f"{stem}.{profile}.ort{ort.__version__}.opt.onnx"
+
+
+def recommendation_path(model_path):
+    stem, _ = os.path.splitext(model_path)
+    return f"{stem}.recommended.json"
+
+
+def resolve_model(model_path):
+    """Path of the variant quantize_model.py recommended for model_path, else model_path."""
+    rec_path = recommendation_path(model_path)
+    if os.environ.get("ORT_MODEL_VARIANT") == "fp32" or not os.path.exists(rec_path):
+        return model_path
+    with open(rec_path) as f:
+        rec = json.load(f)
+    candidate = os.path.join(os.path.dirname(model_path), rec["model"])
+    # a re-exported best.onnx makes the old recommendation stale
+    if os.path.exists(candidate) and os.path.getmtime(candidate) >= os.path.getmtime(model_path):
+        return candidate
+    return model_path
+
+
+def session_options(profile):
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown ORT profile {profile!r}, expected one of {sorted(PROFILES)}")
+    p = PROFILES[profile]
+    so = ort.SessionOptions()
+    so.intra_op_num_threads = p["intra_op_threads"]
+    so.inter_op_num_threads = p["inter_op_threads"]
+    so.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    so.enable_cpu_mem_arena = p["mem_arena"]
+    so.enable_mem_pattern = p["mem_arena"]
+    so.add_session_config_entry("session.intra_op.allow_spinning", "1" if p["spinning"] else "0")
+    return so
+
+
+def warmup(sess, runs=2):
+    feeds = {}
+    for inp in sess.get_inputs():
+        shape = [d if isinstance(d, int) else 1 for d in inp.shape]
+        dtype = np.float16 if inp.type == 'tensor(float16)' else np.float32
+        feeds[inp.name] = np.zeros(shape, dtype=dtype)
+    for _ in range(runs):
+        sess.run(None, feeds)
+
+
+def load_session(model_path, profile=None, cache=True, warmup_runs=2,
+                 providers=("CPUExecutionProvider",), use_recommended=True):
+    """returns (session, info) where info holds the startup timings"""
+    profile = profile or DEFAULT_PROFILE
+    if use_recommended:
+        model_path = resolve_model(model_path)
+    so = session_options(profile)
+    opt_path = cache_path(model_path, profile)
+    cached = (cache and os.path.exists(opt_path)
+              and os.path.getmtime(opt_path) >= os.path.getmtime(model_path))
+
+    t0 = time.perf_counter()
+    if cached:
+        so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+        sess = ort.InferenceSession(opt_path, so, providers=list(providers))
+    else:
+        so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if cache and os.access(os.path.dirname(os.path.abspath(opt_path)), os.W_OK):
+            so.optimized_model_filepath = opt_path
+        sess = ort.InferenceSession(model_path, so, providers=list(providers))
+    t1 = time.perf_counter()
+    if warmup_runs:
+        warmup(sess, warmup_runs)
+    t2 = time.perf_counter()
+
+    info = {
+        "model": model_path,
+        "profile": profile,
+        "from_cache": cached,
+        "load_ms": (t1 - t0) * 1000.0,
+        "warmup_ms": (t2 - t1) * 1000.0,
+    }
+    print(f"[INFO] ORT session ready: {os.path.basename(model_path)} profile={profile} "
+          f"cached={cached} load={info['load_ms']:.0f}ms warm-up={info['warmup_ms']:.0f}ms")
+    return sess, info
+
+
+def create_session(model_path, profile=None, cache=True, warmup_runs=2,
+                   providers=("CPUExecutionProvider",), use_recommended=True):
+    return load_session(model_path, profile, cache, warmup_runs, providers, use_recommended)[0]
+
+
+def first_inference_ms(sess):
+    t0 = time.perf_counter()
+    warmup(sess, 1)
+    return (time.perf_counter() - t0) * 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time cold vs warm ORT session start")
+    parser.add_argument("--model", default="best.onnx")
+    parser.add_argument("--profile", default=None, choices=sorted(PROFILES))
+    args = parser.parse_args()
+
+    profile = args.profile or DEFAULT_PROFILE
+    # the model load_session() actually runs, so all three timings use the same one
+    model_path = resolve_model(args.model)
+    if model_path != args.model:
+        print(f"[INFO] {args.model} -> {model_path} (recommended variant)")
+    opt_path = cache_path(model_path, profile)
+    if os.path.exists(opt_path):
+        os.remove(opt_path)
+
+    print("--- default InferenceSession, no warm-up ---")
+    t0 = time.perf_counter()
+    sess = ort.InferenceSession(model_path, providers=["CPUExecutionProvider"])
+    load = (time.perf_counter() - t0) * 1000.0
+    print(f"load={load:.0f}ms first inference={first_inference_ms(sess):.0f}ms "
+          f"second={first_inference_ms(sess):.0f}ms")
+
+    for label in ("cold start (optimizes and writes cache)", "warm start (cached graph)"):
+        print(f"--- {label} ---")
+        sess, info = load_session(model_path, profile, use_recommended=False)
+        print(f"load={info['load_ms']:.0f}ms warm-up={info['warmup_ms']:.0f}ms "
+              f"first frame={first_inference_ms(sess):.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
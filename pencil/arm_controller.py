@@ -1,9 +1,18 @@
 # arm_controller.py  (run this inside the same process as your detection)
-import serial, time, threading, glob, sys
+import serial, time, glob, os, sys
+
+# shared helpers live in the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from arm_kinematics import ArmLookup
+from arm_scheduler import ArmScheduler, move
+from servo_timing import ServoTimingModel
 
 # ----- Configuration -----
 SERIAL_BAUD = 115200
 SERIAL_PORTS = ['/dev/ttyACM0', '/dev/ttyUSB0']  # fallback list
+if os.environ.get("ARM_SERIAL_PORT"):
+    # e.g. the pty printed by arduino_sim.py
+    SERIAL_PORTS.insert(0, os.environ["ARM_SERIAL_PORT"])
 PICK_THRESHOLD = 0.8
 CONFIRM_FRAMES = 3    # require detection above threshold for N frames
 HOME_POS = {'base':0, 's1':20, 's2':20, 'claw_open':60, 'claw_closed':10}
@@ -38,31 +47,46 @@ def find_serial_port():
     raise RuntimeError("Could not open serial port to Arduino. Plug it in and check /dev/ttyACM0 or /dev/ttyUSB0")
 
 ser = find_serial_port()
+# the only writer to `ser` from here on; waits come from the servo model
+# (servo_timing.json once calibrated, defaults otherwise)
+arm = ArmScheduler(ser, timing=ServoTimingModel.load()).start()
 
 def send_move(b, s1, s2, claw):
-    cmd = f"M,{int(b)},{int(s1)},{int(s2)},{int(claw)}\n"
-    ser.write(cmd.encode('utf-8'))
-    # optionally read reply
-    time.sleep(0.02)
+    """Queue a single move; returns a Future that resolves once the Arduino replies."""
+    return arm.submit([move(b, s1, s2, claw)], name="move")
 
 # ----- Mapping functions (image coords -> servo angles) -----
 def map_value(val, in_min, in_max, out_min, out_max):
     v = (val - in_min) / (in_max - in_min)
     return out_min + v * (out_max - out_min)
 
+_lookups = {}
+
+def arm_lookup(frame_w, frame_h):
+    """Calibrated pixel -> angle lookup for this frame size (None until arm_calibration.json exists)"""
+    key = (frame_w, frame_h)
+    if key not in _lookups:
+        _lookups[key] = ArmLookup.load(frame_w, frame_h)
+    return _lookups[key]
+
 def compute_angles_from_bbox(cx, cy, bw, bh, frame_w, frame_h):
     """
     cx,cy = bbox center (pixels) in frame coords
     bw,bh = bbox width/height (pixels)
-    returns base, s1, s2, claw angles (0..180)
+    returns base, s1, s2, claw angles (0..180), or None if the target is out of reach
     """
+    lookup = arm_lookup(frame_w, frame_h)
+    if lookup is not None:
+        # homography + MeArm IK, precomputed (arm_kinematics.py)
+        angles = lookup.angles(cx, cy)
+        return None if angles is None else (*angles, CLAW_OPEN)
+
+    # Uncalibrated fallback: independent linear maps, bbox height as a depth proxy
     # Base: map horizontal position to base angle (flip if needed)
     base = map_value(cx, 0, frame_w, BASE_MIN, BASE_MAX)
 
     # Shoulder1: map vertical position -> pitch: higher y (lower in frame) => smaller angle (arm down)
     # Adjust range based on your arm geometry
-    s1 = map_value(cy, 0, frame_h, S1_MAX := S1_MAX if 'S1_MAX' in globals() else 160, S1_MIN := S1_MIN if 'S1_MIN' in globals() else 20)
-    # But above due to variable assignment style, let's use explicit:
     s1 = map_value(cy, 0, frame_h, S1_MAX, S1_MIN)
 
     # Shoulder2 (elbow): use bbox height (bigger bbox -> close -> more folded elbow)
@@ -81,61 +105,49 @@ def compute_angles_from_bbox(cx, cy, bw, bh, frame_w, frame_h):
     s2 = max(min(s2, S2_MAX), S2_MIN)
     return int(base), int(s1), int(s2), int(claw)
 
-# ----- Pick sequence (runs in background thread) -----
-is_busy = False
+# ----- Pick sequence (runs on the arm scheduler thread) -----
+DROP_BASE = 150
+
+def pick_program(base_t, s1_t, s2_t):
+    # each step advances once the Arduino has replied and the servo model says
+    # the move is done; the timeouts (the old fixed sleeps) only matter if the
+    # board stays silent
+    home_b, home_s1, home_s2 = HOME_POS['base'], HOME_POS['s1'], HOME_POS['s2']
+    return [
+        move(home_b, home_s1, home_s2, CLAW_OPEN, timeout=0.8),        # claw open at safe pose
+        move(base_t, home_s1, home_s2, CLAW_OPEN, timeout=0.8),        # base first
+        move(base_t, s1_t, s2_t, CLAW_OPEN, timeout=0.8),              # shoulders to target
+        move(base_t, s1_t, s2_t, CLAW_CLOSED, timeout=0.6),            # grab
+        move(base_t, max(S1_MIN, s1_t - 20), s2_t, CLAW_CLOSED, timeout=0.6),  # lift
+        move(DROP_BASE, home_s1, home_s2, CLAW_CLOSED, timeout=0.8),   # to drop zone
+        move(DROP_BASE, home_s1, home_s2, CLAW_OPEN, timeout=0.4),     # release
+        move(home_b, home_s1, home_s2, CLAW_OPEN, timeout=0.8),        # back home
+    ]
+
+def _pick_done(fut):
+    try:
+        print(f"Pick sequence finished in {fut.result()['cycle_ms']:.0f} ms")
+    except Exception as e:
+        print("Pick sequence error:", e)
 
 def pick_sequence(frame_w, frame_h, bbox):
     """
     bbox: (x_center, y_center, w, h) in pixels
+    returns a Future with the cycle report, or None if the arm is still busy
+    or the target is out of reach
     """
-    global is_busy
-    if is_busy:
-        return
-    is_busy = True
-    try:
-        cx, cy, bw, bh = bbox
-        # compute target angles
-        base_t, s1_t, s2_t, claw_t = compute_angles_from_bbox(cx, cy, bw, bh, frame_w, frame_h)
-        print("Target angles:", base_t, s1_t, s2_t)
-
-        # Step 0 - ensure claw open and move to above target (safe z)
-        send_move(HOME_POS['base'], HOME_POS['s1'], HOME_POS['s2'], CLAW_OPEN)
-        time.sleep(0.8)
-
-        # Move base roughly first
-        send_move(base_t, HOME_POS['s1'], HOME_POS['s2'], CLAW_OPEN)
-        time.sleep(0.8)
-
-        # Move shoulders towards target
-        send_move(base_t, s1_t, s2_t, CLAW_OPEN)
-        time.sleep(0.8)
-
-        # close claw -> pick
-        send_move(base_t, s1_t, s2_t, CLAW_CLOSED)
-        time.sleep(0.6)
-
-        # lift a bit after pick - adjust angles to lift (decrease s1 by 15 deg)
-        send_move(base_t, max(S1_MIN, s1_t - 20), s2_t, CLAW_CLOSED)
-        time.sleep(0.6)
-
-        # rotate to drop zone (example: base to 150 deg)
-        drop_base = 150
-        send_move(drop_base, HOME_POS['s1'], HOME_POS['s2'], CLAW_CLOSED)
-        time.sleep(0.8)
-
-        # open claw to drop
-        send_move(drop_base, HOME_POS['s1'], HOME_POS['s2'], CLAW_OPEN)
-        time.sleep(0.4)
-
-        # go back home
-        send_move(HOME_POS['base'], HOME_POS['s1'], HOME_POS['s2'], CLAW_OPEN)
-        time.sleep(0.8)
-
-        print("Pick sequence finished")
-    except Exception as e:
-        print("Pick sequence error:", e)
-    finally:
-        is_busy = False
-
-# Example call:
-# threading.Thread(target=pick_sequence, args=(frame_w, frame_h, (cx,cy,bw,bh)), daemon=True).start()
+    cx, cy, bw, bh = bbox
+    angles = compute_angles_from_bbox(cx, cy, bw, bh, frame_w, frame_h)
+    if angles is None:
+        print(f"Target at ({cx},{cy}) is out of the arm's reach")
+        return None
+    base_t, s1_t, s2_t, claw_t = angles
+    fut = arm.submit(pick_program(base_t, s1_t, s2_t), name="pick", if_idle=True)
+    if fut is None:
+        return None
+    print("Target angles:", base_t, s1_t, s2_t)
+    fut.add_done_callback(_pick_done)
+    return fut
+
+# Example call (returns immediately):
+# fut = pick_sequence(frame_w, frame_h, (cx, cy, bw, bh))
@@ -1,32 +1,58 @@
 # pencil_detection.py
+import os
+import sys
 import time
 import cv2
-import numpy as np
-import onnxruntime as rt
-from flask import Flask, Response
-import threading
+from flask import Flask, Response, jsonify, request
 import serial
 
+# shared helpers live in the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from arm_kinematics import HOVER_Z, PICK_Z, ArmLookup
+from arm_scheduler import ArmScheduler, home, move
+from cascade import Cascade
+from detectors import TFLiteDetector
+from frame_pipeline import FramePipeline
+from frame_source import source_from_cli
+from metrics import PICK_TRIGGERS, register_metrics_route
+from mjpeg_hub import MJPEG_MIMETYPE
+from motion_gate import MotionGate
+from resolution_switcher import ResolutionSwitcher, detector_from_env
+from roi import RoiDetector, Workspace
+from servo_timing import ServoTimingModel
+from tracker import Tracker
+from yolo_detector import YoloDetector
+
 # -------------------------
 # Config
 # -------------------------
-ONNX_PATH = "best.onnx"
-IMG_SIZE = 640
+ONNX_PATH = "best.onnx"  # input size: $IMG_SIZE (640), or RESOLUTIONS=320,416,640 FRAME_BUDGET_MS=80 to switch
 CONF_THRESHOLD = 0.30
 NMS_IOU = 0.45
+SERIAL_PORT = os.environ.get("ARM_SERIAL_PORT", "/dev/ttyACM0")  # arduino_sim.py pty works too
+
+# --- Trigger ---
+CONFIRM_FRAMES = 3   # require this many detections of the same track with conf > 0.6
+PICK_CONF = 0.6
+DETECT_EVERY = int(os.environ.get("DETECT_EVERY", "3"))  # run YOLO on every Nth frame, track in between
+gate = MotionGate()  # and only while something moves (MOTION_GATE=0: always)
 
-# --- Globals for trigger ---
-is_busy = False
-confirm_count = 0
-CONFIRM_FRAMES = 3   # require this many frames with conf > 0.6
+# --- Workspace ROI (roi.py): full | crop | tiles; full frame until workspace/arm calibration exists ---
+ROI_MODE = os.environ.get("ROI_MODE", "crop")
+ROI_TILE_MODEL = os.environ.get("ROI_TILE_MODEL", "best_320.onnx")  # dynamic-batch export for tiles
+
+# --- Crop classifier (cascade.py): CASCADE_MODEL=veggie_model.tflite labels each tracked object ---
+CASCADE_MODEL = os.environ.get("CASCADE_MODEL", "")
+CASCADE_LABELS = os.environ.get("CASCADE_LABELS", "tomato,potato").split(",")
 
 # -------------------------
 # Serial connection to Arduino
 # -------------------------
-print("[INFO] Connecting to Arduino on /dev/ttyACM0 ...")
-ser = serial.Serial('/dev/ttyACM0', 115200, timeout=1)
+print(f"[INFO] Connecting to Arduino on {SERIAL_PORT} ...")
+ser = serial.Serial(SERIAL_PORT, 115200, timeout=1)
 time.sleep(2)   # allow Arduino to reset
-ser.write(b"HOME\n")
+arm = ArmScheduler(ser, timing=ServoTimingModel.load()).start()  # owns the port
+arm.submit([home()], name="home").result()
 print("[INFO] Arduino connected and set to HOME")
 
 # -------------------------
@@ -35,224 +61,154 @@ print("[INFO] Arduino connected and set to HOME")
 def print_debug(tag, val):
     print(f"[DEBUG] {tag}: {val}")
 
-def iou(box, boxes):
-    x1 = np.maximum(box[0], boxes[:,0])
-    y1 = np.maximum(box[1], boxes[:,1])
-    x2 = np.minimum(box[2], boxes[:,2])
-    y2 = np.minimum(box[3], boxes[:,3])
-    inter_w = np.maximum(0, x2 - x1)
-    inter_h = np.maximum(0, y2 - y1)
-    inter = inter_w * inter_h
-    area1 = (box[2]-box[0])*(box[3]-box[1])
-    area2 = (boxes[:,2]-boxes[:,0])*(boxes[:,3]-boxes[:,1])
-    union = area1 + area2 - inter + 1e-8
-    return inter / union
-
-def simple_nms(boxes, scores, iou_thresh=0.45):
-    if len(boxes) == 0:
-        return []
-    idxs = np.argsort(scores)[::-1]
-    keep = []
-    while idxs.size:
-        i = idxs[0]
-        keep.append(i)
-        if idxs.size == 1:
-            break
-        rest = idxs[1:]
-        ious = iou(boxes[i], boxes[rest])
-        idxs = rest[ious <= iou_thresh]
-    return keep
-
 # -------------------------
 # Pick sequence (Arduino moves)
 # -------------------------
-def pick_sequence(frame_w, frame_h, box):
-    global is_busy
-    is_busy = True
-    cx, cy, bw, bh = box
-    print(f"[ACTION] Pick sequence triggered at ({cx},{cy}), size=({bw}x{bh})")
-
+# Each step advances once the Arduino has replied and the servo timing model
+# says the move is done; the timeouts are the old fixed sleeps and only
+# matter if the board stays silent.
+# Fixed program, used until arm_kinematics.py has a calibration
+PICK_PROGRAM = [
+    move(0, 180, 120, 60, timeout=1.5),   # move arm above pencil
+    move(0, 180, 120, 20, timeout=1.5),   # close claw to grab
+    move(0, 20, 60, 20, timeout=1.5),     # lift up
+    move(180, 36, 90, 20, timeout=1.5),   # rotate base to drop zone
+    move(180, 36, 90, 60, timeout=1.5),   # open claw to release
+    home(timeout=2.0),                    # return to home
+]
+CLAW_OPEN, CLAW_CLOSED = 60, 20
+
+lookups = None  # (hover, pick) ArmLookup grids, built for the first frame size
+
+def targeted_program(frame_w, frame_h, cx, cy):
+    """
+    Pick program aimed at pixel (cx, cy) via the calibrated IK lookup.
+    PICK_PROGRAM if uncalibrated, None if the pencil is out of reach.
+    """
+    global lookups
+    if lookups is None:
+        lookups = (ArmLookup.load(frame_w, frame_h, z=HOVER_Z), ArmLookup.load(frame_w, frame_h, z=PICK_Z))
+    if lookups[0] is None:
+        return PICK_PROGRAM
+    hover, grab = lookups[0].angles(cx, cy), lookups[1].angles(cx, cy)
+    if hover is None or grab is None:
+        return None
+    return [
+        move(*hover, CLAW_OPEN, timeout=1.5),    # above the pencil
+        move(*grab, CLAW_OPEN, timeout=1.5),     # down to it
+        move(*grab, CLAW_CLOSED, timeout=1.5),   # grab
+        move(*hover, CLAW_CLOSED, timeout=1.5),  # lift
+    ] + PICK_PROGRAM[3:]                         # drop zone, release, home
+
+def pick_done(fut):
     try:
-        # Move arm above pencil
-        ser.write(b"M,0,180,120,60\n")
-        time.sleep(1.5)
-
-        # Close claw to grab
-        ser.write(b"M,0,180,120,20\n")
-        time.sleep(1.5)
-
-        # Lift up
-        ser.write(b"M,0,20,60,20\n")
-        time.sleep(1.5)
-
-        # Rotate base to drop zone
-        ser.write(b"M,180,36,90,20\n")
-        time.sleep(1.5)
-
-        # Open claw to release
-        ser.write(b"M,180,36,90,60\n")
-        time.sleep(1.5)
-
-        # Return to home
-        ser.write(b"HOME\n")
-        time.sleep(2)
-
+        r = fut.result()
     except Exception as e:
         print("[ERROR] Failed to send commands:", e)
+        return
+    rtts = [s["rtt_ms"] for s in r["steps"] if s["rtt_ms"] is not None]
+    rtt = f"{sum(rtts) / len(rtts):.1f}ms" if rtts else "n/a"
+    print(f"[ACTION] Pick finished: cycle={r['cycle_ms']:.0f}ms mean serial rtt={rtt}")
+    gate.boost()  # the bed just changed; look again right away
 
-    is_busy = False
+def pick_sequence(frame_w, frame_h, box):
+    """Queue a pick at box unless the arm is busy or it's out of reach; returns its Future or None"""
+    cx, cy, bw, bh = box
+    program = targeted_program(frame_w, frame_h, cx, cy)
+    if program is None:
+        print(f"[ACTION] Pencil at ({cx},{cy}) is out of reach, not picking")
+        return None
+    fut = arm.submit(program, name="pick", if_idle=True)
+    if fut is None:
+        return None
+    print(f"[ACTION] Pick sequence triggered at ({cx},{cy}), size=({bw}x{bh})")
+    fut.add_done_callback(pick_done)
+    return fut
 
 # -------------------------
 # Load ONNX
 # -------------------------
-sess = rt.InferenceSession(ONNX_PATH, providers=['CPUExecutionProvider'])
-input_name = sess.get_inputs()[0].name
-print_debug("ONNX input name", input_name)
-print_debug("ONNX input shape", sess.get_inputs()[0].shape)
+detector = detector_from_env(ONNX_PATH, CONF_THRESHOLD, NMS_IOU)
+switching = isinstance(detector, ResolutionSwitcher)
+print_debug("ONNX input name", detector.sess.get_inputs()[0].name)
+print_debug("ONNX input shape", detector.sess.get_inputs()[0].shape)
+if switching:
+    print_debug("input sizes", f"{detector.sizes}, budget {detector.budget * 1000:.0f}ms")
+if ROI_MODE == "tiles":
+    roi = RoiDetector(YoloDetector(ROI_TILE_MODEL, 320, CONF_THRESHOLD, NMS_IOU), Workspace.load(), "tiles")
+else:
+    roi = RoiDetector(detector, Workspace.load(), ROI_MODE)
+print_debug("ROI mode", roi.mode)
 
 # -------------------------
 # Camera
 # -------------------------
-cap = cv2.VideoCapture(0)
+cap = source_from_cli()  # --source / $FRAME_SOURCE, default camera 0
 if not cap.isOpened():
-    raise RuntimeError("Cannot open camera (index 0).")
-
-# -------------------------
-# Preprocess
-# -------------------------
-def preprocess(frame):
-    img = cv2.resize(frame, (IMG_SIZE, IMG_SIZE))
-    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-    img = img.astype(np.float32) / 255.0
-    img = img.transpose(2, 0, 1)  # CHW
-    img = np.expand_dims(img, 0)   # 1x3xHxW
-    return img
+    raise RuntimeError("Cannot open frame source.")
 
 # -------------------------
-# Generator used by Flask
+# Per-frame inference stage (runs in the pipeline's inference thread)
 # -------------------------
 first_debug = True
-
-def generate():
-    global first_debug, confirm_count
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        h0, w0 = frame.shape[:2]
-
-        img = preprocess(frame)
-        t0 = time.time()
-        outputs = sess.run(None, {input_name: img})
-        t1 = time.time()
-
-        out_arr = np.array(outputs[0])
+frame_idx = 0
+tracker = Tracker()
+cascade = Cascade(TFLiteDetector(CASCADE_MODEL, CASCADE_LABELS, max_batch=4).warmup()) if CASCADE_MODEL else None
+
+def process(frame):
+    global first_debug, frame_idx
+    t0 = time.perf_counter()
+    detect = frame_idx % DETECT_EVERY == 0 and gate.check(frame)
+    frame_idx += 1
+
+    if detect and (roi.mode != "full" or switching):
+        dets = roi.detect(frame)
+    elif detect:
+        detector.preprocess(frame)
+        output = detector.infer()
 
         if first_debug:
-            print_debug("raw output shape", out_arr.shape)
+            print_debug("raw output shape", output.shape)
             first_debug = False
 
-        arr = out_arr.copy()
-        if arr.ndim == 3 and arr.shape[0] == 1:
-            arr = arr[0]
-        if arr.ndim == 3 and arr.shape[2] == 1:
-            arr = np.squeeze(arr)
-        if arr.ndim == 2 and arr.shape[0] <= 20 and arr.shape[1] > 20:
-            arr = arr.T
-        if arr.ndim != 2:
-            arr = arr.reshape(-1, 5)
-
-        N, K = arr.shape
-        if K == 5:
-            xywh = arr[:, :4]
-            confs = arr[:, 4]
-            class_ids = np.zeros(N, dtype=int)
-        elif K == 6:
-            last_col = arr[:,5]
-            if np.all((last_col >= 0.0) & (last_col <= 1.0)):
-                obj_conf = arr[:,4]
-                cls_conf = arr[:,5]
-                confs = obj_conf * cls_conf
-                xywh = arr[:, :4]
-                class_ids = np.zeros(N, dtype=int)
-            else:
-                xywh = arr[:, :4]
-                confs = arr[:, 4]
-                class_ids = arr[:, 5].astype(int)
-        else:
-            xywh = arr[:, :4]
-            obj_conf = arr[:, 4]
-            class_probs = arr[:, 5:]
-            class_ids = np.argmax(class_probs, axis=1)
-            cls_conf = class_probs[np.arange(len(class_ids)), class_ids]
-            confs = obj_conf * cls_conf
-
-        if xywh.size == 0:
-            boxes_keep = []
-        else:
-            xc = xywh[:,0].astype(float)
-            yc = xywh[:,1].astype(float)
-            ww = xywh[:,2].astype(float)
-            hh = xywh[:,3].astype(float)
-            max_val = np.nanmax([xc.max() if xc.size else 0,
-                                 yc.max() if yc.size else 0,
-                                 ww.max() if ww.size else 0,
-                                 hh.max() if hh.size else 0])
-            if max_val <= 1.0 + 1e-6:
-                xc = xc * w0; yc = yc * h0; ww = ww * w0; hh = hh * h0
-            elif max_val <= IMG_SIZE + 1e-6:
-                sx = w0 / IMG_SIZE; sy = h0 / IMG_SIZE
-                xc = xc * sx; ww = ww * sx; yc = yc * sy; hh = hh * sy
-
-            x1 = np.clip(xc - ww/2.0, 0, w0-1).astype(int)
-            y1 = np.clip(yc - hh/2.0, 0, h0-1).astype(int)
-            x2 = np.clip(xc + ww/2.0, 0, w0-1).astype(int)
-            y2 = np.clip(yc + hh/2.0, 0, h0-1).astype(int)
-
-            boxes_all = np.stack([x1,y1,x2,y2], axis=1)
-            scores_all = confs
-            mask = scores_all > CONF_THRESHOLD
-            if np.count_nonzero(mask) == 0:
-                boxes_keep = []
-            else:
-                boxes_f = boxes_all[mask]
-                scores_f = scores_all[mask]
-                cls_f = class_ids[mask] if len(class_ids) else np.zeros(len(scores_f), dtype=int)
-                keep_idx = simple_nms(boxes_f, scores_f, NMS_IOU)
-                boxes_keep = [(boxes_f[i], scores_f[i], int(cls_f[i])) for i in keep_idx]
-
-        for box, score, cid in boxes_keep:
-            x1, y1, x2, y2 = box
-            cv2.rectangle(frame, (x1, y1), (x2, y2), (0,255,0), 2)
-            label = f"Pencil {score:.2f}"
-            cv2.putText(frame, label, (x1, max(y1-8,0)), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0,255,0), 2)
+        dets = detector.nms(detector.decode(output))
+    if detect:
+        for (x1, y1, x2, y2), score in zip(dets.boxes.astype(int), dets.scores):
             print(f"Pencil detected — conf: {score:.3f}, box: ({x1},{y1},{x2},{y2})")
-
-            cx = (x1 + x2) // 2
-            cy = (y1 + y2) // 2
-            bw = x2 - x1
-            bh = y2 - y1
-
-            global is_busy
-            if score > 0.6 and not is_busy:
-                confirm_count += 1
-                if confirm_count >= CONFIRM_FRAMES:
-                    confirm_count = 0
-                    threading.Thread(
-                        target=pick_sequence,
-                        args=(frame.shape[1], frame.shape[0], (cx, cy, bw, bh)),
-                        daemon=True
-                    ).start()
-            else:
-                confirm_count = 0
-
-        fps = 1.0 / (t1 - t0) if (t1 - t0) > 0 else 0
-        cv2.putText(frame, f"FPS:{fps:.1f}", (10,30),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0,255,255), 2)
-
-        _, jpeg = cv2.imencode('.jpg', frame)
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + jpeg.tobytes() + b'\r\n')
+        tracks = tracker.update(dets)
+    else:
+        # between detector runs the Kalman prediction keeps the boxes moving
+        tracks = tracker.predict()
+    kinds = cascade.update(frame, tracks) if cascade else {}  # before anything is drawn on the frame
+
+    roi.draw(frame)
+    target = None
+    for track in tracks:
+        x1, y1, x2, y2 = track.box.astype(int)
+        color = (0,255,0) if track.since_update == 0 else (0,200,255)
+        cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+        kind = kinds.get(track.track_id, ("Pencil",))[0]
+        label = f"{kind} #{track.track_id} {track.score:.2f}"
+        cv2.putText(frame, label, (x1, max(y1-8,0)), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+        if track.confirmed(PICK_CONF, CONFIRM_FRAMES) and (target is None or track.mean_score > target.mean_score):
+            target = track
+        elif switching and track.since_update == 0 and track.score > PICK_CONF:
+            detector.boost()  # a pick is coming: confirm and aim it at full resolution
+
+    if detect and target is not None and not arm.busy:
+        if pick_sequence(frame.shape[1], frame.shape[0], target.center_size()):
+            PICK_TRIGGERS.inc()
+
+    # whole stage (preprocess .. drawing), per-stage split is on /metrics
+    dt = time.perf_counter() - t0
+    fps = 1.0 / dt if dt > 0 else 0
+    cv2.putText(frame, f"FPS:{fps:.1f}", (10,30),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0,255,255), 2)
+
+    return frame
+
+# Camera read, inference and JPEG encode each get their own thread
+pipeline = FramePipeline(cap, process)
 
 # -------------------------
 # Flask app
@@ -261,8 +217,31 @@ app = Flask(__name__)
 
 @app.route('/video')
 def video():
-    return Response(generate(), mimetype='multipart/x-mixed-replace; boundary=frame')
+    return Response(pipeline.stream(request.remote_addr), mimetype=MJPEG_MIMETYPE)
+
+@app.route('/video/stats')
+def video_stats():
+    return jsonify(pipeline.hub.stats())
+
+@app.route('/arm/stats')
+def arm_stats():
+    return jsonify(arm.stats())
+
+@app.route('/detector/stats')
+def detector_stats():
+    return jsonify(detector.stats() if switching else {"size": detector.size})
+
+@app.route('/gate/stats')
+def gate_stats():
+    return jsonify(gate.stats())
+
+@app.route('/cascade/stats')
+def cascade_stats():
+    return jsonify(cascade.stats() if cascade else {})
+
+register_metrics_route(app)
 
 if __name__ == '__main__':
+    pipeline.start()
     print("Server running — open http://<pi_ip>:5000/video")
     app.run(host='0.0.0.0', port=5000)
@@ -1,8 +1,9 @@
+import os
 import serial
 import time
 
-# Use the correct port
-ser = serial.Serial('/dev/ttyACM0', 115200, timeout=1)
+# Use the correct port (ARM_SERIAL_PORT=<pty> to talk to arduino_sim.py)
+ser = serial.Serial(os.environ.get("ARM_SERIAL_PORT", "/dev/ttyACM0"), 115200, timeout=1)
 time.sleep(2)  # wait for Arduino reset
 
 print("Sending HOME...")
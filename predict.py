@@ -1,33 +1,24 @@
 #!/usr/bin/env python3
 import cv2
 import numpy as np
-import tflite_runtime.interpreter as tflite
 
-# --- Load TFLite Model ---
-interpreter = tflite.Interpreter(model_path="veggie_model.tflite")
-interpreter.allocate_tensors()
-input_details = interpreter.get_input_details()
-output_details = interpreter.get_output_details()
+from detectors import TFLiteDetector
+from frame_source import source_from_cli
 
-# --- Labels (must match training order) ---
-labels = ["tomato", "potato"]
+# --- Load TFLite Model (128x128 BGR in [0, 1]; labels must match training order) ---
+detector = TFLiteDetector("veggie_model.tflite", labels=["tomato", "potato"]).warmup()
+labels = detector.labels
 
-# --- Camera Setup ---
-cap = cv2.VideoCapture(0)
+# --- Camera Setup (--source picks a video / image dir / synthetic instead) ---
+cap = source_from_cli()
 
 while True:
     ret, frame = cap.read()
     if not ret:
         continue
 
-    # --- Preprocess frame ---
-    img = cv2.resize(frame, (128, 128))
-    img = np.expand_dims(img, axis=0).astype(np.float32) / 255.0
-
-    # --- Run inference ---
-    interpreter.set_tensor(input_details[0]['index'], img)
-    interpreter.invoke()
-    output = interpreter.get_tensor(output_details[0]['index'])[0]
+    # --- Preprocess + run inference ---
+    output = detector.detect(frame).classification
 
     label_id = int(np.argmax(output))
     confidence = float(np.max(output))
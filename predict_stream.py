@@ -2,6 +2,9 @@ import cv2
 from flask import Flask, Response
 from edge_impulse_linux.image import ImageImpulseRunner
 
+from frame_source import source_from_cli
+from metrics import FRAMES, STAGE_SECONDS, register_metrics_route
+
 # Path to Edge Impulse model file
 MODEL_PATH = "/home/kartik/robot/vegetable-detection-linux-aarch64-v2.eim"
 
@@ -24,7 +27,7 @@ labels = model_info['model_parameters']['labels']
 print(f"Expecting input shape: ({input_h},{input_w},{channels}) with labels {labels}")
 
 def generate_frames():
-    cap = cv2.VideoCapture(0)
+    cap = source_from_cli()
 
     while True:
         ret, frame = cap.read()
@@ -35,8 +38,10 @@ def generate_frames():
         resized = cv2.resize(frame, (input_w, input_h))
 
         try:
-            features, _ = runner.get_features_from_image(resized)
-            res = runner.classify(features)
+            with STAGE_SECONDS.labels("infer").time():
+                features, _ = runner.get_features_from_image(resized)
+                res = runner.classify(features)
+            FRAMES.labels("inferred").inc()
 
             print("RAW RESULT:", res)  # Debug
 
@@ -60,7 +65,8 @@ def generate_frames():
             print("Inference error:", e)
 
         # Encode frame for streaming
-        ret, buffer = cv2.imencode('.jpg', frame)
+        with STAGE_SECONDS.labels("encode").time():
+            ret, buffer = cv2.imencode('.jpg', frame)
         frame_bytes = buffer.tobytes()
         yield (b'--frame\r\n'
                b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
@@ -70,6 +76,8 @@ def video_feed():
     return Response(generate_frames(),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
 
+register_metrics_route(app)
+
 if __name__ == "__main__":
     print("Open browser at http://<pi-ip>:5000/video to view live stream")
     app.run(host="0.0.0.0", port=5000)
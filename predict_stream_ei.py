@@ -3,100 +3,89 @@
 predict_stream_ei.py
 Live Raspberry Pi camera stream with Edge Impulse model predictions overlaid.
 
+Capture, inference and JPEG encoding run in a FramePipeline: each stage
+blocks until the previous one hands over a new frame, every frame is encoded
+once and fanned out to all viewers, and nothing spins while the camera or
+the model is busy. /video?fps=5 caps one viewer's frame rate; the [PIPE]
+log line and /metrics (robot_cpu_percent) show the CPU it all costs.
+
 Requirements:
     pip install flask opencv-python-headless edge-impulse-linux numpy
 """
 
+import os
+
+from flask import Flask, Response, jsonify, request
 import cv2
-import time
-import threading
-from flask import Flask, Response
-from edge_impulse_linux.image import ImageImpulseRunner
 
-# Path to your .eim model
-MODEL_PATH = "./vegetable-detection-linux-armv7-v1.eim"
+from detectors import EdgeImpulseDetector
+from ei_runner_pool import EiPooledFramePipeline, EiRunnerPool
+from frame_pipeline import FramePipeline
+from frame_source import source_from_cli
+from metrics import register_metrics_route
+from mjpeg_hub import MJPEG_MIMETYPE
+
+# Path to your .eim model ($EI_MODEL, e.g. ./eim_stub.py without the camera model)
+MODEL_PATH = os.environ.get("EI_MODEL", "./vegetable-detection-linux-armv7-v1.eim")
+# EI_RUNNERS=3 runs 3 copies of the model with frames in flight on all of them (ei_runner_pool.py)
+EI_RUNNERS = int(os.environ.get("EI_RUNNERS", "1"))
 
 # Initialize Flask app
 app = Flask(__name__)
-output_frame = None
-lock = threading.Lock()
 
 
-def capture_and_predict():
-    global output_frame
-
+def draw_predictions(frame, labels, predictions):
+    y0 = 30
+    for label in labels:
+        conf = predictions.get(label, 0.0)
+        text = f"{label}: {conf*100:.1f}%"
+        cv2.putText(frame, text, (10, y0),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+        y0 += 30
+    return frame
+
+
+# Open the Pi camera (0 is default, --source picks another)
+cap = source_from_cli(640, 480)
+if not cap.isOpened():
+    raise RuntimeError("Cannot open camera")
+
+if EI_RUNNERS > 1:
+    # depth=0: every submitted frame starts at once, none waits behind a stale one
+    pool = EiRunnerPool(MODEL_PATH, runners=EI_RUNNERS, depth=0)
+    labels = pool.labels
+    pipeline = EiPooledFramePipeline(
+        cap, pool, lambda frame, res: draw_predictions(frame, labels, res.result.get('classification', {})))
+else:
     # Load the Edge Impulse model
-    with ImageImpulseRunner(MODEL_PATH) as runner:
-        model_info = runner.init()
-        labels = model_info['model_parameters']['labels']
-        print("Labels:", labels)
-
-        # Open the Pi camera (0 is default)
-        cap = cv2.VideoCapture(0)
-        cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-
-        if not cap.isOpened():
-            print("Cannot open camera")
-            return
-
-        print("Starting live predictions...")
-
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                continue
-
-            # Convert frame to RGB for EI
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-
-            # Run inference
-            features = runner.get_features_from_image(rgb_frame)
-            res = runner.classify(features)
-
-            # Overlay predictions on frame
-            predictions = res['classification']
-            y0 = 30
-            for label in labels:
-                conf = predictions.get(label, 0.0)
-                text = f"{label}: {conf*100:.1f}%"
-                cv2.putText(frame, text, (10, y0),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-                y0 += 30
-
-            # Save the frame for streaming
-            with lock:
-                output_frame = frame.copy()
-
-        cap.release()
-
-
-def generate():
-    global output_frame
-    while True:
-        with lock:
-            if output_frame is None:
-                continue
-            # Encode frame as JPEG
-            ret, jpeg = cv2.imencode('.jpg', output_frame)
-            if not ret:
-                continue
-            frame_bytes = jpeg.tobytes()
-
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+    detector = EdgeImpulseDetector(MODEL_PATH).warmup()
+    labels = detector.labels
+
+    def process(frame):
+        scores = detector.detect(frame).classification
+        return draw_predictions(frame, labels, dict(zip(labels, scores)))
+
+    pipeline = FramePipeline(cap, process)
+print("Labels:", labels)
 
 
 @app.route('/video')
 def video_feed():
-    return Response(generate(),
-                    mimetype='multipart/x-mixed-replace; boundary=frame')
+    fps = request.args.get("fps", type=float)  # per-viewer cap, default $MJPEG_MAX_FPS
+    return Response(pipeline.stream(request.remote_addr, max_fps=fps), mimetype=MJPEG_MIMETYPE)
+
+
+@app.route('/video/stats')
+def video_stats():
+    return jsonify(pipeline.hub.stats())
+
+
+register_metrics_route(app)
 
 
 if __name__ == "__main__":
-    # Start camera thread
-    t = threading.Thread(target=capture_and_predict, daemon=True)
-    t.start()
+    print("Starting live predictions...")
+    pipeline.start()
 
     print("Open browser at http://<pi_ip>:5000/video to view live stream")
     app.run(host='0.0.0.0', port=5000, threaded=True)
@@ -3,105 +3,89 @@
 predict_stream_ei_arm64.py
 Live Raspberry Pi 5 camera stream with Edge Impulse ARM64 (.eim) predictions.
 
+Capture, inference and JPEG encoding run in a FramePipeline: each stage
+blocks until the previous one hands over a new frame, every frame is encoded
+once and fanned out to all viewers, and nothing spins while the camera or
+the model is busy. /video?fps=5 caps one viewer's frame rate; the [PIPE]
+log line and /metrics (robot_cpu_percent) show the CPU it all costs.
+
 Requirements:
     pip install flask opencv-python-headless edge-impulse-linux numpy
 """
 
+import os
+
+from flask import Flask, Response, jsonify, request
 import cv2
-import time
-import threading
-from flask import Flask, Response
-from edge_impulse_linux.image import ImageImpulseRunner
 
-# Path to your ARM64 .eim model
-MODEL_PATH = "./vegetable-detection-linux-aarch64-v2.eim"
+from detectors import EdgeImpulseDetector
+from ei_runner_pool import EiPooledFramePipeline, EiRunnerPool
+from frame_pipeline import FramePipeline
+from frame_source import source_from_cli
+from metrics import register_metrics_route
+from mjpeg_hub import MJPEG_MIMETYPE
 
+# Path to your ARM64 .eim model ($EI_MODEL, e.g. ./eim_stub.py without the camera model)
+MODEL_PATH = os.environ.get("EI_MODEL", "./vegetable-detection-linux-aarch64-v2.eim")
+# EI_RUNNERS=3 runs 3 copies of the model with frames in flight on all of them (ei_runner_pool.py)
+EI_RUNNERS = int(os.environ.get("EI_RUNNERS", "1"))
 
 # Flask app
 app = Flask(__name__)
-output_frame = None
-lock = threading.Lock()
-
-
-def capture_and_predict():
-    global output_frame
-
-    # Make sure model is executable
-    import os
-    if not os.access(MODEL_PATH, os.X_OK):
-        os.chmod(MODEL_PATH, 0o755)
-
-    # Initialize Edge Impulse runner
-    with ImageImpulseRunner(MODEL_PATH) as runner:
-        model_info = runner.init()
-        labels = model_info['model_parameters']['labels']
-        print("Labels:", labels)
 
-        # Open Pi camera
-        cap = cv2.VideoCapture(0)
-        cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
 
-        if not cap.isOpened():
-            print("Cannot open camera")
-            return
+def draw_predictions(frame, labels, predictions):
+    y0 = 30
+    for label in labels:
+        conf = predictions.get(label, 0.0)
+        text = f"{label}: {conf*100:.1f}%"
+        cv2.putText(frame, text, (10, y0),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+        y0 += 30
+    return frame
 
-        print("Starting live predictions...")
 
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                continue
+# Open Pi camera (or --source clip.mp4 / data dir / synthetic)
+cap = source_from_cli(640, 480)
+if not cap.isOpened():
+    raise RuntimeError("Cannot open camera")
 
-            # Convert frame to RGB
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+if EI_RUNNERS > 1:
+    # depth=0: every submitted frame starts at once, none waits behind a stale one
+    pool = EiRunnerPool(MODEL_PATH, runners=EI_RUNNERS, depth=0)
+    labels = pool.labels
+    pipeline = EiPooledFramePipeline(
+        cap, pool, lambda frame, res: draw_predictions(frame, labels, res.result.get('classification', {})))
+else:
+    # Initialize Edge Impulse runner (made executable if needed)
+    detector = EdgeImpulseDetector(MODEL_PATH).warmup()
+    labels = detector.labels
 
-            # Run inference
-            features = runner.get_features_from_image(rgb_frame)
-            res = runner.classify(features)
+    def process(frame):
+        scores = detector.detect(frame).classification
+        return draw_predictions(frame, labels, dict(zip(labels, scores)))
 
-            # Overlay predictions on frame
-            predictions = res['classification']
-            y0 = 30
-            for label in labels:
-                conf = predictions.get(label, 0.0)
-                text = f"{label}: {conf*100:.1f}%"
-                cv2.putText(frame, text, (10, y0),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-                y0 += 30
+    pipeline = FramePipeline(cap, process)
+print("Labels:", labels)
 
-            # Save frame for streaming
-            with lock:
-                output_frame = frame.copy()
-
-        cap.release()
 
+@app.route('/video')
+def video_feed():
+    fps = request.args.get("fps", type=float)  # per-viewer cap, default $MJPEG_MAX_FPS
+    return Response(pipeline.stream(request.remote_addr, max_fps=fps), mimetype=MJPEG_MIMETYPE)
 
-def generate():
-    global output_frame
-    while True:
-        with lock:
-            if output_frame is None:
-                continue
-            ret, jpeg = cv2.imencode('.jpg', output_frame)
-            if not ret:
-                continue
-            frame_bytes = jpeg.tobytes()
 
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+@app.route('/video/stats')
+def video_stats():
+    return jsonify(pipeline.hub.stats())
 
 
-@app.route('/video')
-def video_feed():
-    return Response(generate(),
-                    mimetype='multipart/x-mixed-replace; boundary=frame')
+register_metrics_route(app)
 
 
 if __name__ == "__main__":
-    # Start camera thread
-    t = threading.Thread(target=capture_and_predict, daemon=True)
-    t.start()
+    print("Starting live predictions...")
+    pipeline.start()
 
     print("Open browser at http://<pi_ip>:5000/video to view live stream")
     app.run(host='0.0.0.0', port=5000, threaded=True)
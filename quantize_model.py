@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+quantize_model.py
+Build INT8 variants of best.onnx and pick the one the detectors should load.
+
+Calibration images come from capture_dataset.py (data/<class>/*.jpg) and go
+through the same letterbox preprocessing the detectors use. The tool writes
+    best.int8-dynamic.onnx   weights INT8, activations quantized at run time
+    best.int8-static.onnx    QDQ weights + activations, calibrated on the dataset
+and compares them with float32 on model size, latency and detection agreement
+(F1 of post-NMS boxes matched to the float32 boxes at IoU >= 0.5). The
+fastest variant that keeps agreement above --min-agreement is recorded in
+best.recommended.json, which ort_session.create_session() picks up.
+
+Usage:
+    python quantize_model.py --model best.onnx --data data [--calib 100] [--eval 50]
+"""
+
+import argparse
+import glob
+import json
+import os
+import random
+import time
+
+import cv2
+import numpy as np
+from onnxruntime.quantization import (CalibrationDataReader, CalibrationMethod, QuantFormat,
+                                      QuantType, quant_pre_process, quantize_dynamic,
+                                      quantize_static)
+
+from nms import box_iou_matrix, nms
+from ort_session import create_session, recommendation_path
+from preprocess import BoundSession, Preprocessor
+from yolo_decode import decode
+
+CONF_THRESHOLD = 0.30
+NMS_IOU = 0.45
+
+
+def list_images(data_dir):
+    paths = []
+    for ext in ("jpg", "jpeg", "png"):
+        paths += glob.glob(os.path.join(data_dir, "**", f"*.{ext}"), recursive=True)
+    return sorted(paths)
+
+
+class DatasetReader(CalibrationDataReader):
+    """Feeds letterboxed dataset images to the ORT calibrator one at a time."""
+
+    def __init__(self, paths, input_name, size):
+        self.paths = iter(paths)
+        self.input_name = input_name
+        self.pre = Preprocessor(size)
+
+    def get_next(self):
+        for path in self.paths:
+            frame = cv2.imread(path)
+            if frame is None:
+                continue
+            tensor, _, _ = self.pre(frame)
+            return {self.input_name: tensor.copy()}
+        return None
+
+
+def detect(runner, pre, frame, size):
+    h, w = frame.shape[:2]
+    _, ratio, pad = pre(frame)
+    dets = decode(runner.run(), w, h, input_size=size, conf_threshold=CONF_THRESHOLD,
+                  ratio=ratio, pad=pad)
+    keep = nms(dets.boxes, dets.scores, dets.class_ids, NMS_IOU)
+    return dets.boxes[keep], dets.class_ids[keep]
+
+
+def agreement(ref, test, iou_thr=0.5):
+    """Greedy one-to-one matching of same-class boxes -> (matched, n_ref, n_test)"""
+    ref_boxes, ref_cls = ref
+    boxes, cls = test
+    if len(ref_boxes) == 0 or len(boxes) == 0:
+        return 0, len(ref_boxes), len(boxes)
+    iou = box_iou_matrix(ref_boxes, boxes)
+    iou[ref_cls[:, None] != cls[None, :]] = 0
+    matched = 0
+    while True:
+        i, j = np.unravel_index(np.argmax(iou), iou.shape)
+        if iou[i, j] < iou_thr:
+            break
+        matched += 1
+        iou[i, :] = 0
+        iou[:, j] = 0
+    return matched, len(ref_boxes), len(boxes)
+
+
+def evaluate(path, frames, size, reference=None):
+    sess = create_session(path, cache=False, use_recommended=False)
+    pre = Preprocessor(size)
+    runner = BoundSession(sess, pre.input)
+    results, times = [], []
+    for frame in frames:
+        t0 = time.perf_counter()
+        results.append(detect(runner, pre, frame, size))
+        times.append(time.perf_counter() - t0)
+    times = np.array(times) * 1000.0
+    report = {
+        "path": path,
+        "size_mb": os.path.getsize(path) / 1e6,
+        "latency_ms_p50": float(np.median(times)),
+        "latency_ms_p95": float(np.percentile(times, 95)),
+        "detections": int(sum(len(b) for b, _ in results)),
+    }
+    if reference is not None:
+        m = n_ref = n_test = 0
+        for ref, test in zip(reference, results):
+            a, b, c = agreement(ref, test)
+            m, n_ref, n_test = m + a, n_ref + b, n_test + c
+        # nothing detected by either model counts as full agreement
+        report["agreement_f1"] = 1.0 if n_ref + n_test == 0 else 2.0 * m / (n_ref + n_test)
+    return report, results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="best.onnx")
+    parser.add_argument("--data", default="data", help="capture_dataset.py output dir")
+    parser.add_argument("--size", type=int, default=640)
+    parser.add_argument("--calib", type=int, default=100, help="calibration images")
+    parser.add_argument("--eval", type=int, default=50, help="evaluation images")
+    parser.add_argument("--min-agreement", type=float, default=0.9)
+    parser.add_argument("--exclude", default="", help="comma separated node names to keep in float")
+    args = parser.parse_args()
+
+    paths = list_images(args.data)
+    if not paths:
+        print(f"No images found under {args.data}. Capture some with capture_dataset.py first.")
+        exit(1)
+    random.Random(0).shuffle(paths)
+    n_calib, n_eval = args.calib, args.eval
+    if len(paths) < n_calib + n_eval:
+        # disjoint sets, or static INT8 gets scored on its own calibration images
+        if len(paths) < 2:
+            print(f"Need at least 2 images under {args.data} (calibration + evaluation), found {len(paths)}.")
+            exit(1)
+        n_eval = max(1, len(paths) * args.eval // (args.calib + args.eval))
+        n_calib = len(paths) - n_eval
+        print(f"[WARN] Only {len(paths)} images for --calib {args.calib} + --eval {args.eval}; "
+              f"splitting them {n_calib} / {n_eval}")
+    calib_paths = paths[:n_calib]
+    eval_paths = paths[n_calib:n_calib + n_eval]
+    print(f"[INFO] {len(paths)} images: {len(calib_paths)} for calibration, {len(eval_paths)} for evaluation")
+
+    stem, _ = os.path.splitext(args.model)
+    prepped = f"{stem}.prep.onnx"
+    try:
+        # YOLO exports have static shapes, so the sympy-based pass isn't needed
+        quant_pre_process(args.model, prepped, skip_symbolic_shape=True)
+    except Exception as e:
+        print("[WARN] quant_pre_process failed, quantizing the raw graph:", e)
+        prepped = args.model
+    exclude = [n for n in args.exclude.split(",") if n]
+
+    variants = {"fp32": args.model}
+
+    dynamic_path = f"{stem}.int8-dynamic.onnx"
+    print("[INFO] Dynamic quantization ->", dynamic_path)
+    quantize_dynamic(prepped, dynamic_path, weight_type=QuantType.QUInt8,
+                     nodes_to_exclude=exclude)
+    variants["int8-dynamic"] = dynamic_path
+
+    static_path = f"{stem}.int8-static.onnx"
+    print("[INFO] Static quantization ->", static_path)
+    input_name = create_session(args.model, cache=False, warmup_runs=0,
+                                use_recommended=False).get_inputs()[0].name
+    quantize_static(prepped, static_path,
+                    DatasetReader(calib_paths, input_name, args.size),
+                    quant_format=QuantFormat.QDQ,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8,
+                    per_channel=True, calibrate_method=CalibrationMethod.MinMax,
+                    nodes_to_exclude=exclude)
+    variants["int8-static"] = static_path
+    if prepped != args.model:
+        os.remove(prepped)
+
+    frames = [f for f in (cv2.imread(p) for p in eval_paths) if f is not None]
+    report = {}
+    reference = None
+    for name, path in variants.items():
+        try:
+            r, results = evaluate(path, frames, args.size, reference)
+        except Exception as e:
+            if name == "fp32":
+                # the reference for every agreement score; nothing to compare against without it
+                print(f"[ERROR] {args.model} failed to run, can't evaluate the INT8 variants: {e}")
+                exit(1)
+            print(f"[WARN] {name} failed to run: {e}")
+            continue
+        if name == "fp32":
+            reference = results
+            r["agreement_f1"] = 1.0
+        report[name] = r
+
+    print(f"{'variant':<14} {'size MB':>8} {'p50 ms':>8} {'p95 ms':>8} {'dets':>6} {'agree':>6}")
+    for name, r in report.items():
+        print(f"{name:<14} {r['size_mb']:>8.2f} {r['latency_ms_p50']:>8.2f} "
+              f"{r['latency_ms_p95']:>8.2f} {r['detections']:>6} {r['agreement_f1']:>6.3f}")
+
+    # fp32 is the reference and always agrees with itself; only the INT8 variants compete with it
+    ok = [n for n, r in report.items() if n != "fp32" and r["agreement_f1"] >= args.min_agreement]
+    if not ok:
+        print(f"[WARN] No INT8 variant reaches agreement {args.min_agreement}; recommending fp32")
+    best = min(ok + ["fp32"], key=lambda n: report[n]["latency_ms_p50"])
+    rec = {"variant": best, "model": os.path.basename(variants[best]), "report": report}
+    with open(recommendation_path(args.model), "w") as f:
+        json.dump(rec, f, indent=2)
+    print(f"[INFO] Recommended: {best} ({variants[best]}) -> {recommendation_path(args.model)}")
+
+
+if __name__ == "__main__":
+    main()
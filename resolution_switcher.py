@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+resolution_switcher.py
+Switch between warm exports of the model at several input sizes to stay
+inside a per-frame latency budget.
+
+Export the model once per size next to the original, named after it:
+    yolo export model=best.pt format=onnx imgsz=320   -> best_320.onnx
+    yolo export model=best.pt format=onnx imgsz=416   -> best_416.onnx
+A model with dynamic spatial axes serves every size by itself. All sessions
+are created (and warmed up by ort_session) at start-up, so a switch is a
+pointer swap, never a session load in the middle of the stream.
+
+Every detect() is timed end to end (preprocess .. NMS). The switcher then:
+    - drops one size when the rolling median of the current size is over budget
+    - goes up one size when that size is expected to fit in headroom * budget:
+      its own median if measured in the last `stale` seconds, else the
+      current median scaled by the pixel count
+    - runs at the largest size while boost() is active, e.g. just before a
+      pick is confirmed, so the box the arm goes for is the most precise one
+A size must run for min_frames frames before the next switch (hysteresis).
+
+Scripts pick this up from the environment (see detector_from_env):
+    RESOLUTIONS=320,416,640 FRAME_BUDGET_MS=80 python detect_stream.py
+Without RESOLUTIONS they get a plain YoloDetector at $IMG_SIZE (default 640).
+
+    python resolution_switcher.py --source clip.mp4 --model best.onnx --sizes 320,416,640 --budget 80
+prints the latency per size and how the switcher split a run between them.
+"""
+
+import argparse
+import collections
+import contextlib
+import os
+import sys
+import time
+
+import numpy as np
+
+from metrics import Counter, Gauge
+from yolo_detector import YoloDetector
+
+INPUT_SIZE = Gauge("robot_input_size", "Model input resolution in use")
+RESOLUTION_SWITCHES = Counter("robot_resolution_switches_total", "Input resolution changes")
+
+
+def variant_path(model_path, size):
+    """best.onnx -> best_320.onnx"""
+    root, ext = os.path.splitext(model_path)
+    return f"{root}_{size}{ext}"
+
+
+def _input_hw(model_path):
+    """(h, w) of the model input, None for dynamic axes; a bare session, no optimization or warm-up"""
+    import onnxruntime as ort
+
+    opts = ort.SessionOptions()
+    opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+    sess = ort.InferenceSession(model_path, opts, providers=["CPUExecutionProvider"])
+    shape = sess.get_inputs()[0].shape
+    return tuple(d if isinstance(d, int) else None for d in shape[2:4])
+
+
+class ResolutionSwitcher:
+    """
+    detectors  : {size: YoloDetector}, all loaded up front
+    budget_ms  : target detect() latency per frame
+    window     : latencies kept per size for the rolling median
+    min_frames : frames at a size before switching again
+    headroom   : go up only if the larger size is expected under headroom * budget
+    stale      : seconds after which a size's own measurements are no longer trusted
+    """
+
+    def __init__(self, detectors, budget_ms=100.0, window=30, min_frames=15, headroom=0.8,
+                 stale=10.0, start=None):
+        if not detectors:
+            raise ValueError("ResolutionSwitcher needs at least one detector")
+        self.sizes = sorted(detectors)
+        self.detectors = detectors
+        self.budget = budget_ms / 1000.0
+        self.min_frames = min_frames
+        self.headroom = headroom
+        self.stale = stale
+        self._latency = {s: collections.deque(maxlen=window) for s in self.sizes}
+        self._measured_at = dict.fromkeys(self.sizes, 0.0)
+        self._index = self.sizes.index(start) if start in detectors else len(self.sizes) - 1
+        self._frames_at_size = 0
+        self._boost_until = 0.0
+        self.switches = 0
+        INPUT_SIZE.set(self.size)
+
+    @classmethod
+    def from_model(cls, model_path, sizes, conf_threshold=0.3, iou_threshold=0.45, profile=None,
+                   **kwargs):
+        """Load best_<size>.onnx for every size (or the model itself where its input fits)."""
+        detectors = {}
+        input_hw = {}
+        for size in sizes:
+            path = variant_path(model_path, size)
+            if not os.path.exists(path):
+                path = model_path
+            if path not in input_hw:
+                input_hw[path] = _input_hw(path)
+            h, w = input_hw[path]
+            if (h or size, w or size) != (size, size):
+                print(f"[WARN] No {size}x{size} export ({variant_path(model_path, size)}), skipping {size}")
+                continue
+            detectors[size] = YoloDetector(path, size, conf_threshold, iou_threshold, profile)
+        return cls(detectors, **kwargs)
+
+    # ---- the YoloDetector surface the scripts use ----
+    @property
+    def detector(self):
+        return self.detectors[self.sizes[self._index]]
+
+    @property
+    def size(self):
+        return self.sizes[self._index]
+
+    def __getattr__(self, name):
+        # sess, conf_threshold, ... of the size in use
+        if name.startswith("_") or name == "detectors":
+            raise AttributeError(name)
+        return getattr(self.detector, name)
+
+    def detect(self, frame):
+        size = self.size
+        t0 = time.perf_counter()
+        dets = self.detector.detect(frame)
+        self._record(size, time.perf_counter() - t0)
+        return dets
+
+    # ---- policy ----
+    def boost(self, seconds=1.0):
+        """Run at the largest size for the next `seconds`."""
+        self._boost_until = max(self._boost_until, time.monotonic() + seconds)
+
+    def median_ms(self, size):
+        lat = self._latency[size]
+        return float(np.median(lat)) * 1000.0 if lat else None
+
+    def _expected(self, size, now):
+        lat = self._latency[size]
+        if lat and now - self._measured_at[size] < self.stale:
+            return float(np.median(lat))
+        current = self._latency[self.size]
+        return float(np.median(current)) * (size / self.size) ** 2
+
+    def _record(self, size, seconds):
+        now = time.monotonic()
+        self._latency[size].append(seconds)
+        self._measured_at[size] = now
+        self._frames_at_size += 1
+
+        index = self._index
+        if now < self._boost_until:
+            index = len(self.sizes) - 1
+        elif self._frames_at_size >= self.min_frames:
+            current = float(np.median(self._latency[size]))
+            if current > self.budget and index > 0:
+                index -= 1
+            elif (index + 1 < len(self.sizes)
+                  and self._expected(self.sizes[index + 1], now) < self.headroom * self.budget):
+                index += 1
+        if index != self._index:
+            self._index = index
+            self._frames_at_size = 0
+            self._latency[self.size].clear()  # judge the new size on fresh samples only
+            self.switches += 1
+            RESOLUTION_SWITCHES.inc()
+            INPUT_SIZE.set(self.size)
+
+    def stats(self):
+        return {
+            "size": self.size,
+            "budget_ms": self.budget * 1000.0,
+            "boosted": time.monotonic() < self._boost_until,
+            "switches": self.switches,
+            "median_ms": {s: self.median_ms(s) for s in self.sizes},
+        }
+
+
+def detector_from_env(model_path, conf_threshold=0.3, iou_threshold=0.45, profile=None):
+    """
+    ResolutionSwitcher when $RESOLUTIONS lists sizes (budget $FRAME_BUDGET_MS),
+    else a YoloDetector at $IMG_SIZE.
+    """
+    sizes = os.environ.get("RESOLUTIONS", "")
+    if sizes:
+        return ResolutionSwitcher.from_model(
+            model_path, [int(s) for s in sizes.split(",")], conf_threshold, iou_threshold, profile,
+            budget_ms=float(os.environ.get("FRAME_BUDGET_MS", "100")))
+    return YoloDetector(model_path, int(os.environ.get("IMG_SIZE", "640")), conf_threshold,
+                        iou_threshold, profile)
+
+
+def main():
+    from frame_source import add_source_args, open_source
+
+    parser = argparse.ArgumentParser(description="Latency per input size and a switching run")
+    add_source_args(parser, default="synthetic")
+    parser.add_argument("--model", default="best.onnx")
+    parser.add_argument("--sizes", default="320,416,640")
+    parser.add_argument("--budget", type=float, default=100.0, help="ms per frame")
+    parser.add_argument("--frames", type=int, default=300)
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(sys.stderr):
+        switcher = ResolutionSwitcher.from_model(args.model, [int(s) for s in args.sizes.split(",")],
+                                                 budget_ms=args.budget)
+    source = open_source(args.source, rate="max", loop=False)
+    frames = []
+    while len(frames) < args.frames:
+        ok, frame = source.read()
+        if not ok:
+            break
+        frames.append(frame)
+    source.release()
+
+    print(f"{'size':>5} {'p50 ms':>8} {'p95 ms':>8}")
+    for size in switcher.sizes:
+        det = switcher.detectors[size]
+        ms = []
+        for frame in frames[:50]:
+            t0 = time.perf_counter()
+            det.detect(frame)
+            ms.append((time.perf_counter() - t0) * 1000.0)
+        print(f"{size:>5} {np.median(ms):>8.2f} {np.percentile(ms, 95):>8.2f}")
+
+    used = collections.Counter()
+    over = 0
+    for frame in frames:
+        used[switcher.size] += 1
+        t0 = time.perf_counter()
+        switcher.detect(frame)
+        over += time.perf_counter() - t0 > switcher.budget
+    split = ", ".join(f"{s}: {used[s] / len(frames):.0%}" for s in switcher.sizes)
+    print(f"[INFO] budget {args.budget:.0f}ms over {len(frames)} frames -> {split}; "
+          f"{switcher.switches} switches, {over / len(frames):.1%} frames over budget")
+
+
+if __name__ == "__main__":
+    main()
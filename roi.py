@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+"""
+roi.py
+Region-of-interest and tiled inference limited to the arm's workspace.
+
+The full-frame detector squashes all 640x480 pixels into the model input,
+including table the MeArm can never reach. RoiDetector only looks at the
+bounding rectangle of a workspace polygon:
+    crop   the rectangle is letterboxed into the model input on its own, so
+           the same model spends its pixels on the workspace
+    tiles  the rectangle is cut into overlapping tiles (default: the model's
+           input size, so no downscale at all) that run as ONE batched ORT
+           call; boxes are mapped back to frame coordinates and merged with
+           class-aware NMS
+Detections whose centre falls outside the polygon are dropped in both modes.
+Tiling wants a model exported at the tile size with a dynamic batch
+(yolo export format=onnx imgsz=320 dynamic=True). With a fixed batch of 1,
+or a model from export_nms_model.py (its (K, 6) rows carry no tile index),
+the tiles run one after another.
+
+Workspace file (workspace.json), pixel polygon at the given frame size:
+    {"frame_size": [640, 480], "polygon": [[u, v], ...]}
+    python roi.py set --polygon "120,80 520,80 600,470 40,470"
+    python roi.py from-calibration          # hull of the IK-reachable pixels
+Without a workspace file the reachable area from arm_calibration.json is
+used, and without either RoiDetector falls back to the full frame.
+
+Benchmark against full-frame inference (latency and recall of the labelled /
+synthetic ground truth inside the workspace):
+    python roi.py bench --source synthetic --model best.onnx --tile-model best_320.onnx
+    python roi.py bench --source dir:data --frames 200     # YOLO .txt labels next to the images
+
+Usage:
+    roi = RoiDetector(YoloDetector("best.onnx"), Workspace.load(), mode="crop")
+    dets = roi.detect(frame)             # Detections in frame coordinates
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from metrics import DETECTIONS, STAGE_SECONDS
+from nms import nms
+from preprocess import BoundSession, Preprocessor
+from yolo_decode import Detections, decode, empty_detections
+
+DEFAULT_PATH = "workspace.json"
+MODES = ("full", "crop", "tiles")
+
+
+class Workspace:
+    """Pixel polygon the arm can reach, stored at the frame size it was drawn on."""
+
+    def __init__(self, polygon, frame_size):
+        self.polygon = np.asarray(polygon, dtype=np.float64).reshape(-1, 2)
+        self.frame_size = tuple(frame_size)
+        if len(self.polygon) < 3:
+            raise ValueError("A workspace polygon needs at least 3 points")
+
+    def scaled(self, frame_w, frame_h):
+        """int32 polygon for a frame of this size"""
+        sx, sy = frame_w / self.frame_size[0], frame_h / self.frame_size[1]
+        return np.round(self.polygon * (sx, sy)).astype(np.int32)
+
+    def save(self, path=DEFAULT_PATH):
+        with open(path, "w") as f:
+            json.dump({"frame_size": list(self.frame_size), "polygon": self.polygon.tolist()}, f, indent=2)
+
+    @classmethod
+    def from_lookup(cls, lookup):
+        """Convex hull of the grid cells an ArmLookup can reach."""
+        iy, ix = np.nonzero(np.isfinite(lookup.grid[..., 0]))
+        if len(ix) < 3:
+            raise ValueError("The calibration leaves (almost) nothing reachable")
+        pts = np.stack([ix, iy], axis=1).astype(np.float32) * lookup.step
+        hull = cv2.convexHull(pts).reshape(-1, 2)
+        hull[:, 0] = np.clip(hull[:, 0], 0, lookup.frame_w - 1)
+        hull[:, 1] = np.clip(hull[:, 1], 0, lookup.frame_h - 1)
+        return cls(hull, (lookup.frame_w, lookup.frame_h))
+
+    @classmethod
+    def load(cls, path=DEFAULT_PATH, calibration=None):
+        """workspace.json, else the reachable area of arm_calibration.json, else None (full frame)"""
+        if os.path.exists(path):
+            with open(path) as f:
+                d = json.load(f)
+            return cls(d["polygon"], d["frame_size"])
+        from arm_kinematics import DEFAULT_PATH as CALIBRATION_PATH, ArmLookup
+        calibration = calibration or CALIBRATION_PATH
+        if os.path.exists(calibration):
+            with open(calibration) as f:
+                w, h = json.load(f).get("frame_size", (640, 480))
+            lookup = ArmLookup.load(w, h, path=calibration)
+            return cls.from_lookup(lookup)
+        return None
+
+
+def tile_origins(start, stop, tile, overlap):
+    """Evenly spaced tile starts covering [start, stop) with at least `overlap` of each tile shared."""
+    span = stop - start
+    if span <= tile:
+        return [start]
+    n = int(np.ceil((span - tile) / (tile * (1.0 - overlap)))) + 1
+    return [start + int(round(i * (span - tile) / (n - 1))) for i in range(n)]
+
+
+def _fit_axis(start, stop, inner_start, inner_stop, tile):
+    """Shrink [start, stop) to one tile if that still covers [inner_start, inner_stop)."""
+    if stop - start <= tile or inner_stop - inner_start > tile:
+        return start, stop
+    mid = (inner_start + inner_stop) // 2
+    lo = min(max(mid - tile // 2, start), stop - tile)
+    return lo, lo + tile
+
+
+class RoiDetector:
+    """
+    detector  : YoloDetector; its session, input size and thresholds are used
+    workspace : Workspace, or None for the full frame
+    mode      : "full", "crop" or "tiles"
+    tile      : tile side in frame pixels (tiles mode), default the model input size
+    overlap   : fraction of a tile shared with its neighbour, so objects on a seam
+                are whole in at least one tile
+    margin    : pixels added around the polygon's bounding rectangle
+    """
+
+    def __init__(self, detector, workspace=None, mode="crop", tile=None, overlap=0.2, margin=16):
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {MODES}, got {mode!r}")
+        self.detector = detector
+        self.workspace = workspace
+        self.mode = mode if workspace is not None or mode == "tiles" else "full"
+        self.tile = tile or detector.size
+        self.overlap = overlap
+        self.margin = margin
+        self._frame_wh = None
+        self._timers = {s: STAGE_SECONDS.labels(s) for s in ("preprocess", "infer", "decode", "nms")}
+
+    def _layout(self, w, h):
+        """Polygon mask, ROI rectangle and tile grid; only runs when the frame size changes."""
+        self._frame_wh = (w, h)
+        if self.workspace is None:
+            self.polygon = np.array([[0, 0], [w - 1, 0], [w - 1, h - 1], [0, h - 1]], dtype=np.int32)
+        else:
+            self.polygon = self.workspace.scaled(w, h)
+        self.mask = np.zeros((h, w), dtype=np.uint8)
+        cv2.fillPoly(self.mask, [self.polygon], 255)
+        x, y, rw, rh = cv2.boundingRect(self.polygon)
+        self.rect = (max(x - self.margin, 0), max(y - self.margin, 0),
+                     min(x + rw + self.margin, w), min(y + rh + self.margin, h))
+
+        x0, y0, x1, y1 = self.rect
+        if self.mode == "tiles":
+            # don't add a row / column of tiles just for the margin
+            x0, x1 = _fit_axis(x0, x1, x, x + rw, self.tile)
+            y0, y1 = _fit_axis(y0, y1, y, y + rh, self.tile)
+            self.rect = (x0, y0, x1, y1)
+        tw, th = min(self.tile, x1 - x0), min(self.tile, y1 - y0)
+        self.tiles = [(tx, ty, tw, th) for ty in tile_origins(y0, y1, th, self.overlap)
+                      for tx in tile_origins(x0, x1, tw, self.overlap)]
+        if self.mode != "tiles":
+            return
+        batch = self.detector.sess.get_inputs()[0].shape[0]
+        self.batched = (len(self.tiles) > 1 and (not isinstance(batch, int) or batch == len(self.tiles))
+                        and not self.detector.final)
+        if self.batched:
+            self._pre = Preprocessor(self.detector.size, batch=len(self.tiles))
+            self._runner = BoundSession(self.detector.sess, self._pre.input)
+        print(f"[INFO] ROI {self.rect} -> {len(self.tiles)} tiles of {tw}x{th}"
+              + (" in one batch" if self.batched else " run one by one"))
+
+    def _in_workspace(self, dets):
+        if not len(dets.boxes):
+            return dets
+        w, h = self._frame_wh
+        cx = np.clip(((dets.boxes[:, 0] + dets.boxes[:, 2]) / 2).astype(np.int32), 0, w - 1)
+        cy = np.clip(((dets.boxes[:, 1] + dets.boxes[:, 3]) / 2).astype(np.int32), 0, h - 1)
+        keep = self.mask[cy, cx] > 0
+        return Detections(dets.boxes[keep], dets.scores[keep], dets.class_ids[keep])
+
+    def _tiles(self, frame):
+        det = self.detector
+        parts = []
+        if self.batched:
+            t0 = time.perf_counter()
+            for i, (x, y, tw, th) in enumerate(self.tiles):
+                ratio, pad = self._pre.fill(frame[y:y + th, x:x + tw], i)
+            t1 = time.perf_counter()
+            output = self._runner.run()
+            t2 = time.perf_counter()
+            for i, (x, y, tw, th) in enumerate(self.tiles):
+                d = decode(output[i], tw, th, input_size=det.size, conf_threshold=det.conf_threshold,
+                           ratio=ratio, pad=pad)
+                parts.append((d, x, y))
+            self._timers["preprocess"].observe(t1 - t0)
+            self._timers["infer"].observe(t2 - t1)
+            self._timers["decode"].observe(time.perf_counter() - t2)
+        else:
+            for x, y, tw, th in self.tiles:
+                det.preprocess(frame[y:y + th, x:x + tw])
+                parts.append((det.decode(det.infer()), x, y))
+
+        t0 = time.perf_counter()
+        parts = [(d, x, y) for d, x, y in parts if len(d.boxes)]
+        if not parts:
+            return empty_detections()
+        boxes = np.concatenate([d.boxes + np.float32([x, y, x, y]) for d, x, y in parts])
+        scores = np.concatenate([d.scores for d, _, _ in parts])
+        class_ids = np.concatenate([d.class_ids for d, _, _ in parts])
+        keep = nms(boxes, scores, class_ids, det.iou_threshold)
+        self._timers["nms"].observe(time.perf_counter() - t0)
+        DETECTIONS.inc(len(keep))
+        return Detections(boxes[keep], scores[keep], class_ids[keep])
+
+    def detect(self, frame):
+        h, w = frame.shape[:2]
+        if self._frame_wh != (w, h):
+            self._layout(w, h)
+        if self.mode == "full":
+            return self.detector.detect(frame)
+        if self.mode == "tiles":
+            return self._in_workspace(self._tiles(frame))
+        x0, y0, x1, y1 = self.rect
+        dets = self.detector.detect(frame[y0:y1, x0:x1])
+        boxes = dets.boxes + np.float32([x0, y0, x0, y0])
+        return self._in_workspace(Detections(boxes, dets.scores, dets.class_ids))
+
+    def draw(self, frame, color=(255, 128, 0)):
+        """Outline the workspace (and the tiles in tiles mode)."""
+        if self._frame_wh is None:
+            return frame
+        cv2.polylines(frame, [self.polygon], True, color, 1)
+        if self.mode == "tiles":
+            for x, y, tw, th in self.tiles:
+                cv2.rectangle(frame, (x, y), (x + tw - 1, y + th - 1), (128, 128, 128), 1)
+        return frame
+
+
+# ---- benchmark ----
+def label_path(image_path):
+    """YOLO label next to the image, or in the sibling labels/ dir of an images/ dir"""
+    base = os.path.splitext(image_path)[0] + ".txt"
+    if os.path.exists(base):
+        return base
+    parts = base.split(os.sep)
+    if "images" in parts:
+        parts[len(parts) - 1 - parts[::-1].index("images")] = "labels"
+    return os.sep.join(parts)
+
+
+def read_yolo_labels(path, w, h):
+    if not os.path.exists(path):
+        return np.zeros((0, 4), dtype=np.float32)
+    rows = np.loadtxt(path, ndmin=2)
+    if rows.size == 0:
+        return np.zeros((0, 4), dtype=np.float32)
+    cx, cy, bw, bh = rows[:, 1] * w, rows[:, 2] * h, rows[:, 3] * w, rows[:, 4] * h
+    return np.stack([cx - bw / 2, cy - bh / 2, cx + bw / 2, cy + bh / 2], axis=1).astype(np.float32)
+
+
+def read_samples(uri, limit):
+    """(frame, ground-truth xyxy boxes or None) pairs, decoded up front"""
+    from frame_source import ImageDirSource, open_source
+
+    source = open_source(uri, rate="max", loop=False)
+    samples = []
+    if isinstance(source, ImageDirSource):
+        for path in source.paths[:limit]:
+            frame = cv2.imread(path)
+            if frame is not None:
+                gt = read_yolo_labels(label_path(path), frame.shape[1], frame.shape[0])
+                samples.append((frame, gt))
+    else:
+        while len(samples) < limit:
+            ok, frame = source.read()
+            if not ok:
+                break
+            gt = getattr(source, "last_boxes", None)
+            samples.append((frame, None if gt is None else gt.copy()))
+    source.release()
+    return samples
+
+
+def recall(samples, results, mask, iou_thr=0.5):
+    """Recall of the ground-truth boxes whose centre lies in the workspace mask (any class)."""
+    from quantize_model import agreement
+
+    found = total = 0
+    for (_, gt), dets in zip(samples, results):
+        if gt is None:
+            return None
+        if len(gt):
+            cx = np.clip(((gt[:, 0] + gt[:, 2]) / 2).astype(int), 0, mask.shape[1] - 1)
+            cy = np.clip(((gt[:, 1] + gt[:, 3]) / 2).astype(int), 0, mask.shape[0] - 1)
+            gt = gt[mask[cy, cx] > 0]
+        matched, n_gt, _ = agreement((gt, np.zeros(len(gt), dtype=np.int64)),
+                                     (dets.boxes, np.zeros(len(dets.boxes), dtype=np.int64)), iou_thr)
+        found, total = found + matched, total + n_gt
+    return found / total if total else None
+
+
+def bench(args):
+    from yolo_detector import YoloDetector
+
+    samples = read_samples(args.source, args.frames)
+    if not samples:
+        raise RuntimeError(f"No frames from {args.source}")
+    h, w = samples[0][0].shape[:2]
+    workspace = Workspace.load(args.workspace)
+    if workspace is None:
+        print("[WARN] No workspace.json / arm_calibration.json; using the centre 60% of the frame")
+        workspace = Workspace([[0.2 * w, 0.2 * h], [0.8 * w, 0.2 * h], [0.8 * w, 0.8 * h], [0.2 * w, 0.8 * h]],
+                              (w, h))
+
+    with contextlib.redirect_stdout(sys.stderr):
+        full = YoloDetector(args.model, args.size, args.conf)
+        tiled = YoloDetector(args.tile_model, args.tile_size, args.conf) if args.tile_model else None
+    runs = [("full", RoiDetector(full, workspace, "full")), ("crop", RoiDetector(full, workspace, "crop"))]
+    if tiled is not None:
+        runs.append(("tiles", RoiDetector(tiled, workspace, "tiles", overlap=args.overlap)))
+
+    rows = []
+    for name, roi in runs:
+        with contextlib.redirect_stdout(sys.stderr):
+            for frame, _ in samples[:args.warmup]:
+                roi.detect(frame)
+        results, times = [], []
+        for frame, _ in samples:
+            t0 = time.perf_counter()
+            results.append(roi.detect(frame))
+            times.append(time.perf_counter() - t0)
+        ms = np.array(times) * 1000.0
+        rows.append({
+            "mode": name,
+            "tiles": len(roi.tiles) if name == "tiles" else 1,
+            "p50_ms": float(np.median(ms)),
+            "p95_ms": float(np.percentile(ms, 95)),
+            "fps": len(ms) / (ms.sum() / 1000.0),
+            "recall": recall(samples, results, roi.mask, args.iou),
+            "detections": int(sum(len(d.boxes) for d in results)),
+        })
+
+    print(f"[INFO] {len(samples)} frames {w}x{h}, workspace rect {runs[1][1].rect}")
+    print(f"{'mode':<6} {'tiles':>5} {'p50 ms':>8} {'p95 ms':>8} {'fps':>7} {'recall':>7} {'dets':>6}")
+    for r in rows:
+        rec = f"{r['recall']:.3f}" if r["recall"] is not None else "n/a"
+        print(f"{r['mode']:<6} {r['tiles']:>5} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} "
+              f"{r['fps']:>7.1f} {rec:>7} {r['detections']:>6}")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(rows, f, indent=2)
+        print("[INFO] Saved", args.out)
+
+
+def main():
+    from frame_source import add_source_args
+
+    parser = argparse.ArgumentParser(description="Workspace ROI / tiled inference")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("set", help="write a workspace polygon")
+    p.add_argument("--polygon", required=True, help='pixel points "u,v u,v u,v ..."')
+    p.add_argument("--w", type=int, default=640)
+    p.add_argument("--h", type=int, default=480)
+    p.add_argument("--out", default=DEFAULT_PATH)
+
+    p = sub.add_parser("from-calibration", help="workspace = reachable area of arm_calibration.json")
+    p.add_argument("--calibration", default="arm_calibration.json")
+    p.add_argument("--out", default=DEFAULT_PATH)
+
+    p = sub.add_parser("bench", help="full frame vs crop vs tiles: latency and recall")
+    add_source_args(p, default="synthetic")
+    p.add_argument("--model", default="best.onnx")
+    p.add_argument("--size", type=int, default=640)
+    p.add_argument("--tile-model", default="", help="model for tiles mode, e.g. a 320 dynamic-batch export")
+    p.add_argument("--tile-size", type=int, default=320)
+    p.add_argument("--overlap", type=float, default=0.2)
+    p.add_argument("--workspace", default=DEFAULT_PATH)
+    p.add_argument("--frames", type=int, default=200)
+    p.add_argument("--warmup", type=int, default=5)
+    p.add_argument("--conf", type=float, default=0.3)
+    p.add_argument("--iou", type=float, default=0.5, help="IoU for a ground-truth match")
+    p.add_argument("--out", default="")
+    args = parser.parse_args()
+
+    if args.command == "set":
+        pts = [[float(v) for v in pt.split(",")] for pt in args.polygon.split()]
+        Workspace(pts, (args.w, args.h)).save(args.out)
+        print("[INFO] Saved", args.out)
+    elif args.command == "from-calibration":
+        ws = Workspace.load(path="", calibration=args.calibration)
+        if ws is None:
+            raise SystemExit(f"{args.calibration} not found; run arm_kinematics.py calibrate first")
+        ws.save(args.out)
+        print(f"[INFO] {len(ws.polygon)}-point workspace at {ws.frame_size}, saved {args.out}")
+    else:
+        bench(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+servo_timing.py
+Per-servo velocity model giving the shortest safe wait after each arm move.
+
+A move from `start` to `target` angles (base, s1, s2, claw) is done when the
+slowest moving servo arrives:
+    t = max over moving servos of |target - start| / speed + settle
+and the dwell before the next command adds a safety margin on top. Speeds
+(deg/s) and settle times (s) are per servo and can be fitted from JSON-line
+timing logs. arduino_sim.py and ArmScheduler(log=...) both write them; each
+line holds "start", "target" and a duration field. On firmware that
+replies when a move has finished, reply_s is the measured move time; a log
+where most moves beat MAX_SPEED came from firmware that replies on receipt
+and is refused rather than fitted.
+
+A pick program repeats the same few moves, which can't separate speed from
+settle time; --record runs a sweep of single-servo moves with varied
+amplitudes on a port first and fits from that.
+
+Usage:
+    model = ServoTimingModel.load("servo_timing.json")   # defaults if missing
+    model.dwell((0, 20, 20, 60), (90, 120, 60, 60))      # -> seconds
+    python servo_timing.py --log arm.jsonl --field reply_s --out servo_timing.json
+    python servo_timing.py --record /dev/ttyACM0 --log sweep.jsonl
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+
+SERVOS = ("base", "s1", "s2", "claw")
+HOME_ANGLES = (0, 20, 20, 60)           # pose the firmware's HOME command drives to
+DEFAULT_SPEEDS = (180.0, 120.0, 120.0, 300.0)
+DEFAULT_SETTLE = (0.08, 0.08, 0.08, 0.05)
+DEFAULT_PATH = "servo_timing.json"
+MAX_SPEED = 1000.0                      # deg/s; no hobby servo gets near this, so faster "moves" weren't timed
+
+
+class ServoTimingModel:
+    def __init__(self, speeds=DEFAULT_SPEEDS, settle=DEFAULT_SETTLE, margin=0.1):
+        self.speeds = np.asarray(speeds, dtype=np.float64)
+        self.settle = np.asarray(settle, dtype=np.float64)
+        self.margin = margin  # fraction added on top of the predicted move time
+
+    def servo_times(self, start, target):
+        """Per-servo arrival time; 0 for servos that don't move."""
+        delta = np.abs(np.asarray(target, dtype=np.float64) - np.asarray(start, dtype=np.float64))
+        return np.where(delta > 0, delta / self.speeds + self.settle, 0.0)
+
+    def move_time(self, start, target):
+        """
+        Predicted seconds until every servo is at target. An unknown start
+        (None) assumes the worst case, a full 180 degree sweep.
+        """
+        if start is None:
+            return float(np.max(180.0 / self.speeds + self.settle))
+        return float(self.servo_times(start, target).max())
+
+    def dwell(self, start, target):
+        return self.move_time(start, target) * (1.0 + self.margin)
+
+    # ---- persistence ----
+    def to_dict(self):
+        return {
+            "speeds_deg_s": dict(zip(SERVOS, self.speeds.round(2).tolist())),
+            "settle_s": dict(zip(SERVOS, self.settle.round(4).tolist())),
+            "margin": self.margin,
+        }
+
+    def save(self, path=DEFAULT_PATH):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @classmethod
+    def load(cls, path=DEFAULT_PATH):
+        """Fitted parameters from path, or the defaults if it doesn't exist."""
+        if not os.path.exists(path):
+            return cls()
+        with open(path) as f:
+            d = json.load(f)
+        return cls([d["speeds_deg_s"][s] for s in SERVOS],
+                   [d["settle_s"][s] for s in SERVOS], d.get("margin", 0.1))
+
+    # ---- calibration ----
+    @classmethod
+    def fit(cls, records, field="reply_s", iterations=10, margin=0.1):
+        """
+        Fit speeds and settle times to logged moves.
+
+        Each sample is attributed to the servo the current model says
+        arrives last, then that servo gets a least-squares line
+        t = |delta| / speed + settle; repeat until the attribution is stable.
+        Servos that never dominate a move keep their default parameters.
+        """
+        starts, targets, times = [], [], []
+        for r in records:
+            if r.get("start") is None or r.get("target") is None or r.get(field) is None:
+                continue
+            starts.append(r["start"])
+            targets.append(r["target"])
+            times.append(r[field])
+        if not times:
+            raise ValueError(f"No records with start, target and {field!r}")
+        delta = np.abs(np.array(targets, dtype=np.float64) - np.array(starts, dtype=np.float64))
+        times = np.array(times, dtype=np.float64)
+        moving = delta.max(axis=1) > 0
+        delta, times = delta[moving], times[moving]
+
+        model = cls(margin=margin)
+        owner = None
+        for _ in range(iterations):
+            pred = np.where(delta > 0, delta / model.speeds + model.settle, 0.0)
+            new_owner = pred.argmax(axis=1)
+            if owner is not None and np.array_equal(owner, new_owner):
+                break
+            owner = new_owner
+            for k in range(len(SERVOS)):
+                d, t = delta[owner == k, k], times[owner == k]
+                if len(d) < 2 or np.ptp(d) < 1.0:
+                    continue  # not enough spread to separate speed from settle
+                slope, intercept = np.polyfit(d, t, 1)
+                if slope > 0:
+                    model.speeds[k] = 1.0 / slope
+                    model.settle[k] = max(intercept, 0.0)
+        return model
+
+
+def too_fast(records, field="reply_s", max_speed=MAX_SPEED):
+    """
+    Records whose duration is shorter than the biggest angle change could take
+    at max_speed. Firmware that replies on receipt instead of on arrival logs
+    nothing but these.
+    """
+    fast = []
+    for r in records:
+        if r.get("start") is None or r.get("target") is None or r.get(field) is None:
+            continue
+        delta = np.abs(np.asarray(r["target"], dtype=np.float64) - np.asarray(r["start"], dtype=np.float64)).max()
+        if delta > 0 and r[field] < delta / max_speed:
+            fast.append(r)
+    return fast
+
+
+def calibration_moves(n=48, seed=0, home=HOME_ANGLES, limits=(0, 180)):
+    """Single-servo moves of varied amplitude, cycling through the servos."""
+    rng = np.random.default_rng(seed)
+    pose = list(home)
+    moves = []
+    for i in range(n):
+        k = i % len(SERVOS)
+        pose[k] = int(rng.integers(limits[0], limits[1] + 1))
+        moves.append(tuple(pose))
+    return moves
+
+
+def record(port, log_path, n=48):
+    """Drive the calibration sweep through ArmScheduler, logging every step."""
+    import serial
+    from arm_scheduler import ArmScheduler, home, move
+
+    with open(log_path, "a") as log:
+        arm = ArmScheduler(serial.Serial(port, 115200), log=log).start()
+        # dwell=0: each step is paced by the reply alone, which is what we're measuring
+        steps = [home(dwell=0.0)] + [move(*t, timeout=5.0, dwell=0.0) for t in calibration_moves(n)]
+        arm.submit(steps, name="calibration").result()
+        arm.stop()
+
+
+def load_log(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit servo speeds / settle times from timing logs")
+    parser.add_argument("--log", required=True, help="JSON-lines log (arduino_sim.py or ArmScheduler)")
+    parser.add_argument("--record", default="", help="serial port: run the calibration sweep into --log first")
+    parser.add_argument("--moves", type=int, default=48, help="moves in the calibration sweep")
+    parser.add_argument("--field", default="reply_s",
+                        help="duration field: reply_s (replies when done) or move_s (simulator truth)")
+    parser.add_argument("--margin", type=float, default=0.1)
+    parser.add_argument("--out", default=DEFAULT_PATH)
+    args = parser.parse_args()
+
+    if args.record:
+        print(f"[INFO] Recording {args.moves} calibration moves on {args.record} -> {args.log}")
+        record(args.record, args.log, args.moves)
+    records = load_log(args.log)
+    model = ServoTimingModel.fit(records, args.field, margin=args.margin)
+
+    used = [r for r in records if r.get("start") and r.get("target") and r.get(args.field) is not None]
+    fast = too_fast(used, args.field)
+    if len(fast) * 2 > len(used):
+        print(f"[ERROR] {len(fast)}/{len(used)} moves took less time than any servo needs ({MAX_SPEED:.0f} deg/s); "
+              f"does the firmware reply before the move finishes? Not saving {args.out}")
+        exit(1)
+    if fast:
+        print(f"[WARN] {len(fast)}/{len(used)} moves were faster than {MAX_SPEED:.0f} deg/s; "
+              f"those {args.field} values don't time the move")
+
+    pred = np.array([model.move_time(r["start"], r["target"]) for r in used])
+    meas = np.array([r[args.field] for r in used])
+    err = (pred - meas) * 1000.0
+    print(f"[INFO] {len(used)} moves, residual mean={err.mean():.1f}ms "
+          f"abs p95={np.percentile(np.abs(err), 95):.1f}ms")
+    for name, speed, settle in zip(SERVOS, model.speeds, model.settle):
+        print(f"  {name:<5} speed={speed:7.1f} deg/s  settle={settle * 1000:6.1f} ms")
+    print(f"[INFO] total dwell with margin: {sum(model.dwell(r['start'], r['target']) for r in used):.2f}s "
+          f"for {meas.sum():.2f}s of measured motion")
+    model.save(args.out)
+    print("[INFO] Saved", args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+tracker.py
+SORT-style multi-object tracker: constant-velocity Kalman filter per box and
+greedy IoU matching.
+
+Every track keeps a stable id and its recent detection scores, so "confirmed"
+is decided per object. The old global confirm counter reset whenever a
+second pencil showed up. Between detector runs predict() advances every
+track, which lets the expensive detector run on every Nth frame while
+overlays and pick targets still move at camera rate.
+
+State per track is [cx, cy, s, r, vcx, vcy, vs] (centre, area, aspect ratio
+and their velocities), as in SORT. Matching is greedy on IoU, highest pair
+first, like quantize_model.agreement(). With the handful of boxes we see
+that gives the same assignment as the Hungarian algorithm.
+
+Usage:
+    tracker = Tracker()
+    tracks = tracker.update(dets) if frame_idx % N == 0 else tracker.predict()
+    for t in tracks: t.track_id, t.box, t.score, t.confirmed(0.6, 3)
+"""
+
+import collections
+import itertools
+
+import numpy as np
+
+from nms import box_iou_matrix
+
+# Kalman model (per frame step)
+_F = np.eye(7)
+_F[0, 4] = _F[1, 5] = _F[2, 6] = 1.0
+_H = np.eye(4, 7)
+_Q = np.diag([1.0, 1.0, 1.0, 1e-4, 1e-2, 1e-2, 1e-4])
+_R = np.diag([1.0, 1.0, 10.0, 1e-2])
+
+
+def _xyxy_to_z(box):
+    w, h = box[2] - box[0], box[3] - box[1]
+    return np.array([box[0] + w / 2.0, box[1] + h / 2.0, w * h, w / max(h, 1e-6)])
+
+
+def _x_to_xyxy(x):
+    s, r = max(x[2], 1e-6), max(x[3], 1e-6)
+    w = np.sqrt(s * r)
+    h = s / w
+    return np.array([x[0] - w / 2.0, x[1] - h / 2.0, x[0] + w / 2.0, x[1] + h / 2.0], dtype=np.float32)
+
+
+class Track:
+    def __init__(self, track_id, box, score, class_id, history):
+        self.track_id = track_id
+        self.class_id = int(class_id)
+        self.x = np.zeros(7)
+        self.x[:4] = _xyxy_to_z(box)
+        self.P = np.diag([10.0, 10.0, 10.0, 10.0, 1e4, 1e4, 1e4])
+        self.scores = collections.deque([float(score)], maxlen=history)
+        self.hits = 1            # detections matched so far
+        self.age = 0             # frames since creation
+        self.misses = 0          # detector runs in a row without a match
+        self.since_update = 0    # frames since the last matched detection
+        self.box = np.asarray(box, dtype=np.float32)
+
+    @property
+    def score(self):
+        return self.scores[-1]
+
+    @property
+    def mean_score(self):
+        return sum(self.scores) / len(self.scores)
+
+    def confirmed(self, min_score=0.0, min_hits=3):
+        """The last min_hits detections all matched this track with score > min_score."""
+        return (self.hits >= min_hits and self.misses == 0
+                and all(s > min_score for s in itertools.islice(reversed(self.scores), min_hits)))
+
+    def center_size(self):
+        """(cx, cy, w, h) as ints, the form pick_sequence() takes"""
+        x1, y1, x2, y2 = self.box
+        return int((x1 + x2) / 2), int((y1 + y2) / 2), int(x2 - x1), int(y2 - y1)
+
+    def predict(self):
+        if self.x[2] + self.x[6] <= 0:
+            self.x[6] = 0.0  # don't let the area go negative
+        self.x = _F @ self.x
+        self.P = _F @ self.P @ _F.T + _Q
+        self.age += 1
+        self.since_update += 1
+        self.box = _x_to_xyxy(self.x)
+
+    def update(self, box, score):
+        y = _xyxy_to_z(box) - _H @ self.x
+        S = _H @ self.P @ _H.T + _R
+        K = self.P @ _H.T @ np.linalg.inv(S)
+        self.x = self.x + K @ y
+        self.P = (np.eye(7) - K @ _H) @ self.P
+        self.scores.append(float(score))
+        self.hits += 1
+        self.misses = 0
+        self.since_update = 0
+        self.box = _x_to_xyxy(self.x)
+
+
+class Tracker:
+    """
+    iou_threshold : minimum IoU between a predicted track box and a detection to match
+    max_misses    : detector runs a track may go unmatched before it is dropped
+    history       : detection scores kept per track
+    """
+
+    def __init__(self, iou_threshold=0.3, max_misses=2, history=10):
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.history = history
+        self.tracks = []
+        self._ids = itertools.count(1)
+
+    def predict(self):
+        """Advance every track one frame without a detector result."""
+        for t in self.tracks:
+            t.predict()
+        return self.tracks
+
+    def update(self, dets):
+        """Advance one frame and fold in a Detections result; returns the live tracks."""
+        self.predict()
+        boxes, scores, class_ids = dets.boxes, dets.scores, dets.class_ids
+        unmatched_dets = set(range(len(boxes)))
+        matched_tracks = set()
+
+        if self.tracks and len(boxes):
+            iou = box_iou_matrix(np.array([t.box for t in self.tracks]), boxes)
+            iou[np.array([t.class_id for t in self.tracks])[:, None] != class_ids[None, :]] = 0
+            while True:
+                i, j = np.unravel_index(np.argmax(iou), iou.shape)
+                if iou[i, j] < self.iou_threshold:
+                    break
+                self.tracks[i].update(boxes[j], scores[j])
+                matched_tracks.add(i)
+                unmatched_dets.discard(j)
+                iou[i, :] = 0
+                iou[:, j] = 0
+
+        for i, t in enumerate(self.tracks):
+            if i not in matched_tracks:
+                t.misses += 1
+        self.tracks = [t for t in self.tracks if t.misses <= self.max_misses]
+        for j in sorted(unmatched_dets):
+            self.tracks.append(Track(next(self._ids), boxes[j], scores[j], class_ids[j], self.history))
+        return self.tracks
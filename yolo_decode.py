@@ -0,0 +1,146 @@
+"""
+yolo_decode.py
+Vectorized decoder for the raw YOLOv8 ONNX output.
+
+The exported model returns a single (1, 4+C, N) tensor: four rows of box
+centre/size followed by one score row per class, for N candidates (8400 at
+640x640). decode() thresholds, converts xywh -> xyxy, rescales to the camera
+frame and picks the class entirely with NumPy array ops, so the cost no
+longer grows with a Python loop over every candidate.
+
+Models prepared with export_nms_model.py already end in decode + NMS and
+output at most max_det final rows (K, 6): x1, y1, x2, y2, score, class in
+model-input pixels. decode_final() only maps those back to the frame.
+is_final_output() tells the two layouts apart once per session, by the
+output name, so nothing is re-guessed per frame. The graph's own conf / iou
+are fixed at export: decode_final() can still raise the confidence cut, and
+final_thresholds() warns when a caller asks for a lower conf or another iou.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+Detections = namedtuple("Detections", ["boxes", "scores", "class_ids"])
+
+FINAL_OUTPUT = "detections"  # output name export_nms_model.py gives the (K, 6) tensor
+
+
+def empty_detections():
+    return Detections(np.zeros((0, 4), dtype=np.float32),
+                      np.zeros(0, dtype=np.float32),
+                      np.zeros(0, dtype=np.int64))
+
+
+def decode(output, frame_w, frame_h, input_size=640, conf_threshold=0.3,
+           ratio=None, pad=(0.0, 0.0), has_objectness=False):
+    """
+    output     : raw model output, (1, 4+C, N) or (4+C, N); (N, 4+C) is also accepted
+    frame_w/h  : size of the camera frame the boxes are mapped back to
+    ratio, pad : letterbox scale and (x, y) padding used by preprocessing;
+                 when ratio is None the frame was stretched to input_size
+    returns Detections(boxes [M,4] xyxy float32, scores [M], class_ids [M])
+    """
+    pred = np.asarray(output)
+    if pred.ndim == 3:
+        pred = pred[0]
+    if pred.shape[0] > pred.shape[1]:
+        pred = pred.T  # (N, 4+C) exports -> (4+C, N)
+
+    first_cls = 5 if has_objectness else 4
+    n_cls = pred.shape[0] - first_cls
+    if n_cls < 1:
+        raise ValueError(f"Unexpected YOLO output shape {np.shape(output)}")
+
+    # Threshold on the best class score before touching box rows
+    if n_cls == 1:
+        scores = pred[first_cls]
+    else:
+        scores = pred[first_cls:].max(axis=0)
+    if has_objectness:
+        scores = scores * pred[4]
+
+    mask = scores > conf_threshold
+    if not mask.any():
+        return empty_detections()
+
+    cand = pred[:, mask]
+    scores = scores[mask].astype(np.float32)
+    if n_cls == 1:
+        class_ids = np.zeros(len(scores), dtype=np.int64)
+    else:
+        class_ids = cand[first_cls:].argmax(axis=0)
+
+    xc, yc, w, h = cand[0], cand[1], cand[2], cand[3]
+
+    # Some exports emit normalized coordinates instead of input pixels
+    if cand[:4].max() <= 1.0 + 1e-6:
+        xc, yc, w, h = xc * input_size, yc * input_size, w * input_size, h * input_size
+
+    if ratio is None:
+        sx, sy = frame_w / input_size, frame_h / input_size
+    else:
+        sx = sy = 1.0 / ratio
+
+    boxes = np.empty((len(scores), 4), dtype=np.float32)
+    boxes[:, 0] = (xc - w / 2.0 - pad[0]) * sx
+    boxes[:, 1] = (yc - h / 2.0 - pad[1]) * sy
+    boxes[:, 2] = (xc + w / 2.0 - pad[0]) * sx
+    boxes[:, 3] = (yc + h / 2.0 - pad[1]) * sy
+    np.clip(boxes[:, 0::2], 0, frame_w - 1, out=boxes[:, 0::2])
+    np.clip(boxes[:, 1::2], 0, frame_h - 1, out=boxes[:, 1::2])
+
+    return Detections(boxes, scores, class_ids)
+
+
+def is_final_output(sess):
+    """True for sessions whose output is already decoded and NMS-filtered (export_nms_model.py)"""
+    out = sess.get_outputs()[0]
+    return out.name == FINAL_OUTPUT and len(out.shape) == 2
+
+
+def final_thresholds(sess, conf_threshold=None, iou_threshold=None):
+    """
+    Export-time metadata of a final-output session as a dict (conf_threshold,
+    iou_threshold, max_det, ...). Prints a warning when the runtime thresholds
+    can't be honoured: a conf below the exported one, or a different iou.
+    """
+    meta = {}
+    for key, value in sess.get_modelmeta().custom_metadata_map.items():
+        try:
+            meta[key] = float(value)
+        except ValueError:
+            meta[key] = value
+    exported_conf, exported_iou = meta.get("conf_threshold"), meta.get("iou_threshold")
+    if conf_threshold is not None and exported_conf is not None and conf_threshold < exported_conf - 1e-6:
+        print(f"[WARN] conf {conf_threshold} is below the {exported_conf} baked into the model; "
+              f"boxes under {exported_conf} are already gone (re-export with --conf {conf_threshold})")
+    if iou_threshold is not None and exported_iou is not None and abs(iou_threshold - exported_iou) > 1e-6:
+        print(f"[WARN] NMS iou {iou_threshold} is ignored; the model runs NMS at iou {exported_iou} "
+              f"(re-export with --iou {iou_threshold})")
+    return meta
+
+
+def decode_final(output, frame_w, frame_h, input_size=640, conf_threshold=0.0, ratio=None, pad=(0.0, 0.0)):
+    """
+    output         : (K, 6) rows of x1, y1, x2, y2, score, class in input pixels,
+                     best first (export_nms_model.py); NMS was applied in the graph
+    conf_threshold : rows scoring below it are dropped; only useful above the
+                     exported conf, which the graph already applied
+    """
+    rows = np.asarray(output, dtype=np.float32)
+    if conf_threshold > 0 and len(rows):
+        rows = rows[rows[:, 4] >= conf_threshold]
+    if not len(rows):
+        return empty_detections()
+    if ratio is None:
+        sx, sy = frame_w / input_size, frame_h / input_size
+    else:
+        sx = sy = 1.0 / ratio
+
+    boxes = np.empty((len(rows), 4), dtype=np.float32)
+    boxes[:, 0::2] = (rows[:, 0:4:2] - pad[0]) * sx
+    boxes[:, 1::2] = (rows[:, 1:4:2] - pad[1]) * sy
+    np.clip(boxes[:, 0::2], 0, frame_w - 1, out=boxes[:, 0::2])
+    np.clip(boxes[:, 1::2], 0, frame_h - 1, out=boxes[:, 1::2])
+    return Detections(boxes, rows[:, 4].copy(), rows[:, 5].astype(np.int64))
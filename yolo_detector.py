@@ -0,0 +1,93 @@
+"""
+yolo_detector.py
+The per-frame YOLO stages shared by the ONNX streamers and the benchmarks.
+
+YoloDetector bundles the tuned session (ort_session), the allocation-free
+preprocessing + IOBinding (preprocess), the vectorized decoder (yolo_decode)
+and class-aware NMS (nms). A model prepared by export_nms_model.py does
+decode + NMS inside ORT; decode() then only rescales its final rows (and
+drops those under conf_threshold) and nms() passes them through. The stages
+stay separate methods so the replay benchmark can time each one on exactly
+the code the robot runs. Each stage also records its latency in
+metrics.STAGE_SECONDS.
+
+Usage:
+    det = YoloDetector("best.onnx")
+    dets = det.detect(frame)               # or preprocess / infer / decode / nms
+    draw_detections(frame, dets, "Pencil")
+"""
+
+import time
+
+import cv2
+
+from metrics import DETECTIONS, STAGE_SECONDS
+from nms import nms
+from ort_session import create_session
+from preprocess import BoundSession, Preprocessor
+from yolo_decode import Detections, decode, decode_final, final_thresholds, is_final_output
+
+
+class YoloDetector:
+    def __init__(self, model_path, size=640, conf_threshold=0.3, iou_threshold=0.45,
+                 profile=None, session=None):
+        self.size = size
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+        self.sess = session or create_session(model_path, profile)
+        self.pre = Preprocessor(size)
+        self.runner = BoundSession(self.sess, self.pre.input)
+        self.final = is_final_output(self.sess)  # decode + NMS already in the graph
+        if self.final:
+            final_thresholds(self.sess, conf_threshold, iou_threshold)
+        self._frame_wh = (size, size)
+        self._ratio, self._pad = 1.0, (0, 0)
+        self._timers = {s: STAGE_SECONDS.labels(s) for s in ("preprocess", "infer", "decode", "nms")}
+
+    def preprocess(self, frame):
+        t0 = time.perf_counter()
+        h, w = frame.shape[:2]
+        self._frame_wh = (w, h)
+        self._ratio, self._pad = self.pre.fill(frame)
+        self._timers["preprocess"].observe(time.perf_counter() - t0)
+
+    def infer(self):
+        """Raw model output; a reused buffer, valid until the next infer()"""
+        t0 = time.perf_counter()
+        output = self.runner.run()
+        self._timers["infer"].observe(time.perf_counter() - t0)
+        return output
+
+    def decode(self, output):
+        t0 = time.perf_counter()
+        w, h = self._frame_wh
+        if self.final:
+            dets = decode_final(output, w, h, input_size=self.size, conf_threshold=self.conf_threshold,
+                                ratio=self._ratio, pad=self._pad)
+        else:
+            dets = decode(output, w, h, input_size=self.size, conf_threshold=self.conf_threshold,
+                          ratio=self._ratio, pad=self._pad)
+        self._timers["decode"].observe(time.perf_counter() - t0)
+        return dets
+
+    def nms(self, dets):
+        t0 = time.perf_counter()
+        if not self.final:
+            keep = nms(dets.boxes, dets.scores, dets.class_ids, self.iou_threshold)
+            dets = Detections(dets.boxes[keep], dets.scores[keep], dets.class_ids[keep])
+        self._timers["nms"].observe(time.perf_counter() - t0)
+        DETECTIONS.inc(len(dets.scores))
+        return dets
+
+    def detect(self, frame):
+        self.preprocess(frame)
+        return self.nms(self.decode(self.infer()))
+
+
+def draw_detections(frame, dets, label="Pencil", color=(0, 255, 0)):
+    with STAGE_SECONDS.labels("draw").time():
+        for (x1, y1, x2, y2), conf in zip(dets.boxes.astype(int), dets.scores):
+            cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+            cv2.putText(frame, f"{label} {conf:.2f}", (x1, max(y1 - 5, 0)),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
+    return frame